@@ -26,7 +26,7 @@
 import warnings
 import uuid
 from datetime import datetime
-from typing import List
+from typing import Iterator, List
 
 from cerebralcortex.core.config_manager.config import Configuration
 from cerebralcortex.core.data_manager.object.data import ObjectData
@@ -37,7 +37,7 @@ from cerebralcortex.core.datatypes.datastream import DataStream
 from cerebralcortex.core.file_manager.file_io import FileIO
 from cerebralcortex.core.log_manager.logging import CCLogging
 from cerebralcortex.core.log_manager.log_handler import LogTypes
-from cerebralcortex.core.data_manager.raw.stream_handler import DataSet
+from cerebralcortex.core.data_manager.raw.stream_handler import DataSet, DEFAULT_CHUNK_SIZE
 from cerebralcortex.core.data_manager.raw.data import RawData
 from cerebralcortex.core.messaging_manager.messaging_queue import MessagingQueue
 
@@ -81,40 +81,82 @@ class CerebralCortex:
         """
         self.RawData.save_stream(datastream=datastream, localtime=localtime,ingestInfluxDB=ingestInfluxDB)
 
+    def flush_streams(self, stream_id: uuid = None) -> bool:
+        """
+        Writes save_stream calls waiting in the write buffer (day_files: write_buffer_size)
+        :param stream_id: flush this stream only, all streams if None
+        :return: False if a stream could not be written, it stays in the write buffer
+        :rtype: bool
+        """
+        return self.RawData.flush(stream_id)
+
     def get_stream(self, stream_id: uuid, user_id: uuid=None, day:str=None, start_time: datetime = None, end_time: datetime = None, localtime:bool=False,
-                   data_type=DataSet.COMPLETE) -> DataStream:
+                   data_type=DataSet.COMPLETE, columnar: bool = False) -> DataStream:
         """
 
         :param stream_id:
-        :param day:
+        :param day: day (YYYYMMDD) or list of days, all days from start_time to end_time if None. Days are read in parallel
         :param start_time:
         :param end_time:
         :param data_type:
+        :param columnar: return a ColumnarDataStream, data is stored in NumPy arrays and only converted to DataPoints on access
         :return:
         """
         warnings.warn("user_id is not a required parameter. This parameter will be removed in CerebralCortex version3.0.", PendingDeprecationWarning)
-        return self.RawData.get_stream(stream_id, user_id, day, start_time, end_time, localtime, data_type)
+        return self.RawData.get_stream(stream_id, user_id, day, start_time, end_time, localtime, data_type, columnar)
 
     def get_stream_days(self, stream_id: uuid) -> List:
         """
-        Returns a list of days (string format: YearMonthDay (e.g., 20171206) for a given stream-id
+        Returns a list of days (string format: YearMonthDay (e.g., 20171206) for a given stream-id. Only days with data
+        are returned if the stream-day manifest is used (day_files: manifest)
         :param stream_id:
         :param dd_stream_id:
         """
-        return self.SqlData.get_stream_days(stream_id)
+        return self.RawData.get_stream_days(stream_id)
+
+    def get_stream_day_manifest(self, stream_id: uuid) -> List[dict]:
+        """
+        Returns the stream-day manifest entries of a stream: day, file of the last write, number of rows, bytes, start
+        time of the first and last DataPoint and codec
+        :param stream_id:
+        :return: list of entries sorted on day, empty if the manifest is disabled
+        """
+        return self.RawData.day_manifest.get_entries(stream_id)
+
+    def index_stream_days(self, stream_id: uuid) -> int:
+        """
+        Add days of a stream written before the stream-day manifest was enabled to the manifest
+        :param stream_id:
+        :return: number of days with data
+        """
+        return self.RawData.index_stream_days(stream_id)
 
     def get_stream_by_name(self, stream_name: uuid, user_id: uuid=None, start_time: datetime = None, end_time: datetime = None, localtime:bool=False,
-                           data_type=DataSet.COMPLETE) -> DataStream:
+                           data_type=DataSet.COMPLETE, columnar: bool = False) -> DataStream:
         """
         Return stream data for all stream-ids related to a stream-name
         :param stream_name:
-        :param day:
+        :param user_id:
         :param start_time:
         :param end_time:
         :param data_type:
+        :param columnar: return a ColumnarDataStream, data is stored in NumPy arrays and only converted to DataPoints on access
         :return:
         """
-        return self.RawData.get_stream_by_name(stream_name, user_id, start_time, end_time, localtime, data_type)
+        return self.RawData.get_stream_by_name(stream_name, user_id, start_time, end_time, localtime, data_type, columnar)
+
+    def iter_stream(self, stream_id: uuid, start_time: datetime = None, end_time: datetime = None,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE, localtime: bool = False) -> Iterator[List[DataPoint]]:
+        """
+        Iterate data of a stream in chunks, memory usage does not grow with the length of the time range
+        :param stream_id:
+        :param start_time: first day of the stream if None
+        :param end_time: last day of the stream if None
+        :param chunk_size: maximum number of DataPoints per chunk
+        :param localtime: get data in participant's local time
+        :return: iterator of sorted lists of DataPoints
+        """
+        return self.RawData.iter_stream(stream_id, start_time, end_time, chunk_size, localtime)
 
     def get_stream_samples(self, stream_id, day, start_time=None, end_time=None) -> List[DataPoint]:
         """
@@ -365,6 +407,18 @@ class CerebralCortex:
         """
         return self.ObjectData.get_bucket_objects(bucket_name)
 
+    def iter_bucket_objects(self, bucket_name: str, prefix: str = None, page_size: int = 1000,
+                            stat: bool = False) -> Iterator[List[dict]]:
+        """
+        Iterate properties of the objects of a bucket page by page, objects are only stat'ed if stat is True
+        :param bucket_name:
+        :param prefix: only objects whose name starts with prefix
+        :param page_size: number of objects per page
+        :param stat: add all properties (e.g., content type and metadata) with one stat request per object
+        :return: iterator of lists of {stat1:str, stat2, str}
+        """
+        return self.ObjectData.iter_bucket_objects(bucket_name, prefix, page_size, stat)
+
     def get_object_stats(self, bucket_name: str, object_name: str) -> dict:
         """
         Returns properties (e.g., object type, last modified etc.) of an object stored in a specified bucket
@@ -383,6 +437,15 @@ class CerebralCortex:
         """
         return self.ObjectData.get_object(bucket_name, object_name)
 
+    def get_object_content(self, bucket_name: str, object_name: str) -> bytes:
+        """
+        Returns content of a stored object with a single GET request
+        :param bucket_name:
+        :param object_name:
+        :return: object content, None if the object or bucket does not exist
+        """
+        return self.ObjectData.get_object_content(bucket_name, object_name)
+
     def is_bucket(self, bucket_name: str) -> bool:
         """
 
@@ -27,6 +27,7 @@ from cerebralcortex.core.log_manager.log_handler import LogTypes
 from minio import Minio
 
 from cerebralcortex.core.data_manager.object.minio_handler import MinioHandler
+from cerebralcortex.core.data_manager.object.multipart_upload import DEFAULT_PART_SIZE, DEFAULT_TRANSFER_WORKERS
 
 
 class ObjectData(MinioHandler):
@@ -46,6 +47,9 @@ class ObjectData(MinioHandler):
         self.access_key = self.config["minio"]["access_key"]
         self.secret_key = self.config["minio"]["secret_key"]
         self.secure = self.config["minio"]["secure"]
+        # part size is configured in MB
+        self.part_size = int(float(self.config["minio"].get("part_size", DEFAULT_PART_SIZE / (1024 * 1024))) * 1024 * 1024)
+        self.transfer_workers = int(self.config["minio"].get("transfer_workers", DEFAULT_TRANSFER_WORKERS))
 
         if self.config["nosql_storage"]=="aws_s3":
             db_url = str(self.host)
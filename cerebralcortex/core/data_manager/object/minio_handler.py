@@ -23,15 +23,53 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-import json
 import os
-from typing import List
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List
 import traceback
 
 from minio.error import ResponseError
 
+from cerebralcortex.core.data_manager.object.multipart_upload import MultipartUpload, DEFAULT_PART_SIZE, \
+    DEFAULT_TRANSFER_WORKERS
+
+# buckets known to exist, per (host, bucket name). Buckets are not removed while CerebralCortex is running, so bucket
+# existence is only checked once per process
+EXISTING_BUCKETS = set()
+
+
+def get_error_code(error: Exception) -> str:
+    """
+    Returns the S3 error code (e.g., NoSuchKey) of a minio exception. Depending on the minio version, known errors are
+    raised as exception classes named after their code that may or may not wrap the ResponseError
+    :param error:
+    :return: error code, class name of the exception if it has no code
+    :rtype: str
+    """
+    return getattr(error, "code", None) or getattr(getattr(error, "response_error", None), "code", None) or \
+           type(error).__name__
+
+def object_to_dict(obj: object) -> dict:
+    """
+    Returns properties of a minio object (result of a list or stat request) as a dict
+    :param obj: minio Object
+    :return: {bucket_name: str, object_name: str, last_modified: str, etag: str, size: int, content_type: str,
+        is_dir: bool, metadata: dict}
+    :rtype: dict
+    """
+    last_modified = getattr(obj, "last_modified", None)
+    return {"bucket_name": obj.bucket_name, "object_name": obj.object_name,
+            "last_modified": None if last_modified is None else str(last_modified), "etag": getattr(obj, "etag", None),
+            "size": getattr(obj, "size", None), "content_type": getattr(obj, "content_type", None),
+            "is_dir": getattr(obj, "is_dir", False), "metadata": dict(getattr(obj, "metadata", None) or {})}
+
 
 class MinioHandler():
+    # size of the parts of multipart uploads and ranged downloads, in bytes
+    part_size = DEFAULT_PART_SIZE
+    # number of parts transferred in parallel per object
+    transfer_workers = DEFAULT_TRANSFER_WORKERS
 
     ###################################################################
     ################## GET DATA METHODS ###############################
@@ -57,28 +95,53 @@ class MinioHandler():
 
     def get_bucket_objects(self, bucket_name: str) -> dict:
         """
-        returns a list of all objects stored in the specified Minio bucket
+        returns a list of all objects stored in the specified Minio bucket. Properties are taken from the listing, use
+        iter_bucket_objects to iterate large buckets
         :param bucket_name:
-        :return:{object-name:{stat1:str, stat2, str}},  in case of an error [{"error": str}]
+        :return:{bucket-objects:[{stat1:str, stat2, str}]},  in case of an error {"error": str}
         :rtype: dict
         """
-        objects_in_bucket = {}
         try:
-            objects = self.minioClient.list_objects(bucket_name, recursive=True)
-            temp = []
-            bucket_objects = {}
-            for obj in objects:
-                object_stat = self.minioClient.stat_object(obj.bucket_name, obj.object_name)
-                object_stat = json.dumps(object_stat, default=lambda o: o.__dict__)
-                object_stat = json.loads(object_stat)
-                temp.append(object_stat)
-                objects_in_bucket[obj.object_name] = object_stat
-                object_stat.pop('metadata', None)
-            bucket_objects["bucket-objects"] = temp
+            bucket_objects = {"bucket-objects": []}
+            for page in self.iter_bucket_objects(bucket_name):
+                bucket_objects["bucket-objects"].extend(page)
             return bucket_objects
         except Exception as e:
-            objects_in_bucket["error"] = str(e)+" \n - Trace: "+str(traceback.format_exc())
-            return objects_in_bucket
+            return {"error": str(e)+" \n - Trace: "+str(traceback.format_exc())}
+
+    def iter_bucket_objects(self, bucket_name: str, prefix: str = None, page_size: int = 1000,
+                            stat: bool = False) -> Iterator[List[dict]]:
+        """
+        Iterate properties of the objects of a bucket page by page. Objects are listed lazily, a page is only requested
+        from Minio/AWS-S3 when the previous one was consumed. Properties (name, size, etag, last modified) are taken from
+        the listing, objects are only stat'ed if stat is True
+        :param bucket_name:
+        :param prefix: only objects whose name starts with prefix
+        :param page_size: number of objects per page
+        :param stat: add all properties (e.g., content type and metadata) with one stat request per object
+        :return: iterator of lists of {stat1:str, stat2, str}
+        :rtype: Iterator[List[dict]]
+        """
+        page = []
+        for obj in self.minioClient.list_objects(bucket_name, prefix=prefix, recursive=True):
+            if stat:
+                obj = self.minioClient.stat_object(bucket_name, obj.object_name)
+            page.append(object_to_dict(obj))
+            if len(page) >= page_size:
+                yield page
+                page = []
+        if len(page) > 0:
+            yield page
+
+    def get_object_names(self, bucket_name: str, prefix: str = None) -> List[str]:
+        """
+        Returns names of all objects of a bucket whose name starts with prefix
+        :param bucket_name:
+        :param prefix:
+        :return: list of object names
+        :rtype: List[str]
+        """
+        return [obj.object_name for obj in self.minioClient.list_objects(bucket_name, prefix=prefix, recursive=True)]
 
     def get_object_stats(self, bucket_name: str, object_name: str) -> dict:
         """
@@ -90,10 +153,7 @@ class MinioHandler():
         """
         try:
             if self.is_bucket(bucket_name):
-                object_stat = self.minioClient.stat_object(bucket_name, object_name)
-                object_stat = json.dumps(object_stat, default=lambda o: o.__dict__)
-                object_stat = json.loads(object_stat)
-                return object_stat
+                return object_to_dict(self.minioClient.stat_object(bucket_name, object_name))
             else:
                 return [{"error": "Bucket does not exist"}]
 
@@ -117,6 +177,90 @@ class MinioHandler():
         except Exception as e:
             return {"error": str(e)}
 
+    def get_object_content(self, bucket_name: str, object_name: str) -> bytes:
+        """
+        Returns content of a stored object. Small objects are downloaded with a single GET request, large objects in
+        parallel (see get_object_stream)
+        :param bucket_name:
+        :param object_name:
+        :return: object content, None if the object or bucket does not exist
+        :rtype: bytes
+        """
+        chunks = self.get_object_stream(bucket_name, object_name)
+        if chunks is None:
+            return None
+        return b"".join(chunks)
+
+    def get_object_stream(self, bucket_name: str, object_name: str) -> Iterator[bytes]:
+        """
+        Returns content of a stored object as chunks of part_size bytes, in order. Chunks are downloaded with ranged GET
+        requests by transfer_workers threads, at most transfer_workers+1 chunks are downloaded ahead of the consumer
+        :param bucket_name:
+        :param object_name:
+        :return: iterator of chunks, None if the object or bucket does not exist
+        :rtype: Iterator[bytes]
+        """
+        try:
+            data, object_size, etag = self.get_object_range(bucket_name, object_name, 0, self.part_size)
+        except Exception as e:
+            if get_error_code(e) in ("NoSuchKey", "NoSuchBucket", "NotFound"):
+                return None
+            if get_error_code(e) == "InvalidRange":
+                # object is empty
+                return iter([])
+            raise e
+        if object_size <= len(data):
+            return iter([data])
+        return self.iter_object_range(bucket_name, object_name, data, object_size, etag)
+
+    def iter_object_range(self, bucket_name: str, object_name: str, first_chunk: bytes, object_size: int,
+                          etag: str) -> Iterator[bytes]:
+        """
+        Download the chunks of an object that follow first_chunk in parallel
+        :param bucket_name:
+        :param object_name:
+        :param first_chunk: first part_size bytes of the object
+        :param object_size: size of the object in bytes
+        :param etag: etag of the object, fails if the object is changed during the download
+        :return: iterator of chunks
+        :rtype: Iterator[bytes]
+        """
+        yield first_chunk
+        request_headers = {"If-Match": etag} if etag else None
+        with ThreadPoolExecutor(max_workers=self.transfer_workers) as executor:
+            chunks = deque()
+            for offset in range(len(first_chunk), object_size, self.part_size):
+                chunks.append(executor.submit(self.get_object_range, bucket_name, object_name, offset,
+                                              min(self.part_size, object_size - offset), request_headers))
+                if len(chunks) > self.transfer_workers:
+                    yield chunks.popleft().result()[0]
+            while len(chunks) > 0:
+                yield chunks.popleft().result()[0]
+
+    def get_object_range(self, bucket_name: str, object_name: str, offset: int, length: int,
+                         request_headers: dict = None) -> tuple:
+        """
+        Returns length bytes of a stored object starting at offset, with a single GET request
+        :param bucket_name:
+        :param object_name:
+        :param offset:
+        :param length:
+        :param request_headers: additional headers of the GET request
+        :return: (data, size of the object, etag of the object)
+        :rtype: tuple
+        """
+        http_resp = self.minioClient.get_partial_object(bucket_name, object_name, offset, length,
+                                                        request_headers=request_headers)
+        try:
+            data = http_resp.data
+            # e.g., bytes 0-8388607/73400320, missing if the whole object is returned
+            content_range = http_resp.headers.get("content-range")
+            etag = http_resp.headers.get("etag")
+        finally:
+            http_resp.release_conn()
+        object_size = int(content_range.rsplit("/", 1)[1]) if content_range else offset + len(data)
+        return data, object_size, etag
+
     def is_bucket(self, bucket_name: str) -> bool:
         """
 
@@ -124,10 +268,15 @@ class MinioHandler():
         :return: True/False
         :rtype: bool
         """
+        if (getattr(self, "host", None), bucket_name) in EXISTING_BUCKETS:
+            return True
         try:
-            return self.minioClient.bucket_exists(bucket_name)
+            exists = self.minioClient.bucket_exists(bucket_name)
         except Exception as e:
             raise e
+        if exists:
+            EXISTING_BUCKETS.add((getattr(self, "host", None), bucket_name))
+        return exists
 
     def is_object(self, bucket_name: str, object_name: str) -> dict:
         """
@@ -144,6 +293,8 @@ class MinioHandler():
             else:
                 return False
         except Exception as e:
+            if get_error_code(e) in ("NoSuchKey", "NotFound"):
+                return False
             raise e
 
     ###################################################################
@@ -165,9 +316,23 @@ class MinioHandler():
         except Exception as e:
             raise e
 
+    def open_object_upload(self, bucket_name: str, object_name: str,
+                           content_type: str = 'application/octet-stream') -> MultipartUpload:
+        """
+        Returns a writable file object that uploads an object while it is written, see MultipartUpload. The object is
+        stored when the file object is closed
+        :param bucket_name:
+        :param object_name:
+        :param content_type:
+        :return: MultipartUpload
+        :rtype: MultipartUpload
+        """
+        return MultipartUpload(self.minioClient, bucket_name, object_name, self.part_size, self.transfer_workers,
+                               content_type)
+
     def upload_object(self, bucket_name: str, object_name: str, object_filepath: object) -> bool:
         """
-        Uploads an object to Minio storage
+        Uploads an object to Minio storage. The file is uploaded in parts while it is read
         :param bucket_name:
         :param object_name:
         :param object_filepath: it shall contain full path of a file with file name (e.g., /home/nasir/obj.zip)
@@ -177,17 +342,15 @@ class MinioHandler():
         if not object_filepath:
             raise ValueError("File name cannot be empty")
         try:
-            file_stat = os.stat(object_filepath)
-            file_data = open(object_filepath, 'rb')
-            self.minioClient.put_object(bucket_name, object_name, file_data,
-                                        file_stat.st_size, content_type='application/zip')
+            with open(object_filepath, 'rb') as file_data:
+                self.upload_stream(bucket_name, object_name, file_data, os.stat(object_filepath).st_size)
             return True
         except Exception as e:
             raise e
 
     def upload_object_to_s3(self, bucket_name: str, object_name: str, file_data: object, obj_length:int) -> bool:
         """
-        Uploads an object to AWS-S3 storage
+        Uploads an object to AWS-S3 storage. file_data is uploaded in parts while it is read
         :param bucket_name: 
         :param object_name: 
         :param file_data: 
@@ -195,9 +358,44 @@ class MinioHandler():
         :return: 
         """
         try:
-            self.minioClient.put_object(bucket_name, object_name, file_data,
-                                        obj_length, content_type='application/zip')
+            self.upload_stream(bucket_name, object_name, file_data, obj_length)
             return True
         except Exception as e:
             raise e
             return False
+
+    def upload_stream(self, bucket_name: str, object_name: str, file_data: object, obj_length: int = None):
+        """
+        Uploads obj_length bytes, or everything if obj_length is None, read from a file object
+        :param bucket_name:
+        :param object_name:
+        :param file_data: readable file object
+        :param obj_length:
+        """
+        with self.open_object_upload(bucket_name, object_name, content_type='application/zip') as upload:
+            remaining = obj_length
+            while remaining is None or remaining > 0:
+                chunk = file_data.read(self.part_size if remaining is None else min(self.part_size, remaining))
+                if not chunk:
+                    break
+                upload.write(chunk)
+                if remaining is not None:
+                    remaining -= len(chunk)
+
+    ###################################################################
+    ################## DELETE DATA METHODS ############################
+    ###################################################################
+
+    def remove_object(self, bucket_name: str, object_name: str) -> bool:
+        """
+        Deletes an object from a bucket
+        :param bucket_name:
+        :param object_name:
+        :return: True/False
+        :rtype: bool
+        """
+        try:
+            self.minioClient.remove_object(bucket_name, object_name)
+            return True
+        except Exception as e:
+            raise e
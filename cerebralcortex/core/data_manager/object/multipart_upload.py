@@ -0,0 +1,246 @@
+# Copyright (c) 2018, MD2K Center of Excellence
+# - Nasir Ali <nasir.ali08@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import minio
+
+# S3 requires all parts of a multipart upload, except the last one, to be at least 5 MB
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_TRANSFER_WORKERS = 4
+
+
+class MinioPartApi():
+    def __init__(self, minio_client: object):
+        """
+        Multipart upload requests of a Minio client. The public Minio API uploads the parts of an object one after the
+        other, parallel part uploads need the private methods of the client. These change between minio releases, each
+        subclass is pinned to the releases it was tested with, see get_part_api.
+        :param minio_client: Minio object
+        """
+        self.client = minio_client
+
+    def new_upload(self, bucket_name: str, object_name: str, content_type: str) -> str:
+        """
+        :return: upload id
+        :rtype: str
+        """
+        return self.client._new_multipart_upload(bucket_name, object_name, {'Content-Type': content_type})
+
+    def upload_part(self, bucket_name: str, object_name: str, upload_id: str, part_number: int,
+                    part_data: bytes) -> str:
+        """
+        :return: etag of the part
+        :rtype: str
+        """
+        raise NotImplementedError
+
+    def complete_upload(self, bucket_name: str, object_name: str, upload_id: str, uploaded_parts: dict):
+        """
+        :param uploaded_parts: part number -> UploadPart
+        """
+        self.client._complete_multipart_upload(bucket_name, object_name, upload_id, uploaded_parts)
+
+    def abort_upload(self, bucket_name: str, object_name: str, upload_id: str):
+        self.client._remove_incomplete_upload(bucket_name, object_name, upload_id)
+
+
+class Minio2PartApi(MinioPartApi):
+    """
+    minio 2.x
+    """
+
+    def upload_part(self, bucket_name: str, object_name: str, upload_id: str, part_number: int,
+                    part_data: bytes) -> str:
+        from minio.helpers import PartMetadata
+        return self.client._do_put_multipart_object(bucket_name, object_name, PartMetadata(
+            BytesIO(part_data), hashlib.md5(part_data).hexdigest(), hashlib.sha256(part_data).hexdigest(),
+            len(part_data)), upload_id, part_number)
+
+
+class Minio6PartApi(MinioPartApi):
+    """
+    minio 3.x to 6.x
+    """
+
+    def upload_part(self, bucket_name: str, object_name: str, upload_id: str, part_number: int,
+                    part_data: bytes) -> str:
+        etag = self.client._do_put_object(bucket_name, object_name, part_data, len(part_data), upload_id, part_number)
+        # minio 6.x also returns the version id of the part
+        if isinstance(etag, tuple):
+            etag = etag[0]
+        return etag
+
+
+def get_part_api(minio_client: object, minio_version: str = minio.__version__) -> MinioPartApi:
+    """
+    Returns the multipart upload requests of the given minio release
+    :param minio_client: Minio object
+    :param minio_version:
+    :return: MinioPartApi, None if the parts of an upload cannot be uploaded in parallel with this minio release
+    :rtype: MinioPartApi
+    """
+    major = int(minio_version.split(".")[0])
+    if major == 2:
+        return Minio2PartApi(minio_client)
+    elif 3 <= major <= 6:
+        return Minio6PartApi(minio_client)
+    else:
+        return None
+
+
+class MultipartUpload():
+    def __init__(self, minio_client: object, bucket_name: str, object_name: str, part_size: int = DEFAULT_PART_SIZE,
+                 workers: int = DEFAULT_TRANSFER_WORKERS, content_type: str = 'application/octet-stream'):
+        """
+        Writable file object that uploads an object to Minio/AWS-S3 while it is written. Written data is uploaded in
+        parts of part_size bytes by up to workers threads, at most workers+1 parts are buffered in memory. Objects
+        smaller than part_size are uploaded with a single PUT request. With a minio release that get_part_api does not
+        support, the whole object is buffered and uploaded with the public put_object on close(). The object is only
+        visible in the bucket after close(), an upload that was not closed is aborted.
+        :param minio_client: Minio object
+        :param bucket_name:
+        :param object_name:
+        :param part_size: bytes per part
+        :param workers: number of parts uploaded in parallel
+        :param content_type:
+        """
+        self.client = minio_client
+        self.part_api = get_part_api(minio_client)
+        self.bucket_name = bucket_name
+        self.object_name = object_name
+        self.part_size = max(int(part_size), MIN_PART_SIZE)
+        self.workers = max(int(workers), 1)
+        self.content_type = content_type
+        self.buffer = bytearray()
+        self.size = 0
+        self.upload_id = None
+        self.executor = None
+        self.parts = []
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.size
+
+    def flush(self):
+        pass
+
+    def write(self, data: bytes) -> int:
+        """
+        Add data to the object, full parts are uploaded in the background
+        :param data:
+        :return: number of bytes written
+        :rtype: int
+        """
+        if self.closed:
+            raise ValueError("Cannot write to a closed upload of " + str(self.object_name))
+        self.buffer.extend(data)
+        self.size += len(data)
+        while self.part_api is not None and len(self.buffer) >= self.part_size:
+            part_data = bytes(self.buffer[:self.part_size])
+            del self.buffer[:self.part_size]
+            self.submit_part(part_data)
+        return len(data)
+
+    def submit_part(self, part_data: bytes):
+        """
+        Upload a part in the background. Waits for the oldest part in progress if workers parts are in progress
+        :param part_data:
+        """
+        if self.upload_id is None:
+            self.upload_id = self.part_api.new_upload(self.bucket_name, self.object_name, self.content_type)
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        if len(self.parts) >= self.workers:
+            # raises the error of a failed part
+            self.parts[-self.workers].result()
+        self.parts.append(self.executor.submit(self.upload_part, len(self.parts) + 1, part_data))
+
+    def upload_part(self, part_number: int, part_data: bytes) -> object:
+        """
+        Upload a part of the multipart upload
+        :param part_number: starts at 1
+        :param part_data:
+        :return: UploadPart
+        """
+        from minio.definitions import UploadPart
+        etag = self.part_api.upload_part(self.bucket_name, self.object_name, self.upload_id, part_number, part_data)
+        return UploadPart(self.bucket_name, self.object_name, self.upload_id, part_number, etag, None,
+                          len(part_data))
+
+    def close(self):
+        """
+        Upload the remaining data and complete the upload
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if self.upload_id is None:
+            self.client.put_object(self.bucket_name, self.object_name, BytesIO(bytes(self.buffer)), len(self.buffer),
+                                   content_type=self.content_type)
+            return
+        try:
+            if len(self.buffer) > 0:
+                self.submit_part(bytes(self.buffer))
+            self.buffer = bytearray()
+            uploaded_parts = {}
+            for part in self.parts:
+                upload_part = part.result()
+                uploaded_parts[upload_part.part_number] = upload_part
+            self.part_api.complete_upload(self.bucket_name, self.object_name, self.upload_id, uploaded_parts)
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            self.executor.shutdown()
+
+    def abort(self):
+        """
+        Discard the written data and remove already uploaded parts
+        """
+        self.closed = True
+        self.buffer = bytearray()
+        if self.upload_id is not None:
+            self.executor.shutdown()
+            try:
+                self.part_api.abort_upload(self.bucket_name, self.object_name, self.upload_id)
+            except Exception:
+                # parts of incomplete uploads are not visible, they are removed by the bucket's lifecycle rules
+                pass
+            self.upload_id = None
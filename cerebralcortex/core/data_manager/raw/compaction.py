@@ -0,0 +1,76 @@
+# Copyright (c) 2018, MD2K Center of Excellence
+# - Nasir Ali <nasir.ali08@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import uuid
+
+from cerebralcortex.core.data_manager.raw.stream_day_runner import StreamDayRunner, run_main
+
+
+def compact_day(nosql, owner_id: str, stream_id: str, day: str) -> bool:
+    """
+    Compacts one stream-day
+    :param nosql: storage of the stream-day
+    :param owner_id:
+    :param stream_id:
+    :param day: format (YYYYMMDD)
+    :return True if the day was compacted
+    :rtype bool
+    """
+    return nosql.compact_day_file(owner_id, stream_id, day)
+
+
+class Compaction(StreamDayRunner):
+    '''Merges the segments of stream-days into one sorted and unique day file of the configured format. Legacy
+    .pickle files and day files of other formats are converted as well, so readers never have to write.'''
+
+    name = "compaction"
+    done = "Compacted"
+
+    def __init__(self, CC, max_workers: int = None):
+        """
+
+        :param CC: CerebralCortex object reference
+        :param max_workers: number of worker processes, day_files/compaction_workers of the configuration if None
+        """
+        if max_workers is None:
+            max_workers = CC.config.get("day_files", {}).get("compaction_workers", 1)
+        super().__init__(CC, CC.RawData.nosql.get_compaction_candidates, compact_day, max_workers)
+
+    def compact(self, owner_id: uuid = None, stream_id: uuid = None) -> int:
+        """
+        Compacts all stream-days that have segments or files of other formats
+        :param owner_id: only compact streams of this owner, all owners if None
+        :param stream_id: only compact this stream, all streams if None
+        :return: number of compacted stream-days
+        :rtype: int
+        """
+        return self.process(owner_id, stream_id)
+
+
+def main():
+    run_main(Compaction, "Compact stream-day segments of CerebralCortex raw data")
+
+
+if __name__ == "__main__":
+    main()
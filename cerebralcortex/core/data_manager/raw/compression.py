@@ -0,0 +1,209 @@
+# Copyright (c) 2018, MD2K Center of Excellence
+# - Nasir Ali <nasir.ali08@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import gzip
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator
+
+import lz4.frame
+import zstandard
+
+GZIP_CODEC = "gzip"
+ZSTD_CODEC = "zstd"
+LZ4_CODEC = "lz4"
+
+# default level of each codec, gzip level 9 is the level of day files written before codecs were configurable
+DEFAULT_LEVELS = {GZIP_CODEC: 9, ZSTD_CODEC: 3, LZ4_CODEC: 0}
+
+# compressed data starts with the magic number of its codec's frame format, so day files of all codecs are readable
+MAGIC_NUMBERS = {GZIP_CODEC: b"\x1f\x8b", ZSTD_CODEC: b"\x28\xb5\x2f\xfd", LZ4_CODEC: b"\x04\x22\x4d\x18"}
+
+# zstd dictionaries known to this process by dictionary id, zstd frames store the id of the dictionary they need
+ZSTD_DICTIONARIES = {}
+
+
+def get_codec_name(data: bytes) -> str:
+    """
+    Detects the codec of compressed data from its frame header
+    :param data: compressed data (bytes-like), at least the first 4 bytes
+    :return: gzip, zstd or lz4
+    :rtype: str
+    """
+    header = bytes(data[:4])
+    for name, magic_number in MAGIC_NUMBERS.items():
+        if header[:len(magic_number)] == magic_number:
+            return name
+    raise ValueError("Data is not compressed with a supported codec (" + ", ".join(MAGIC_NUMBERS) + ").")
+
+
+def decompress(data: bytes) -> bytes:
+    """
+    Decompress data of any supported codec. zstd frames compressed with a dictionary need a Codec using the same
+    dictionary to be created in this process first
+    :param data: compressed data, bytes-like object
+    :return: decompressed data
+    :rtype: bytes
+    """
+    codec_name = get_codec_name(data)
+    if codec_name == GZIP_CODEC:
+        return gzip.decompress(data)
+    elif codec_name == LZ4_CODEC:
+        return lz4.frame.decompress(data)
+    dict_id = zstandard.get_frame_parameters(data).dict_id
+    if dict_id == 0:
+        decompressor = zstandard.ZstdDecompressor()
+    elif dict_id in ZSTD_DICTIONARIES:
+        decompressor = zstandard.ZstdDecompressor(dict_data=ZSTD_DICTIONARIES[dict_id])
+    else:
+        raise ValueError("zstd dictionary " + str(dict_id) + " is not configured. Please check your "
+                                                              "cerebralcortex.yml configurations.")
+    # frames written as a stream do not store their size
+    return decompressor.decompressobj().decompress(data)
+
+
+class Codec():
+    def __init__(self, name: str = None, level: int = None, dictionary: bytes = None, threads: int = 0,
+                 workers: int = 1):
+        """
+        Compression of day files. Pickle day files are compressed as a whole, the codec is detected from the frame
+        header on read. Parquet day files compress their pages with the codec, parquet stores the codec of each column
+        :param name: gzip, zstd or lz4. None keeps gzip level 9 for pickle day files and the parquet default (snappy)
+        :param level: compression level, default level of the codec if None
+        :param dictionary: zstd dictionary (e.g., created with zstd --train), only used by pickle day files
+        :param threads: number of threads compressing zstd frames, 0 compresses in the calling thread, -1 uses all cores
+        :param workers: number of threads compressing and decompressing the blocks of a day file, see map
+        """
+        self.name = name if name is not None else GZIP_CODEC
+        if self.name not in MAGIC_NUMBERS:
+            raise ValueError(str(name) + " compression is not supported.")
+        self.level = int(level) if level is not None else DEFAULT_LEVELS[self.name]
+        if name is None:
+            self.parquet_compression = {}
+        else:
+            self.parquet_compression = {"compression": self.name, "compression_level": self.level}
+        if self.name == ZSTD_CODEC and dictionary is not None:
+            dictionary = zstandard.ZstdCompressionDict(dictionary)
+            ZSTD_DICTIONARIES[dictionary.dict_id()] = dictionary
+        self.dictionary = dictionary
+        self.threads = threads
+        # zstd compressors must not be used by more than one thread at a time
+        self.local = threading.local()
+        self.workers = max(1, int(workers))
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def compress(self, data: bytes) -> bytes:
+        """
+        :param data:
+        :return: compressed data
+        :rtype: bytes
+        """
+        if self.name == ZSTD_CODEC:
+            return self.get_compressor().compress(data)
+        elif self.name == LZ4_CODEC:
+            return lz4.frame.compress(data, compression_level=self.level)
+        return gzip.compress(data, compresslevel=self.level)
+
+    def get_compressor(self) -> zstandard.ZstdCompressor:
+        """
+        :return: zstd compressor of the calling thread
+        :rtype: zstandard.ZstdCompressor
+        """
+        compressor = getattr(self.local, "compressor", None)
+        if compressor is None:
+            compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self.dictionary, threads=self.threads)
+            self.local.compressor = compressor
+        return compressor
+
+    def map(self, function: Callable, items: Iterable) -> Iterator:
+        """
+        Apply a function to items in the threads of the codec, results are returned in the order of the items. At most
+        2 * workers items are processed or waiting to be consumed at a time. zlib, zstd and lz4 release the GIL while
+        they (de)compress
+        :param function: e.g., compresses a block of a day file
+        :param items:
+        :return: iterator of results
+        :rtype: Iterator
+        """
+        if self.workers == 1:
+            yield from map(function, items)
+            return
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(self.executor.submit(function, item))
+                if len(pending) >= 2 * self.workers:
+                    yield pending.popleft().result()
+            while len(pending) > 0:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def open_writer(self, file: object) -> object:
+        """
+        Returns a writable file object compressing data written to it into file, closing it does not close file
+        :param file: writable file object
+        :return: writable file object
+        """
+        if self.name == ZSTD_CODEC:
+            return ZstdWriter(self.get_compressor(), file)
+        elif self.name == LZ4_CODEC:
+            return lz4.frame.LZ4FrameFile(file, mode="wb", compression_level=self.level)
+        return gzip.GzipFile(fileobj=file, mode="wb", compresslevel=self.level)
+
+
+class ZstdWriter():
+    def __init__(self, compressor: zstandard.ZstdCompressor, file: object):
+        """
+        Writes a zstd frame to a file object
+        :param compressor:
+        :param file: writable file object
+        """
+        self.compressobj = compressor.compressobj()
+        self.file = file
+
+    def write(self, data: bytes) -> int:
+        self.file.write(self.compressobj.compress(data))
+        return len(data)
+
+    def close(self):
+        if self.compressobj is not None:
+            self.file.write(self.compressobj.flush())
+            self.compressobj = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+# codec of day files if cerebralcortex.yml does not configure one
+DEFAULT_CODEC = Codec()
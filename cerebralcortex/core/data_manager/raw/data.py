@@ -23,15 +23,27 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import atexit
 import os
 from cerebralcortex.core.log_manager.log_handler import LogTypes
-from cerebralcortex.core.data_manager.raw.stream_handler import StreamHandler
+from cerebralcortex.core.data_manager.raw.stream_handler import StreamHandler, DEFAULT_READ_WORKERS
 from cerebralcortex.core.data_manager.time_series.data import TimeSeriesData
 from cerebralcortex.core.data_manager.object.data import ObjectData
 
 from cerebralcortex.core.data_manager.raw.storage_hdfs import HDFSStorage
 from cerebralcortex.core.data_manager.raw.storage_filesystem import FileSystemStorage
 from cerebralcortex.core.data_manager.raw.storage_aws_s3 import AwsS3Storage
+from cerebralcortex.core.data_manager.raw.storage_tiered import TieredStorage, DEFAULT_HOT_DAYS
+from cerebralcortex.core.data_manager.raw.day_file_format import FILE_EXTENSIONS, PICKLE_FORMAT, APPEND_MODE, \
+    REWRITE_MODE, DEFAULT_BLOCK_SIZE
+from cerebralcortex.core.data_manager.raw.compression import Codec
+from cerebralcortex.core.data_manager.raw.day_block_cache import DayBlockCache
+from cerebralcortex.core.data_manager.raw.day_file_disk_cache import DayFileDiskCache
+from cerebralcortex.core.data_manager.raw.write_buffer import WriteBuffer, DEFAULT_MAX_AGE
+from cerebralcortex.core.data_manager.raw.stream_day_manifest import StreamDayManifest, MANIFEST_MODES, NO_MANIFEST, \
+    USE_MANIFEST, DEFAULT_REFRESH_INTERVAL
+from cerebralcortex.core.data_manager.raw.hdfs_connection_pool import get_connection_pool
+from cerebralcortex.core.util.datetime_helper_methods import TIMEZONE_CONVERSION, OFFSET_CONVERSION
 
 class RawData(StreamHandler, HDFSStorage, FileSystemStorage, AwsS3Storage):
     def __init__(self, CC):
@@ -47,27 +59,82 @@ class RawData(StreamHandler, HDFSStorage, FileSystemStorage, AwsS3Storage):
         self.logging = CC.logging
         self.nosql_store = self.config['nosql_storage']
 
+        # format of newly written day files, files of all supported formats remain readable
+        if "day_files" in self.config:
+            self.day_file_format = self.config["day_files"]["format"]
+            self.day_file_write_mode = self.config["day_files"].get("write_mode", REWRITE_MODE)
+            self.day_file_block_size = int(self.config["day_files"].get("block_size", DEFAULT_BLOCK_SIZE))
+            day_cache_size = int(self.config["day_files"].get("cache_size", 0))
+            self.read_workers = int(self.config["day_files"].get("read_workers", DEFAULT_READ_WORKERS))
+            disk_cache_dir = self.config["day_files"].get("disk_cache_dir")
+            disk_cache_size = int(self.config["day_files"].get("disk_cache_size", 0))
+            write_buffer_size = int(self.config["day_files"].get("write_buffer_size", 0))
+            write_buffer_age = float(self.config["day_files"].get("write_buffer_age", DEFAULT_MAX_AGE))
+            compression = self.config["day_files"].get("compression")
+            compression_level = self.config["day_files"].get("compression_level")
+            compression_dictionary = self.config["day_files"].get("compression_dictionary")
+            compression_threads = int(self.config["day_files"].get("compression_threads", 0))
+            compression_workers = int(self.config["day_files"].get("compression_workers", 1))
+            manifest = self.config["day_files"].get("manifest", NO_MANIFEST)
+            manifest_refresh_interval = float(self.config["day_files"].get("manifest_refresh_interval",
+                                                                           DEFAULT_REFRESH_INTERVAL))
+        else:
+            self.day_file_format = PICKLE_FORMAT
+            self.day_file_write_mode = REWRITE_MODE
+            self.day_file_block_size = DEFAULT_BLOCK_SIZE
+            day_cache_size = 0
+            self.read_workers = DEFAULT_READ_WORKERS
+            disk_cache_dir = None
+            disk_cache_size = 0
+            write_buffer_size = 0
+            write_buffer_age = DEFAULT_MAX_AGE
+            compression = None
+            compression_level = None
+            compression_dictionary = None
+            compression_threads = 0
+            compression_workers = 1
+            manifest = NO_MANIFEST
+            manifest_refresh_interval = DEFAULT_REFRESH_INTERVAL
+        if self.day_file_format not in FILE_EXTENSIONS:
+            raise ValueError(str(self.day_file_format) + " day file format is not supported.")
+        if self.day_file_write_mode not in [APPEND_MODE, REWRITE_MODE]:
+            raise ValueError(str(self.day_file_write_mode) + " day file write mode is not supported.")
+        if manifest not in MANIFEST_MODES:
+            raise ValueError(str(manifest) + " stream-day manifest mode is not supported.")
+        if compression_dictionary:
+            with open(compression_dictionary, "rb") as dictionary_file:
+                compression_dictionary = dictionary_file.read()
+        else:
+            compression_dictionary = None
+        self.day_file_codec = Codec(compression, compression_level, compression_dictionary, compression_threads,
+                                    compression_workers)
+        # cache size is configured in MB
+        self.day_cache = DayBlockCache(day_cache_size * 1024 * 1024)
+        # local copies of remote (HDFS, AWS-S3) day files, disk cache size is configured in MB
+        self.disk_cache = DayFileDiskCache(disk_cache_dir, disk_cache_size * 1024 * 1024)
+        # save_stream calls of chatty streams are coalesced, buffered data is written before the process exits
+        self.write_buffer = WriteBuffer(write_buffer_size, write_buffer_age)
+        if self.write_buffer.is_enabled():
+            atexit.register(self.flush)
+        # stored days of each stream, kept in the SQL store next to the stream metadata
+        self.day_manifest = StreamDayManifest(self.sql_data if manifest != NO_MANIFEST else None,
+                                              manifest == USE_MANIFEST, manifest_refresh_interval)
+
+        self.localtime_conversion = self.config.get("localtime_conversion", TIMEZONE_CONVERSION)
+        if self.localtime_conversion not in [TIMEZONE_CONVERSION, OFFSET_CONVERSION]:
+            raise ValueError(str(self.localtime_conversion) + " local time conversion is not supported.")
 
         # pseudo factory
-        if self.nosql_store == "hdfs":
-            self.nosql = HDFSStorage(self)
-            self.hdfs_ip = self.config['hdfs']['host']
-            self.hdfs_port = self.config['hdfs']['port']
-            #self.hdfs_user = self.config['hdfs']['hdfs_user']
-            #self.hdfs_kerb_ticket = self.config['hdfs']['hdfs_kerb_ticket']
-            self.raw_files_dir = self.config['hdfs']['raw_files_dir']
-        elif self.nosql_store=="filesystem":
-            self.nosql = FileSystemStorage(self)
-            self.filesystem_path = self.config["filesystem"]["filesystem_path"]
-            if not os.access(self.filesystem_path, os.W_OK):
-                raise Exception(self.filesystem_path+" path is not writable. Please check your cerebralcortex.yml configurations.")
-        elif self.nosql_store=="aws_s3":
-            self.nosql = AwsS3Storage(self)
-            self.minio_input_bucket = self.config['minio']['input_bucket_name']
-            self.minio_output_bucket = self.config['minio']['output_bucket_name']
-            self.minio_dir_prefix = self.config['minio']['dir_prefix']
+        if self.nosql_store == "tiered":
+            # recent days on the local filesystem, older days on HDFS or AWS-S3
+            tiered_config = self.config["tiered"]
+            if tiered_config["cold_storage"] not in ["hdfs", "aws_s3"]:
+                raise ValueError(str(tiered_config["cold_storage"]) + " is not supported as cold storage.")
+            self.nosql = TieredStorage(self, self.create_storage("filesystem"),
+                                       self.create_storage(tiered_config["cold_storage"]),
+                                       int(tiered_config.get("hot_days", DEFAULT_HOT_DAYS)))
         else:
-            raise ValueError(self.nosql_store + " is not supported.")
+            self.nosql = self.create_storage(self.nosql_store)
 
         if self.config["visualization_storage"]!="none":
             self.timeSeriesData = TimeSeriesData(CC)
@@ -77,13 +144,36 @@ class RawData(StreamHandler, HDFSStorage, FileSystemStorage, AwsS3Storage):
         if "minio" in self.config:
             self.ObjectData = ObjectData(CC)
 
-
-
-
-
-        
         #self.data_play_type = self.config["data_replay"]["replay_type"]
-        
-
-        
 
+    def create_storage(self, nosql_store: str) -> object:
+        """
+        Creates the storage of raw data
+        :param nosql_store: hdfs, filesystem or aws_s3
+        :return: HDFSStorage, FileSystemStorage or AwsS3Storage
+        """
+        if nosql_store == "hdfs":
+            self.hdfs_ip = self.config['hdfs']['host']
+            self.hdfs_port = self.config['hdfs']['port']
+            # connections are shared by all RawData objects of a process
+            self.hdfs_pool = get_connection_pool(self.hdfs_ip, self.hdfs_port,
+                                                 int(self.config['hdfs'].get('connection_pool_size', 8)),
+                                                 float(self.config['hdfs'].get('connection_check_interval', 60)))
+            if self.config['hdfs'].get('prewarm_connections', False):
+                self.hdfs_pool.warm_up()
+            #self.hdfs_user = self.config['hdfs']['hdfs_user']
+            #self.hdfs_kerb_ticket = self.config['hdfs']['hdfs_kerb_ticket']
+            self.raw_files_dir = self.config['hdfs']['raw_files_dir']
+            return HDFSStorage(self)
+        elif nosql_store=="filesystem":
+            self.filesystem_path = self.config["filesystem"]["filesystem_path"]
+            if not os.access(self.filesystem_path, os.W_OK):
+                raise Exception(self.filesystem_path+" path is not writable. Please check your cerebralcortex.yml configurations.")
+            return FileSystemStorage(self)
+        elif nosql_store=="aws_s3":
+            self.minio_input_bucket = self.config['minio']['input_bucket_name']
+            self.minio_output_bucket = self.config['minio']['output_bucket_name']
+            self.minio_dir_prefix = self.config['minio']['dir_prefix']
+            return AwsS3Storage(self)
+        else:
+            raise ValueError(str(nosql_store) + " is not supported.")
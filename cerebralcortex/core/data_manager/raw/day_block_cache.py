@@ -0,0 +1,171 @@
+# Copyright (c) 2018, MD2K Center of Excellence
+# - Nasir Ali <nasir.ali08@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import copy
+import sys
+import threading
+from collections import OrderedDict
+
+from cerebralcortex.core.datatypes.columnar_datastream import DataColumns
+from cerebralcortex.core.datatypes.datapoint import DataPoint
+
+
+def get_block_size(block) -> int:
+    """
+    Estimates the memory used by a decoded stream-day block. Size of DataPoints is estimated from the first DataPoint
+    :param block: list of DataPoints or DataColumns
+    :return: size in bytes
+    :rtype: int
+    """
+    if len(block) == 0:
+        return 0
+    if isinstance(block, DataColumns):
+        size = block.start_time.nbytes + block.end_time.nbytes + block.offset.nbytes + block.sample.nbytes
+        if block.sample.dtype == object:
+            size += len(block) * _get_object_size(block.sample[0])
+        return size
+    dp = block[0]
+    dp_size = sys.getsizeof(dp) + _get_object_size(dp.start_time) + _get_object_size(dp.sample)
+    if dp.end_time is not None:
+        dp_size += _get_object_size(dp.end_time)
+    # list of DataPoints stores one pointer per DataPoint
+    return sys.getsizeof(block) + len(block) * dp_size
+
+
+def _get_object_size(obj) -> int:
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(sys.getsizeof(value) for value in obj)
+    return sys.getsizeof(obj)
+
+
+def copy_block(block):
+    """
+    Returns a copy of a block that can be modified (e.g., converted to local time) without changing the cached block.
+    Samples are not copied
+    :param block: list of DataPoints or DataColumns
+    :return: list of DataPoints or DataColumns
+    """
+    if isinstance(block, DataColumns):
+        return copy.copy(block)
+    return list(map(DataPoint.__copy__, block))
+
+
+class DayBlockCache():
+    def __init__(self, max_size: int = 0):
+        """
+        Least recently used cache of decoded stream-day blocks. A block is stored with the versions (e.g., modification
+        time) of the files it was decoded from and the time window that was decoded, it is only returned if the files
+        did not change and the window covers the requested window
+        :param max_size: memory budget in bytes, 0 disables the cache
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.blocks = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: tuple, versions: tuple, start_time: int = None, end_time: int = None):
+        """
+        Returns a cached block
+        :param key: (owner_id, stream_id, day, columnar)
+        :param versions: versions of the files of the stream-day
+        :param start_time: microseconds since epoch (UTC), None for the start of the day
+        :param end_time: microseconds since epoch (UTC), None for the end of the day
+        :return: cached block, None if the block is not cached, outdated or does not cover the window
+        :rtype: List[DataPoint]|DataColumns
+        """
+        with self.lock:
+            entry = self.blocks.get(key)
+            if entry is not None and entry[0] == versions and _covers(entry[1], entry[2], start_time, end_time):
+                self.blocks.move_to_end(key)
+                self.hits += 1
+                return entry[3]
+            self.misses += 1
+            return None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def put(self, key: tuple, versions: tuple, start_time: int, end_time: int, block):
+        """
+        Stores a block and removes least recently used blocks until the cache fits in its memory budget. Blocks larger
+        than the budget are not stored
+        :param key: (owner_id, stream_id, day, columnar)
+        :param versions: versions of the files of the stream-day
+        :param start_time: start of the decoded window, microseconds since epoch (UTC)
+        :param end_time: end of the decoded window, microseconds since epoch (UTC)
+        :param block: list of DataPoints or DataColumns
+        """
+        block_size = get_block_size(block)
+        with self.lock:
+            self._remove(key)
+            if block_size > self.max_size:
+                return
+            self.blocks[key] = (versions, start_time, end_time, block, block_size)
+            self.size += block_size
+            while self.size > self.max_size:
+                self._remove(next(iter(self.blocks)))
+
+    def invalidate(self, owner_id, stream_id, day: str):
+        """
+        Removes the cached blocks of a stream-day
+        :param owner_id:
+        :param stream_id:
+        :param day: format (YYYYMMDD)
+        """
+        with self.lock:
+            for columnar in (False, True):
+                self._remove((str(owner_id), str(stream_id), str(day), columnar))
+
+    def clear(self):
+        """
+        Removes all cached blocks
+        """
+        with self.lock:
+            self.blocks.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        """
+        :return: hits, misses, number of cached blocks and their estimated size in bytes
+        :rtype: dict
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "blocks": len(self.blocks), "size": self.size,
+                    "max_size": self.max_size}
+
+    def _remove(self, key: tuple):
+        entry = self.blocks.pop(key, None)
+        if entry is not None:
+            self.size -= entry[4]
+
+
+def _covers(cached_start: int, cached_end: int, start_time: int, end_time: int) -> bool:
+    if cached_start is not None and (start_time is None or start_time < cached_start):
+        return False
+    if cached_end is not None and (end_time is None or end_time > cached_end):
+        return False
+    return True
@@ -0,0 +1,206 @@
+# Copyright (c) 2018, MD2K Center of Excellence
+# - Nasir Ali <nasir.ali08@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import hashlib
+import os
+import posixpath
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Callable
+
+import pyarrow
+
+TMP_SUFFIX = ".tmp"
+
+
+def get_cache_file_name(key: str, version: tuple) -> str:
+    """
+    Returns the name of the local copy of a remote file. Names start with a hash of the remote name, followed by a
+    hash of the version and the extension of the remote file
+    :param key: remote name, e.g., hdfs://host:port/cc/<owner>/<stream>/20180221.gz
+    :param version: version of the remote file, e.g., (modification time, size)
+    :return: file name
+    :rtype: str
+    """
+    return hashlib.sha1(key.encode()).hexdigest() + "-" + hashlib.sha1(repr(version).encode()).hexdigest()[:16] + \
+           posixpath.splitext(key)[1]
+
+
+class DayFileDiskCache():
+    def __init__(self, cache_dir: str = None, max_size: int = 0):
+        """
+        Least recently used cache of remote (HDFS, AWS-S3) day files on the local filesystem. A local copy is only used
+        if the version (e.g., size and modification time or etag) of the remote file did not change. Cached files
+        survive restarts and can be shared by all processes of a node, files are replaced atomically
+        :param cache_dir: local directory of the cached files
+        :param max_size: disk budget in bytes, 0 disables the cache
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        # local file name -> size, least recently used first
+        self.files = OrderedDict()
+        # hash of the remote name -> local file name of the cached version
+        self.versions = {}
+        self.lock = threading.Lock()
+        if self.enabled:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.load()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.cache_dir) and self.max_size > 0
+
+    def load(self):
+        """
+        Index the files in the cache directory, least recently used first, and remove least recently used files until
+        the cache fits in its disk budget. The directory is shared with other processes that add, read (see open) and
+        remove files, the index is rebuilt from the directory before files are evicted
+        """
+        cached_files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(TMP_SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                # removed by another process
+                continue
+            cached_files.append((stat.st_mtime, name, stat.st_size))
+        with self.lock:
+            self.files = OrderedDict()
+            self.versions = {}
+            self.size = 0
+            for mtime, name, size in sorted(cached_files):
+                self._add(name, size)
+            self._evict()
+
+    def open(self, key: str, version: tuple, fetch: Callable[[], bytes]) -> object:
+        """
+        Open a remote file. The local copy is read if it has the same version, otherwise the file is fetched and stored
+        :param key: remote name, unique over all remote storages (e.g., hdfs://host:port/path)
+        :param version: version of the remote file, e.g., (modification time, size)
+        :param fetch: returns the contents of the remote file, None if the file does not exist
+        :return: seekable file object (memory mapped local copy), None if the remote file does not exist
+        :rtype: object
+        """
+        name = get_cache_file_name(key, version)
+        path = os.path.join(self.cache_dir, name)
+        try:
+            # read from the page cache without copies, see read_contents
+            cached_file = pyarrow.memory_map(path)
+        except OSError:
+            cached_file = None
+        if cached_file is not None:
+            try:
+                # modification time keeps the order of least recently used files for later processes
+                os.utime(path)
+            except OSError:
+                pass
+            with self.lock:
+                if name not in self.files:
+                    # cached by another process
+                    self._add(name, cached_file.size())
+                self.files.move_to_end(name)
+                self.hits += 1
+            return cached_file
+
+        data = fetch()
+        with self.lock:
+            self.misses += 1
+        if data is None:
+            return None
+        self.put(name, data)
+        return BytesIO(data)
+
+    def put(self, name: str, data: bytes):
+        """
+        Stores a file and removes least recently used files of all processes until the cache fits in its disk budget.
+        Files larger than the budget are not stored
+        :param name: local file name, see get_cache_file_name
+        :param data: file contents
+        """
+        if len(data) > self.max_size:
+            return
+        path = os.path.join(self.cache_dir, name)
+        tmp_path = path + "." + str(os.getpid()) + "." + str(threading.get_ident()) + TMP_SUFFIX
+        try:
+            with open(tmp_path, "wb") as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            # e.g., disk is full, file is read from the remote storage next time
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.load()
+
+    def clear(self):
+        """
+        Removes all cached files
+        """
+        with self.lock:
+            while len(self.files) > 0:
+                self._remove(next(iter(self.files)))
+
+    def stats(self) -> dict:
+        """
+        :return: hits, misses, number of cached files and their size in bytes
+        :rtype: dict
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "files": len(self.files), "size": self.size,
+                    "max_size": self.max_size}
+
+    def _add(self, name: str, size: int):
+        key_hash = name.split("-", 1)[0]
+        # older versions of the file are not read again
+        if self.versions.get(key_hash, name) != name:
+            self._remove(self.versions[key_hash])
+        if name in self.files:
+            self.size -= self.files[name]
+        self.files[name] = size
+        self.versions[key_hash] = name
+        self.size += size
+
+    def _evict(self):
+        while self.size > self.max_size and len(self.files) > 0:
+            self._remove(next(iter(self.files)))
+
+    def _remove(self, name: str):
+        size = self.files.pop(name, None)
+        if size is None:
+            return
+        self.size -= size
+        key_hash = name.split("-", 1)[0]
+        if self.versions.get(key_hash) == name:
+            del self.versions[key_hash]
+        try:
+            os.remove(os.path.join(self.cache_dir, name))
+        except OSError:
+            pass
@@ -0,0 +1,671 @@
+# Copyright (c) 2018, MD2K Center of Excellence
+# - Nasir Ali <nasir.ali08@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import pickle
+import struct
+import time
+import uuid
+from datetime import datetime, timedelta
+from io import BytesIO
+from itertools import chain
+from typing import Iterator, List
+
+import numpy
+import pyarrow
+import pyarrow.ipc
+import pyarrow.parquet
+
+from cerebralcortex.core.data_manager.raw.compression import Codec, DEFAULT_CODEC, decompress
+from cerebralcortex.core.datatypes.datapoint import DataPoint
+from cerebralcortex.core.datatypes.columnar_datastream import DataColumns, NO_END_TIME, to_object_array
+from cerebralcortex.core.datatypes import columnar_datastream
+from cerebralcortex.core.util.data_types import serialize_obj, deserialize_obj
+from cerebralcortex.core.util.datetime_helper_methods import datetime_to_epoch_us
+
+PICKLE_FORMAT = "pickle"
+PARQUET_FORMAT = "parquet"
+# uncompressed arrow IPC file, columns of memory mapped day files are read as NumPy views of the mapped file
+ARROW_FORMAT = "arrow"
+
+# extension of a day file written in each format. Uncompressed .pickle files are only read (legacy)
+FILE_EXTENSIONS = {PICKLE_FORMAT: ".gz", PARQUET_FORMAT: ".parquet", ARROW_FORMAT: ".arrow"}
+LEGACY_PICKLE_EXTENSION = ".pickle"
+
+# write modes. append writes a new segment file (<day>/<segment>) per write, rewrite merges new data in the day file
+APPEND_MODE = "append"
+REWRITE_MODE = "rewrite"
+
+SAMPLE_LAYOUT_KEY = b"cerebralcortex.sample_layout"
+# list of values per DataPoint (one typed column per value), single value per DataPoint, or any python object (pickled)
+VALUES_LAYOUT = b"values"
+SCALAR_LAYOUT = b"scalar"
+OBJECT_LAYOUT = b"object"
+
+SAMPLE_COLUMN_TYPES = (pyarrow.int64(), pyarrow.float64(), pyarrow.string(), pyarrow.bool_(), pyarrow.null())
+
+# rows per block (parquet row group). min/max start_time of each block is stored in the file footer
+DEFAULT_BLOCK_SIZE = 10000
+
+# local time of a DataPoint differs at most this much from its UTC time
+MAX_UTC_OFFSET = timedelta(hours=14)
+
+# pickle day files of more than one block are written as independently compressed blocks (pickled lists of
+# DataPoints) followed by an index: one entry per block, the number of blocks and BLOCK_INDEX_MAGIC
+BLOCK_INDEX_MAGIC = b"CCBLOCKS"
+# compressed size, start_time of the first and the last DataPoint (microseconds since epoch, UTC)
+BLOCK_INDEX_ENTRY = struct.Struct("<Qqq")
+BLOCK_INDEX_COUNT = struct.Struct("<I")
+
+
+def get_day_file_names(day: str, file_format: str = PICKLE_FORMAT) -> List[str]:
+    """
+    Returns all possible file names of a stream-day, in the order they shall be probed by readers
+    :param day: format (YYYYMMDD)
+    :param file_format: day file format configured in cerebralcortex.yml
+    :return: list of file names
+    :rtype: List[str]
+    """
+    file_names = [str(day) + LEGACY_PICKLE_EXTENSION, str(day) + FILE_EXTENSIONS[file_format]]
+    for extension in FILE_EXTENSIONS.values():
+        if str(day) + extension not in file_names:
+            file_names.append(str(day) + extension)
+    return file_names
+
+
+def get_segment_name(file_format: str = PICKLE_FORMAT) -> str:
+    """
+    Returns a unique name for a new segment of a stream-day. Names sort in the order segments were written
+    :param file_format: day file format configured in cerebralcortex.yml
+    :return: segment file name
+    :rtype: str
+    """
+    return str(int(time.time() * 1000000)) + "-" + uuid.uuid4().hex[:8] + FILE_EXTENSIONS[file_format]
+
+
+def get_day_file_codec(file_format: str = PICKLE_FORMAT, codec: Codec = DEFAULT_CODEC) -> str:
+    """
+    Returns the compression of day files written in a format with a codec
+    :param file_format: day file format configured in cerebralcortex.yml
+    :param codec:
+    :return: codec name, none for uncompressed files
+    :rtype: str
+    """
+    if file_format == ARROW_FORMAT:
+        return "none"
+    if file_format == PARQUET_FORMAT:
+        return codec.parquet_compression.get("compression", "snappy")
+    return codec.name
+
+
+def is_day_file(filename: str) -> bool:
+    """
+    Returns True if a file name has the extension of a supported day file format
+    :param filename:
+    :return: True/False
+    :rtype: bool
+    """
+    return filename.endswith(LEGACY_PICKLE_EXTENSION) or any(
+        filename.endswith(extension) for extension in FILE_EXTENSIONS.values())
+
+
+def get_days_to_compact(names: List[str], file_format: str = PICKLE_FORMAT) -> List[str]:
+    """
+    Returns days of a stream that have segments or day files not stored in the configured format
+    :param names: file names relative to the stream directory (e.g., 20180221.pickle or 20180221/<segment>.gz)
+    :param file_format: day file format configured in cerebralcortex.yml
+    :return: sorted list of days (format YYYYMMDD)
+    :rtype: List[str]
+    """
+    days = set()
+    for name in names:
+        if "/" in name:
+            if is_day_file(name):
+                days.add(name.split("/")[0])
+        elif is_day_file(name) and not name.endswith(FILE_EXTENSIONS[file_format]):
+            days.add(name.split(".")[0])
+    return sorted(days)
+
+
+def serialize_day_file(data: List[DataPoint], file_format: str = PICKLE_FORMAT,
+                       block_size: int = DEFAULT_BLOCK_SIZE, codec: Codec = DEFAULT_CODEC) -> bytes:
+    """
+    Encode a list of DataPoints as the contents of a day file
+    :param data: sorted and unique list of DataPoints
+    :param file_format: pickle or parquet
+    :param block_size: rows per block of a parquet day file
+    :param codec: compression of the day file
+    :return: file contents
+    :rtype: bytes
+    """
+    if file_format == PARQUET_FORMAT:
+        sink = pyarrow.BufferOutputStream()
+        pyarrow.parquet.write_table(datapoints_to_table(data), sink, row_group_size=block_size,
+                                    **codec.parquet_compression)
+        return sink.getvalue().to_pybytes()
+    elif file_format == ARROW_FORMAT:
+        sink = pyarrow.BufferOutputStream()
+        write_arrow_table(datapoints_to_arrow_table(data), sink)
+        return sink.getvalue().to_pybytes()
+    elif file_format == PICKLE_FORMAT:
+        if len(data) > block_size:
+            day_file = BytesIO()
+            write_pickle_blocks(data, day_file, block_size, codec)
+            return day_file.getvalue()
+        return codec.compress(serialize_obj(data))
+    else:
+        raise ValueError(str(file_format) + " day file format is not supported.")
+
+
+def write_day_file(data: List[DataPoint], file: object, file_format: str = PICKLE_FORMAT,
+                   block_size: int = DEFAULT_BLOCK_SIZE, codec: Codec = DEFAULT_CODEC):
+    """
+    Encode a list of DataPoints as the contents of a day file and write them to a file object while they are encoded,
+    the encoded file is not held in memory
+    :param data: sorted and unique list of DataPoints
+    :param file: writable file object
+    :param file_format: pickle or parquet
+    :param block_size: rows per block of a parquet day file
+    :param codec: compression of the day file
+    """
+    if file_format == PARQUET_FORMAT:
+        pyarrow.parquet.write_table(datapoints_to_table(data), file, row_group_size=block_size,
+                                    **codec.parquet_compression)
+    elif file_format == ARROW_FORMAT:
+        write_arrow_table(datapoints_to_arrow_table(data), file)
+    elif file_format == PICKLE_FORMAT:
+        if len(data) > block_size:
+            write_pickle_blocks(data, file, block_size, codec)
+        else:
+            with codec.open_writer(file) as compressed_file:
+                pickle.dump(data, compressed_file)
+    else:
+        raise ValueError(str(file_format) + " day file format is not supported.")
+
+
+def read_contents(data):
+    """
+    Returns the contents of a day file. Memory mapped files (pyarrow.memory_map) are not copied, the returned
+    memoryview refers to the mapped file
+    :param data: file contents (bytes) or a file object
+    :return: bytes-like object
+    """
+    if isinstance(data, pyarrow.NativeFile):
+        return memoryview(data.read_buffer())
+    elif isinstance(data, (bytes, memoryview)):
+        return data
+    return data.read()
+
+
+def write_pickle_blocks(data: List[DataPoint], file: object, block_size: int = DEFAULT_BLOCK_SIZE,
+                        codec: Codec = DEFAULT_CODEC):
+    """
+    Write a pickle day file as independently compressed blocks and their index. Blocks are compressed in the threads of
+    the codec and written in order, only the blocks in flight are held in memory
+    :param data: sorted and unique list of DataPoints
+    :param file: writable file object
+    :param block_size: DataPoints per block
+    :param codec: compression of the blocks
+    """
+    def compress_block(block_start):
+        block = data[block_start:block_start + block_size]
+        return codec.compress(serialize_obj(block)), block[0].start_timestamp, block[-1].start_timestamp
+
+    index = []
+    for compressed_block, first_start_time, last_start_time in codec.map(compress_block,
+                                                                         range(0, len(data), block_size)):
+        file.write(compressed_block)
+        index.append(BLOCK_INDEX_ENTRY.pack(len(compressed_block), first_start_time, last_start_time))
+    file.write(b"".join(index) + BLOCK_INDEX_COUNT.pack(len(index)) + BLOCK_INDEX_MAGIC)
+
+
+def read_block_index(data: bytes) -> List[tuple]:
+    """
+    Returns the blocks of a pickle day file written by write_pickle_blocks
+    :param data: file contents, bytes-like object
+    :return: list of (offset, size, first start_time, last start_time) tuples, None if the file is a single block
+    :rtype: List[tuple]
+    """
+    if len(data) < len(BLOCK_INDEX_MAGIC) or bytes(data[-len(BLOCK_INDEX_MAGIC):]) != BLOCK_INDEX_MAGIC:
+        return None
+    count_end = len(data) - len(BLOCK_INDEX_MAGIC)
+    index_end = count_end - BLOCK_INDEX_COUNT.size
+    count = BLOCK_INDEX_COUNT.unpack_from(data, index_end)[0]
+    blocks = []
+    offset = 0
+    for entry in BLOCK_INDEX_ENTRY.iter_unpack(data[index_end - count * BLOCK_INDEX_ENTRY.size:index_end]):
+        blocks.append((offset,) + entry)
+        offset += entry[0]
+    return blocks
+
+
+def iter_pickle_blocks(data: bytes, blocks: List[tuple], start_time: int = None, end_time: int = None,
+                       codec: Codec = DEFAULT_CODEC) -> Iterator[List[DataPoint]]:
+    """
+    Decode the blocks of a pickle day file that overlap a time window in the threads of the codec
+    :param data: file contents, bytes-like object
+    :param blocks: see read_block_index
+    :param start_time: microseconds since epoch (UTC)
+    :param end_time: microseconds since epoch (UTC)
+    :param codec: provides the threads, the codec of each block is detected from its frame header
+    :return: iterator of lists of DataPoints in the order they are stored
+    :rtype: Iterator[List[DataPoint]]
+    """
+    blocks = [block for block in blocks if (start_time is None or block[3] >= start_time) and (
+            end_time is None or block[2] <= end_time)]
+
+    def decode_block(block):
+        return deserialize_obj(decompress(data[block[0]:block[0] + block[1]]))
+
+    return codec.map(decode_block, blocks)
+
+
+def deserialize_day_file(data, filename: str, start_time: int = None, end_time: int = None,
+                         columnar: bool = False, codec: Codec = DEFAULT_CODEC):
+    """
+    Decode the contents of a day file. Format is detected from the file name extension. If start_time/end_time
+    are given, only blocks of a parquet or pickle day file whose start_time range overlaps the window are decoded, the
+    result may still contain DataPoints outside of the window
+    :param data: file contents (bytes) or a seekable file object, memory mapped files (pyarrow.memory_map) are not
+    copied
+    :param filename: name of the file data was read from
+    :param start_time: microseconds since epoch (UTC), see get_block_window
+    :param end_time: microseconds since epoch (UTC), see get_block_window
+    :param columnar: return DataColumns instead of a list of DataPoints
+    :param codec: provides the threads decoding blocks of pickle day files
+    :return: list of DataPoints or DataColumns
+    :rtype: List[DataPoint]|DataColumns
+    """
+    if data is None or data == b'':
+        return DataColumns() if columnar else []
+    if filename.endswith(FILE_EXTENSIONS[PARQUET_FORMAT]):
+        if isinstance(data, bytes):
+            data = pyarrow.BufferReader(data)
+        if start_time is None and end_time is None:
+            table = pyarrow.parquet.read_table(data)
+        else:
+            parquet_file = pyarrow.parquet.ParquetFile(data)
+            blocks = get_overlapping_blocks(parquet_file.metadata, start_time, end_time)
+            if len(blocks) == 0:
+                return DataColumns() if columnar else []
+            table = parquet_file.read_row_groups(blocks)
+        return table_to_columns(table) if columnar else table_to_datapoints(table)
+    if filename.endswith(FILE_EXTENSIONS[ARROW_FORMAT]):
+        columns = arrow_table_to_columns(read_arrow_table(data), start_time, end_time)
+        return columns if columnar else columns.to_datapoints()
+
+    data = read_contents(data)
+    if len(data) == 0:
+        dps = []
+    elif filename.endswith(FILE_EXTENSIONS[PICKLE_FORMAT]):
+        blocks = read_block_index(data)
+        if blocks is not None:
+            dps = list(chain.from_iterable(iter_pickle_blocks(data, blocks, start_time, end_time, codec)))
+        else:
+            # gzip, zstd or lz4, detected from the frame header
+            dps = deserialize_obj(decompress(data))
+    elif filename.endswith(LEGACY_PICKLE_EXTENSION):
+        dps = deserialize_obj(data)
+    else:
+        raise ValueError(str(filename) + " is not a day file.")
+    return DataColumns.from_datapoints(dps) if columnar else dps
+
+
+def iter_day_file_blocks(data, filename: str, start_time: int = None, end_time: int = None,
+                         codec: Codec = DEFAULT_CODEC) -> Iterator[List[DataPoint]]:
+    """
+    Decode the contents of a day file one block at a time. Blocks of parquet and pickle day files are decoded lazily,
+    other files are decoded completely and yielded as one block
+    :param data: file contents (bytes) or a seekable file object, memory mapped files (pyarrow.memory_map) are not
+    copied
+    :param filename: name of the file data was read from
+    :param start_time: only decode blocks after this time, microseconds since epoch (UTC)
+    :param end_time: only decode blocks before this time, microseconds since epoch (UTC)
+    :param codec: provides the threads decoding blocks of pickle day files
+    :return: iterator of lists of DataPoints in the order they are stored
+    :rtype: Iterator[List[DataPoint]]
+    """
+    if data is None or data == b'':
+        return
+    if filename.endswith(FILE_EXTENSIONS[PARQUET_FORMAT]):
+        if isinstance(data, bytes):
+            data = pyarrow.BufferReader(data)
+        parquet_file = pyarrow.parquet.ParquetFile(data)
+        for block in get_overlapping_blocks(parquet_file.metadata, start_time, end_time):
+            yield table_to_datapoints(parquet_file.read_row_group(block))
+    elif filename.endswith(FILE_EXTENSIONS[ARROW_FORMAT]):
+        columns = arrow_table_to_columns(read_arrow_table(data), start_time, end_time)
+        # DataPoints are created one block at a time from the columns
+        for block_start in range(0, len(columns), DEFAULT_BLOCK_SIZE):
+            yield columns.take(slice(block_start, block_start + DEFAULT_BLOCK_SIZE)).to_datapoints()
+    else:
+        data = read_contents(data)
+        blocks = read_block_index(data) if filename.endswith(FILE_EXTENSIONS[PICKLE_FORMAT]) else None
+        if blocks is not None:
+            for dps in iter_pickle_blocks(data, blocks, start_time, end_time, codec):
+                if len(dps) > 0:
+                    yield dps
+            return
+        dps = deserialize_day_file(data, filename)
+        if len(dps) > 0:
+            yield dps
+
+
+def get_overlapping_blocks(metadata, start_time: int = None, end_time: int = None) -> List[int]:
+    """
+    Returns indexes of the row groups of a parquet day file whose start_time range overlaps the window. Row groups
+    without statistics are always included
+    :param metadata: parquet file metadata
+    :param start_time: microseconds since epoch (UTC)
+    :param end_time: microseconds since epoch (UTC)
+    :return: list of row group indexes
+    :rtype: List[int]
+    """
+    column = metadata.schema.names.index("start_time")
+    blocks = []
+    for i in range(metadata.num_row_groups):
+        statistics = metadata.row_group(i).column(column).statistics
+        if statistics is not None and statistics.has_min_max:
+            if (start_time is not None and statistics.max < start_time) or (
+                    end_time is not None and statistics.min > end_time):
+                continue
+        blocks.append(i)
+    return blocks
+
+
+def get_block_window(start_time: datetime = None, end_time: datetime = None, localtime: bool = False) -> tuple:
+    """
+    Convert a read window to microseconds since epoch (UTC) for block selection. Naive datetimes are UTC, or local
+    time of the DataPoints if localtime is True; as the offset is only known after decoding, such a window is
+    widened by MAX_UTC_OFFSET on both sides
+    :param start_time:
+    :param end_time:
+    :param localtime:
+    :return: (start_time, end_time), None for an open side
+    :rtype: tuple
+    """
+    window = []
+    for value, widen in ((start_time, -MAX_UTC_OFFSET), (end_time, MAX_UTC_OFFSET)):
+        if value is None:
+            window.append(None)
+        elif value.tzinfo is None and localtime:
+            window.append(datetime_to_epoch_us(value + widen))
+        else:
+            window.append(datetime_to_epoch_us(value))
+    return tuple(window)
+
+
+###################################################################
+################## COLUMNAR CONVERSION ############################
+###################################################################
+
+def datapoints_to_table(data: List[DataPoint]) -> pyarrow.Table:
+    """
+    Convert DataPoints to an arrow table with int64 start_time/end_time (microseconds since epoch, UTC),
+    int64 offset (milliseconds) and typed sample columns
+    :param data:
+    :return: arrow table
+    :rtype: pyarrow.Table
+    """
+    start_times = [dp.start_timestamp for dp in data]
+    end_times = [dp.end_timestamp for dp in data]
+    offsets = [int(dp.offset) for dp in data]
+
+    layout, sample_columns = _sample_columns([dp.sample for dp in data])
+
+    names = ["start_time", "end_time", "offset"]
+    arrays = [pyarrow.array(start_times, type=pyarrow.int64()), pyarrow.array(end_times, type=pyarrow.int64()),
+              pyarrow.array(offsets, type=pyarrow.int64())]
+    for i, column in enumerate(sample_columns):
+        names.append("sample_" + str(i))
+        arrays.append(column)
+
+    table = pyarrow.Table.from_arrays(arrays, names=names)
+    return table.replace_schema_metadata({SAMPLE_LAYOUT_KEY: layout})
+
+
+def table_to_datapoints(table: pyarrow.Table) -> List[DataPoint]:
+    """
+    Convert an arrow table created by datapoints_to_table back to DataPoints. start/end times are kept as integers
+    and read as naive UTC datetimes
+    :param table:
+    :return: list of DataPoints
+    :rtype: List[DataPoint]
+    """
+    if table.num_rows == 0:
+        return []
+    start_times = table.column("start_time").to_pylist()
+    end_times = table.column("end_time").to_pylist()
+    offsets = table.column("offset").to_pylist()
+    samples = _to_samples(table)
+
+    return [DataPoint(start_time=st, end_time=et, offset=of, sample=sample) for st, et, of, sample in
+            zip(start_times, end_times, offsets, samples)]
+
+
+def table_to_columns(table: pyarrow.Table) -> DataColumns:
+    """
+    Convert an arrow table created by datapoints_to_table to DataColumns without creating DataPoint objects. Numeric
+    sample columns without nulls become a NumPy matrix, other samples an object array
+    :param table:
+    :return: DataColumns
+    :rtype: DataColumns
+    """
+    if table.num_rows == 0:
+        return DataColumns()
+    start_time = table.column("start_time").to_numpy()
+    end_time = table.column("end_time")
+    if end_time.null_count == 0:
+        end_time = end_time.to_numpy()
+    else:
+        end_time = numpy.array([NO_END_TIME if value is None else value for value in end_time.to_pylist()],
+                               dtype=numpy.int64)
+    offset = table.column("offset").to_numpy()
+
+    layout = table.schema.metadata.get(SAMPLE_LAYOUT_KEY, OBJECT_LAYOUT) if table.schema.metadata else OBJECT_LAYOUT
+    columns = [table.column(name) for name in table.column_names if name.startswith("sample_")]
+    numeric = all(column.type in (pyarrow.int64(), pyarrow.float64()) and column.null_count == 0 for column in columns)
+    if layout == VALUES_LAYOUT and numeric:
+        sample = numpy.column_stack([column.to_numpy() for column in columns])
+        sample_layout = columnar_datastream.VALUES_LAYOUT
+    elif layout == SCALAR_LAYOUT and numeric:
+        sample = columns[0].to_numpy()
+        sample_layout = columnar_datastream.SCALAR_LAYOUT
+    else:
+        sample = to_object_array(_to_samples(table))
+        sample_layout = columnar_datastream.OBJECT_LAYOUT
+    return DataColumns(start_time, end_time, offset, sample, sample_layout)
+
+
+def datapoints_to_arrow_table(data: List[DataPoint]) -> pyarrow.Table:
+    """
+    Convert DataPoints to an arrow table of fixed width columns that can be read without copies: int64 start_time and
+    end_time (microseconds since epoch, UTC, NO_END_TIME if a DataPoint has no end time), int32 offset (milliseconds)
+    and the sample column. Numeric lists of the same length are stored as one fixed size list column (a row-major
+    matrix), numeric values as a numeric column, other samples and samples mixing int and float values are pickled
+    :param data:
+    :return: arrow table
+    :rtype: pyarrow.Table
+    """
+    start_times = numpy.array([dp.start_timestamp for dp in data], dtype=numpy.int64)
+    end_times = numpy.array([NO_END_TIME if dp.end_time is None else dp.end_timestamp for dp in data],
+                            dtype=numpy.int64)
+    offsets = numpy.array([int(dp.offset) for dp in data], dtype=numpy.int32)
+    samples = [dp.sample for dp in data]
+
+    layout = OBJECT_LAYOUT
+    if len(samples) > 0 and type(samples[0]) is list:
+        width = len(samples[0])
+        if width > 0 and all(type(sample) is list and len(sample) == width for sample in samples) and \
+                {type(value) for sample in samples for value in sample} in ({int}, {float}):
+            layout = VALUES_LAYOUT
+    elif len(samples) > 0 and {type(sample) for sample in samples} in ({int}, {float}):
+        layout = SCALAR_LAYOUT
+    if layout != OBJECT_LAYOUT:
+        values = numpy.array(samples)
+        if values.dtype not in (numpy.int64, numpy.float64):
+            # ints beyond int64
+            layout = OBJECT_LAYOUT
+    if layout == VALUES_LAYOUT:
+        sample = pyarrow.FixedSizeListArray.from_arrays(pyarrow.array(values.ravel()), values.shape[1])
+    elif layout == SCALAR_LAYOUT:
+        sample = pyarrow.array(values)
+    else:
+        sample = pyarrow.array([pickle.dumps(sample) for sample in samples], type=pyarrow.binary())
+
+    table = pyarrow.Table.from_arrays([pyarrow.array(start_times), pyarrow.array(end_times), pyarrow.array(offsets),
+                                       sample], names=["start_time", "end_time", "offset", "sample"])
+    return table.replace_schema_metadata({SAMPLE_LAYOUT_KEY: layout})
+
+
+def write_arrow_table(table: pyarrow.Table, file: object):
+    """
+    Write an arrow table as an uncompressed arrow IPC file
+    :param table: see datapoints_to_arrow_table
+    :param file: writable file object or pyarrow output stream
+    """
+    writer = pyarrow.ipc.new_file(file, table.schema)
+    try:
+        writer.write_table(table)
+    finally:
+        writer.close()
+
+
+def read_arrow_table(data) -> pyarrow.Table:
+    """
+    Read an arrow IPC day file. Columns of memory mapped files refer to the mapped file
+    :param data: file contents (bytes) or a seekable file object, e.g., a memory mapped file (pyarrow.memory_map)
+    :return: arrow table with one chunk per column
+    :rtype: pyarrow.Table
+    """
+    if isinstance(data, (bytes, memoryview)):
+        data = pyarrow.BufferReader(data)
+    table = pyarrow.ipc.open_file(data).read_all()
+    if any(column.num_chunks > 1 for column in table.columns):
+        table = table.combine_chunks()
+    return table
+
+
+def arrow_table_to_columns(table: pyarrow.Table, start_time: int = None, end_time: int = None) -> DataColumns:
+    """
+    Convert an arrow table created by datapoints_to_arrow_table to DataColumns. Numeric columns are NumPy views of
+    the arrow buffers, read-only if the table was read from a memory mapped file
+    :param table:
+    :param start_time: only return rows after this time, microseconds since epoch (UTC)
+    :param end_time: only return rows before this time, microseconds since epoch (UTC)
+    :return: DataColumns
+    :rtype: DataColumns
+    """
+    if table.num_rows == 0:
+        return DataColumns()
+    start_times = _column_view(table, "start_time")
+    # rows of a day file are sorted on start time
+    start_index = 0 if start_time is None else int(numpy.searchsorted(start_times, start_time, side="left"))
+    end_index = len(start_times) if end_time is None else int(numpy.searchsorted(start_times, end_time, side="right"))
+    if end_index <= start_index:
+        return DataColumns()
+    if start_index > 0 or end_index < table.num_rows:
+        table = table.slice(start_index, end_index - start_index)
+
+    layout = table.schema.metadata.get(SAMPLE_LAYOUT_KEY, OBJECT_LAYOUT) if table.schema.metadata else OBJECT_LAYOUT
+    sample = table.column("sample").chunk(0)
+    if layout == VALUES_LAYOUT:
+        width = sample.type.list_size
+        sample = sample.values.slice(sample.offset * width, len(sample) * width).to_numpy().reshape(-1, width)
+        sample_layout = columnar_datastream.VALUES_LAYOUT
+    elif layout == SCALAR_LAYOUT:
+        sample = sample.to_numpy()
+        sample_layout = columnar_datastream.SCALAR_LAYOUT
+    else:
+        sample = to_object_array([pickle.loads(value) for value in sample.to_pylist()])
+        sample_layout = columnar_datastream.OBJECT_LAYOUT
+    return DataColumns(_column_view(table, "start_time"), _column_view(table, "end_time"),
+                       _column_view(table, "offset"), sample, sample_layout)
+
+
+def _column_view(table: pyarrow.Table, name: str) -> numpy.ndarray:
+    column = table.column(name)
+    if column.num_chunks == 0:
+        return numpy.empty(0, dtype=column.type.to_pandas_dtype())
+    return column.chunk(0).to_numpy()
+
+
+def _sample_columns(samples: List) -> tuple:
+    """
+    Pick a sample layout and build arrow sample columns. Falls back to pickled objects when samples are not
+    lists of the same length or values of a column do not share one simple type.
+    :param samples:
+    :return: layout, list of arrow arrays
+    :rtype: tuple
+    """
+    if len(samples) > 0 and type(samples[0]) is list:
+        width = len(samples[0])
+        if width > 0 and all(type(sample) is list and len(sample) == width for sample in samples):
+            columns = _typed_columns(list(zip(*samples)))
+            if columns is not None:
+                return VALUES_LAYOUT, columns
+    elif len(samples) > 0 and not isinstance(samples[0], (list, tuple, dict)):
+        columns = _typed_columns([samples])
+        if columns is not None:
+            return SCALAR_LAYOUT, columns
+
+    return OBJECT_LAYOUT, [pyarrow.array([pickle.dumps(sample) for sample in samples], type=pyarrow.binary())]
+
+
+def _typed_columns(columns: List) -> List:
+    """
+    Convert columns of python values to arrow arrays, returns None if any column has no simple type. Values of a
+    column must share one type, arrow would convert ints of a column that also holds floats to floats
+    :param columns:
+    :return: list of arrow arrays or None
+    """
+    result = []
+    for column in columns:
+        value_types = {type(value) for value in column if value is not None}
+        if len(value_types) > 1 or not value_types <= {int, float, str, bool}:
+            return None
+        try:
+            array = pyarrow.array(column)
+        except (pyarrow.ArrowException, TypeError, ValueError, OverflowError):
+            return None
+        if array.type not in SAMPLE_COLUMN_TYPES:
+            return None
+        result.append(array)
+    return result
+
+
+def _to_samples(table: pyarrow.Table) -> List:
+    """
+    Rebuild DataPoint samples from the sample columns of a table
+    :param table:
+    :return: list of samples
+    """
+    layout = table.schema.metadata.get(SAMPLE_LAYOUT_KEY, OBJECT_LAYOUT) if table.schema.metadata else OBJECT_LAYOUT
+    columns = [table.column(name).to_pylist() for name in table.column_names if name.startswith("sample_")]
+    if layout == VALUES_LAYOUT:
+        return [list(values) for values in zip(*columns)]
+    elif layout == SCALAR_LAYOUT:
+        return columns[0]
+    else:
+        return [pickle.loads(sample) for sample in columns[0]]
@@ -0,0 +1,79 @@
+# Copyright (c) 2018, MD2K Center of Excellence
+# - Nasir Ali <nasir.ali08@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import uuid
+
+from cerebralcortex.core.data_manager.raw.storage_tiered import TieredStorage
+from cerebralcortex.core.data_manager.raw.stream_day_runner import StreamDayRunner, run_main
+
+
+def demote_day(nosql, owner_id: str, stream_id: str, day: str) -> bool:
+    """
+    Demotes one stream-day
+    :param nosql: tiered storage of the stream-day
+    :param owner_id:
+    :param stream_id:
+    :param day: format (YYYYMMDD)
+    :return True if the day was demoted
+    :rtype bool
+    """
+    return nosql.demote_day_file(owner_id, stream_id, day)
+
+
+class Demotion(StreamDayRunner):
+    '''Moves stream-days older than tiered/hot_days from the hot (local filesystem) to the cold (HDFS or AWS-S3) tier
+    of a tiered storage.'''
+
+    name = "demotion"
+    done = "Demoted"
+
+    def __init__(self, CC, max_workers: int = None):
+        """
+
+        :param CC: CerebralCortex object reference
+        :param max_workers: number of worker processes, tiered/demotion_workers of the configuration if None
+        """
+        if not isinstance(CC.RawData.nosql, TieredStorage):
+            raise ValueError("Demotion requires nosql_storage: tiered.")
+        if max_workers is None:
+            max_workers = CC.config.get("tiered", {}).get("demotion_workers", 1)
+        super().__init__(CC, CC.RawData.nosql.get_demotion_candidates, demote_day, max_workers)
+
+    def demote(self, owner_id: uuid = None, stream_id: uuid = None) -> int:
+        """
+        Demotes all stream-days of the hot tier that are older than hot_days
+        :param owner_id: only demote streams of this owner, all owners if None
+        :param stream_id: only demote this stream, all streams if None
+        :return: number of demoted stream-days
+        :rtype: int
+        """
+        return self.process(owner_id, stream_id)
+
+
+def main():
+    run_main(Demotion, "Move old stream-days of CerebralCortex raw data to the cold tier")
+
+
+if __name__ == "__main__":
+    main()
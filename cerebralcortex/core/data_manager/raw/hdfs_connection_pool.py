@@ -0,0 +1,178 @@
+# Copyright (c) 2018, MD2K Center of Excellence
+# - Nasir Ali <nasir.ali08@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+# connection pools of this process, one per HDFS (host, port)
+CONNECTION_POOLS = {}
+CONNECTION_POOLS_LOCK = threading.Lock()
+
+
+def get_connection_pool(host: str, port: int, max_size: int = 8, check_interval: float = 60):
+    """
+    Returns the process-wide connection pool of a HDFS, all RawData objects of a process share it
+    :param host:
+    :param port:
+    :param max_size: maximum number of idle connections kept open
+    :param check_interval: seconds a connection can be idle before it is checked again
+    :return: HDFSConnectionPool
+    :rtype: HDFSConnectionPool
+    """
+    with CONNECTION_POOLS_LOCK:
+        if (host, port) not in CONNECTION_POOLS:
+            CONNECTION_POOLS[(host, port)] = HDFSConnectionPool(host, port, max_size, check_interval)
+        return CONNECTION_POOLS[(host, port)]
+
+
+def connect_hdfs(host: str, port: int) -> object:
+    """
+    Opens a new connection (libhdfs) to HDFS
+    :param host:
+    :param port:
+    :return: hdfs connection object
+    """
+    import pyarrow
+    return pyarrow.hdfs.connect(host, port)
+
+
+class HDFSConnectionPool():
+    def __init__(self, host: str, port: int, max_size: int = 8, check_interval: float = 60,
+                 connect: Callable = connect_hdfs):
+        """
+        Thread-safe pool of HDFS connections. Connections that were idle longer than check_interval are checked before
+        they are handed out, connections that raised an error are closed and replaced by a new connection
+        :param host:
+        :param port:
+        :param max_size: maximum number of idle connections kept open, more connections are opened if needed
+        :param check_interval: seconds a connection can be idle before it is checked again
+        :param connect: opens a connection, connect(host, port)
+        """
+        self.host = host
+        self.port = port
+        self.max_size = max_size
+        self.check_interval = check_interval
+        self.connect = connect
+        self.idle = []
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.created = 0
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection, it is returned to the pool at the end of the with block or closed if the block raised an
+        error
+        :return: hdfs connection object
+        """
+        hdfs = self.get()
+        broken = False
+        try:
+            yield hdfs
+        except Exception:
+            broken = True
+            raise
+        finally:
+            if broken:
+                self.discard(hdfs)
+            else:
+                self.put(hdfs)
+
+    def get(self) -> object:
+        """
+        Returns an idle and healthy connection, or a new one if there is none
+        :return: hdfs connection object
+        """
+        while True:
+            with self.lock:
+                if self.pid != os.getpid():
+                    # connections of the parent process cannot be used in a forked process
+                    self.idle = []
+                    self.pid = os.getpid()
+                if len(self.idle) == 0:
+                    break
+                hdfs, returned_at = self.idle.pop()
+            if time.time() - returned_at < self.check_interval or self.is_healthy(hdfs):
+                return hdfs
+            self.discard(hdfs)
+        with self.lock:
+            self.created += 1
+        return self.connect(self.host, self.port)
+
+    def put(self, hdfs: object):
+        """
+        Return a borrowed connection to the pool
+        :param hdfs: hdfs connection object
+        """
+        with self.lock:
+            if self.pid == os.getpid() and len(self.idle) < self.max_size:
+                self.idle.append((hdfs, time.time()))
+                return
+        self.discard(hdfs)
+
+    def discard(self, hdfs: object):
+        """
+        Close a connection, it is not used again
+        :param hdfs: hdfs connection object
+        """
+        try:
+            hdfs.close()
+        except Exception:
+            pass
+
+    def is_healthy(self, hdfs: object) -> bool:
+        """
+        Checks if a connection can still reach the namenode
+        :param hdfs: hdfs connection object
+        :return: True if the connection works
+        :rtype: bool
+        """
+        try:
+            hdfs.exists("/")
+            return True
+        except Exception:
+            return False
+
+    def warm_up(self, size: int = None):
+        """
+        Open connections in advance, e.g., at startup of a Spark executor, so first reads do not wait for connection
+        setup
+        :param size: number of connections, max_size if None
+        """
+        size = self.max_size if size is None else min(size, self.max_size)
+        connections = [self.get() for _ in range(max(0, size - len(self.idle)))]
+        for hdfs in connections:
+            self.put(hdfs)
+
+    def close(self):
+        """
+        Close all idle connections
+        """
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for hdfs, returned_at in idle:
+            self.discard(hdfs)
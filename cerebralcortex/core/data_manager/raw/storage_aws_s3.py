@@ -24,157 +24,127 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
-import gzip
 import os
-import pickle
-import traceback
 import uuid
-from datetime import datetime, timedelta
+from contextlib import contextmanager
 from io import BytesIO
-from typing import List
+from typing import Iterator, List
 
 from cerebralcortex.core.datatypes.datapoint import DataPoint
-from cerebralcortex.core.util.data_types import deserialize_obj
+from cerebralcortex.core.data_manager.raw.day_file_format import write_day_file
+from cerebralcortex.core.data_manager.raw.storage_blueprint import BlueprintStorage
 
-class AwsS3Storage():
+class AwsS3Storage(BlueprintStorage):
+
+    storage_name = "AWS-S3"
+    # requests to AWS-S3 are latency bound, the UTC days of a local day are downloaded concurrently
+    concurrent_reads = True
 
     def __init__(self, obj):
         self.obj = obj
 
     ###################################################################
-    ################## GET DATA METHODS ###############################
+    ################## STORAGE PRIMITIVES #############################
     ###################################################################
 
-    def read_file(self, owner_id: uuid, stream_id: uuid, day: str, start_time: datetime = None,
-                         end_time: datetime = None, localtime: bool = True) -> List[DataPoint]:
+    @contextmanager
+    def connect(self, write: bool = False):
         """
-        Read and Process (read, unzip, unpickle, remove duplicates) data from AWS-S3
-        :param owner_id:
-        :param stream_id:
-        :param day: format (YYYYMMDD)
-        :param start_time:
-        :param end_time:
-        :param localtime:
-        :return: returns unique (based on start time) list of DataPoints
-        :rtype: DataPoint
+        Bucket used by the other storage primitives
+        :param write: output bucket if True, input bucket otherwise
+        :return: bucket name
         """
-        # TODO: this method only works for .gz files. Update it to handle .pickle uncompressed if required
-
-        bucket_name = self.obj.minio_input_bucket
-
-        if localtime:
-            days = [datetime.strftime(datetime.strptime(day, '%Y%m%d') - timedelta(hours=24), "%Y%m%d"), day,
-                    datetime.strftime(datetime.strptime(day, '%Y%m%d') + timedelta(hours=24), "%Y%m%d")]
-            day_start_time = datetime.strptime(day, '%Y%m%d')
-            day_end_time = day_start_time + timedelta(hours=24)
-            day_block = []
-            for d in days:
-                try:
-                    object_name = self.obj.minio_dir_prefix+str(owner_id) + "/" + str(stream_id)+"/"+str(d)+".gz"
-
-                    if self.obj.ObjectData.is_object(bucket_name, object_name):
-                        data = self.obj.ObjectData.get_object(bucket_name, object_name)
-                        if data.status==200:
-                            data = gzip.decompress(data.data)
-                            if data is not None and data != b'':
-                                data = deserialize_obj(data)
-                                #clean_data = self.obj.filter_sort_datapoints(data) TODO: Remove after testing. Already sorted and dedup during storage of data
-                                clean_data = self.obj.convert_to_localtime(data, localtime)
-                                day_block.extend(self.obj.subset_data(clean_data, day_start_time, day_end_time))
-                        else:
-                            self.obj.logging.log(
-                                error_message="HTTP-STATUS: "+data.status+" - Cannot get "+str(object_name)+" from AWS-S3. " + str(traceback.format_exc()),
-                                error_type=self.obj.logtypes.CRITICAL)
-                except:
-                    self.obj.logging.log(
-                        error_message="Error loading from AWS-S3: " + str(traceback.format_exc()),
-                        error_type=self.obj.logtypes.CRITICAL)
+        yield self.obj.minio_output_bucket if write else self.obj.minio_input_bucket
 
-            #day_block = self.obj.filter_sort_datapoints(day_block) TODO: Remove after testing. Already sorted and dedup during storage of data
-            if start_time is not None or end_time is not None:
-                day_block = self.obj.subset_data(day_block, start_time, end_time)
-            return day_block
-        else:
-            object_name = self.obj.minio_dir_prefix+str(owner_id) + "/" + str(stream_id)+"/"+str(day)+".gz"
-            try:
-                if self.obj.ObjectData.is_object(bucket_name, object_name):
-                    http_resp = self.obj.ObjectData.get_object(bucket_name, object_name)
-                    if http_resp.status==200:
-                        data = gzip.decompress(http_resp.data)
-                    else:
-                        self.obj.logging.log(
-                            error_message=http_resp.status+" HTTP-STATUS, Cannot get data from AWS-S3. " + str(traceback.format_exc()),
-                            error_type=self.obj.logtypes.CRITICAL)
-                        return []
-                else:
-                    return []
-                if data is not None and data != b'':
-                    data = deserialize_obj(data)
-                    #clean_data = self.obj.filter_sort_datapoints(data) TODO: Remove after testing. Already sorted and dedup during storage of data
-                    clean_data = self.obj.convert_to_localtime(data, localtime)
-                    if start_time is not None or end_time is not None:
-                        clean_data = self.obj.subset_data(clean_data, start_time, end_time)
-                    return clean_data
-                else:
-                    return []
-            except Exception as e:
-                self.obj.logging.log(
-                    error_message="Error loading from AWS-S3: Cannot parse row. " + str(traceback.format_exc()),
-                    error_type=self.obj.logtypes.CRITICAL)
-                return []
-  
-    ###################################################################
-    ################## STORE DATA METHODS #############################
-    ###################################################################
-
-    def write_file(self, participant_id: uuid, stream_id: uuid, data: List[DataPoint]) -> bool:
+    def get_stream_dir(self, owner_id: uuid, stream_id: uuid) -> str:
         """
-        Stores data in AWS-S3. If data contains multiple days then one file will be created for each day
-        :param participant_id:
+        :param owner_id:
         :param stream_id:
-        :param data:
-        :return True if data is successfully stored
-        :rtype bool
+        :return: object name prefix of a stream, ends with /
+        :rtype: str
         """
+        return self.obj.minio_dir_prefix + str(owner_id) + "/" + str(stream_id) + "/"
 
-        bucket_name = self.obj.minio_output_bucket
-        outputdata = {}
-        success = False
-
-        # Data Processing loop
-        for row in data:
-            day = row.start_time.strftime("%Y%m%d")
-            if day not in outputdata:
-                outputdata[day] = []
+    def list_files(self, dirname: str, filenames: List[str], bucket_name: str) -> dict:
+        """
+        Returns the objects with the prefix dirname and the objects of a list that exist, with their etag and size.
+        Objects are found with a single list request (e.g., prefix 20180221 matches 20180221/... and 20180221.parquet)
+        :param dirname: object name prefix
+        :param filenames: object names to check
+        :param bucket_name:
+        :return: {object name: (etag, size)}
+        :rtype: dict
+        """
+        names = set(filenames)
+        object_versions = {}
+        for page in self.obj.ObjectData.iter_bucket_objects(bucket_name, os.path.commonprefix([dirname] + filenames)):
+            for listed_object in page:
+                object_name = listed_object["object_name"]
+                if object_name.startswith(dirname) or object_name in names:
+                    object_versions[object_name] = (listed_object["etag"], listed_object["size"])
+        return object_versions
+
+    def open_day_file(self, object_name: str, bucket_name: str, version: tuple = None) -> object:
+        """
+        Download a day object. If the local disk cache is enabled and the version of the object is known, the object is
+        read from its local copy unless its etag or size changed (see DayFileDiskCache)
+        :param object_name:
+        :param bucket_name:
+        :param version: (etag, size) of the object
+        :return: seekable file object, None if the object does not exist
+        :rtype: object
+        """
+        if self.obj.disk_cache.enabled and version is not None:
+            return self.obj.disk_cache.open("s3://" + bucket_name + "/" + object_name, version,
+                                            lambda: self.obj.ObjectData.get_object_content(bucket_name, object_name))
+        content = self.obj.ObjectData.get_object_content(bucket_name, object_name)
+        return None if content is None else BytesIO(content)
 
-            outputdata[day].append(row)
+    def write_day_file_contents(self, object_name: str, data: List[DataPoint], bucket_name: str) -> int:
+        """
+        Encode DataPoints in the configured format and upload them. The object is uploaded in parts while it is encoded
+        :param object_name:
+        :param data: sorted and unique list of DataPoints
+        :param bucket_name:
+        :return: size of the uploaded object in bytes
+        :rtype: int
+        """
+        with self.obj.ObjectData.open_object_upload(bucket_name, object_name) as upload:
+            write_day_file(data, upload, self.obj.day_file_format, self.obj.day_file_block_size,
+                           self.obj.day_file_codec)
+            size = upload.tell()
+        return size
 
-        # Data Write loop
-        for day, dps in outputdata.items():
-            existing_data = None
-            object_name = self.obj.minio_dir_prefix + str(participant_id) + "/" + str(stream_id) + "/" + str(day) + ".gz"
+    def remove_files(self, object_names: List[str], dirname: str, bucket_name: str):
+        """
+        Remove objects, missing objects are ignored
+        :param object_names:
+        :param dirname: not used, object stores have no directories
+        :param bucket_name:
+        """
+        for object_name in object_names:
+            self.obj.ObjectData.remove_object(bucket_name, object_name)
 
-            if len(dps) > 0:
-                try:
-                    try:
-                        if self.obj.ObjectData.is_object(bucket_name, object_name):
-                            existing_data = self.obj.ObjectData.get_object(bucket_name, object_name)
-                            existing_data = gzip.decompress(existing_data)
-                            existing_data = pickle.loads(existing_data)
-                            dps.extend(existing_data)
-                    except:
-                        pass
-                    dps = self.obj.filter_sort_datapoints(dps)
-                    dps = pickle.dumps(dps)
-                    dps = gzip.compress(dps)
-                    dps = BytesIO(dps)
-                    obj_size = dps.seek(0, os.SEEK_END)
-                    dps.seek(0) # set file pointer back to start, otherwise minio would complain as size 0
-                    success = self.obj.ObjectData.upload_object_to_s3(bucket_name, object_name, dps, obj_size)
-                except Exception as ex:
-                    success = False
-                    self.obj.logging.log(
-                        error_message="Error in writing data to AWS-S3. STREAM ID: " + str(
-                            stream_id) + "Owner ID: " + str(participant_id) + "Files: " + str(
-                            object_name) + " - Exception: " + str(ex), error_type=self.obj.logtypes.DEBUG)
-        return success
+    def list_stream_files(self, owner_id: uuid = None, stream_id: uuid = None,
+                          bucket_name: str = None) -> Iterator[tuple]:
+        """
+        Iterate the objects of streams, all objects are found with list requests of one prefix
+        :param owner_id: only list streams of this owner, all owners if None
+        :param stream_id: only list this stream, all streams if None
+        :param bucket_name:
+        :return: iterator of (owner_id, stream_id, names) tuples, names are relative to the stream prefix
+        :rtype: Iterator[tuple]
+        """
+        prefix = self.obj.minio_dir_prefix
+        if owner_id is not None:
+            prefix += str(owner_id) + "/"
+            if stream_id is not None:
+                prefix += str(stream_id) + "/"
+        stream_objects = {}
+        for object_name in self.obj.ObjectData.get_object_names(bucket_name, prefix):
+            parts = object_name[len(self.obj.minio_dir_prefix):].split("/", 2)
+            if len(parts) < 3 or (stream_id is not None and parts[1] != str(stream_id)):
+                continue
+            stream_objects.setdefault((parts[0], parts[1]), []).append(parts[2])
+        for (owner, stream), names in sorted(stream_objects.items()):
+            yield owner, stream, names
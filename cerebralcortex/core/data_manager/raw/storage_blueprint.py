@@ -24,51 +24,470 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
+import traceback
 import uuid
-from datetime import datetime
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, ExitStack
+from datetime import datetime, timedelta
+from typing import Iterator, List
 
 from cerebralcortex.core.datatypes.datapoint import DataPoint
+from cerebralcortex.core.data_manager.raw.day_file_format import FILE_EXTENSIONS, APPEND_MODE, get_day_file_names, \
+    iter_day_file_blocks, get_days_to_compact, get_segment_name, is_day_file, deserialize_day_file, get_block_window, \
+    MAX_UTC_OFFSET
 
 
 class BlueprintStorage():
+    '''Stores each stream-day as a day file (<stream dir>/<day>.<extension>) and the segments of the day file
+    (<stream dir>/<day>/<segment>, see APPEND_MODE). Reading, writing and compacting day files is implemented on the
+    storage primitives (connect, get_stream_dir, list_files, open_day_file, write_day_file_contents, remove_files and
+    list_stream_files), a new storage layer only implements these.'''
+
+    # name of the storage in log messages
+    storage_name = "NoSQL storage"
+    # the UTC days of a local day are read concurrently, for storages whose requests are latency bound
+    concurrent_reads = False
 
     def __init__(self, obj):
         self.obj = obj
 
+    ###################################################################
+    ################## STORAGE PRIMITIVES #############################
+    ###################################################################
+
+    @contextmanager
+    def connect(self, write: bool = False):
+        """
+        Context manager of the connection object passed to the other storage primitives
+        :param write: connection is used to write (e.g., AWS-S3 output bucket)
+        :return: connection object, None if the storage needs none
+        """
+        yield None
+
+    @contextmanager
+    def use_connection(self, connection: object = None):
+        """
+        Context manager of a connection object passed by the caller, or of a new connection (see connect)
+        :param connection: connection of the caller, None opens a new connection
+        :return: connection object
+        """
+        if connection is None:
+            with self.connect() as connection:
+                yield connection
+        else:
+            yield connection
+
+    def get_stream_dir(self, owner_id: uuid, stream_id: uuid) -> str:
+        """
+        :param owner_id:
+        :param stream_id:
+        :return: path of the directory of a stream, ends with /
+        :rtype: str
+        """
+        # TODO: implement your own storage layer
+        pass
+
+    def list_files(self, dirname: str, filenames: List[str], connection: object) -> dict:
+        """
+        Returns the files of a directory and the files of a list that exist, with their versions. A version changes
+        when the file is rewritten, e.g., (modification time, size)
+        :param dirname: directory to list, can be missing
+        :param filenames: paths to check
+        :param connection: see connect
+        :return: {file path: version}
+        :rtype: dict
+        """
+        # TODO: implement your own storage layer
+        pass
+
+    def open_day_file(self, filename: str, connection: object, version: tuple = None) -> object:
+        """
+        Open a day file for reading
+        :param filename:
+        :param connection: see connect
+        :param version: version of the file returned by list_files, None if unknown
+        :return: seekable file object, None if the file does not exist
+        :rtype: object
+        """
+        # TODO: implement your own storage layer
+        pass
+
+    def write_day_file_contents(self, filename: str, data: List[DataPoint], connection: object) -> int:
+        """
+        Encode DataPoints in the configured format and replace the file, readers shall never see a partially written
+        file
+        :param filename:
+        :param data: sorted and unique list of DataPoints
+        :param connection: see connect
+        :return: size of the file in bytes
+        :rtype: int
+        """
+        # TODO: implement your own storage layer
+        pass
+
+    def remove_files(self, filenames: List[str], dirname: str, connection: object):
+        """
+        Remove files and their directory if it is empty afterwards. Missing files are ignored
+        :param filenames:
+        :param dirname: directory of the segments of the files
+        :param connection: see connect
+        """
+        # TODO: implement your own storage layer
+        pass
+
+    def list_stream_files(self, owner_id: uuid = None, stream_id: uuid = None,
+                          connection: object = None) -> Iterator[tuple]:
+        """
+        Iterate the files of streams
+        :param owner_id: only list streams of this owner, all owners if None
+        :param stream_id: only list this stream, all streams if None
+        :param connection: see connect
+        :return: iterator of (owner_id, stream_id, names) tuples, names are relative to the stream directory (e.g.,
+        20180221.pickle or 20180221/<segment>.gz)
+        :rtype: Iterator[tuple]
+        """
+        # TODO: implement your own storage layer
+        pass
+
     ###################################################################
     ################## GET DATA METHODS ###############################
     ###################################################################
 
     def read_file(self, owner_id: uuid, stream_id: uuid, day: str, start_time: datetime = None,
-                  end_time: datetime = None, localtime: bool = True) -> List[DataPoint]:
+                  end_time: datetime = None, localtime: bool = True, columnar: bool = False) -> List[DataPoint]:
         """
-        Read data from a NoSQL storage
+        Read and Process (read, unzip, unpickle, remove duplicates) data from a NoSQL storage
         :param owner_id:
         :param stream_id:
         :param day: format (YYYYMMDD)
         :param start_time:
         :param end_time:
         :param localtime:
+        :param columnar: return DataColumns instead of a list of DataPoints
         :return: returns unique (based on start time) list of DataPoints
         :rtype: DataPoint
         """
-        # TODO: implement your own storage layer to read data
-        pass
+        with self.connect() as connection:
+            if localtime:
+                days = [datetime.strftime(datetime.strptime(day, '%Y%m%d') - timedelta(hours=24), "%Y%m%d"), day,
+                        datetime.strftime(datetime.strptime(day, '%Y%m%d') + timedelta(hours=24), "%Y%m%d")]
+                day_start_time = datetime.strptime(day, '%Y%m%d')
+                day_end_time = day_start_time + timedelta(hours=24)
+                block_start, block_end = get_block_window(start_time if start_time is not None else day_start_time,
+                                                          end_time if end_time is not None else day_end_time, localtime)
+
+                def read_day(d):
+                    try:
+                        data = self.read_day_file(owner_id, stream_id, d, start_time=block_start, end_time=block_end,
+                                                  columnar=columnar, connection=connection)
+                    except Exception as e:
+                        self.obj.logging.log(
+                            error_message="Error! cannot read/decode day file. STREAM ID: " + str(stream_id) + " DAY: " + str(d) + " --- " + str(traceback.format_exc())+" - Exception: "+str(e),
+                            error_type=self.obj.logtypes.CRITICAL)
+                        return None
+                    if len(data) == 0:
+                        return None
+                    # only DataPoints within MAX_UTC_OFFSET of the local day can be in it, skip converting the others
+                    data = self.obj.subset_data(data, day_start_time - MAX_UTC_OFFSET, day_end_time + MAX_UTC_OFFSET)
+                    clean_data = self.obj.convert_to_localtime(data, localtime)
+                    return self.obj.subset_data(clean_data, day_start_time, day_end_time)
+
+                if self.concurrent_reads and self.obj.read_workers > 1:
+                    with ThreadPoolExecutor(max_workers=len(days)) as executor:
+                        day_blocks = list(executor.map(read_day, days))
+                else:
+                    day_blocks = [read_day(d) for d in days]
+                day_blocks = [day_block for day_block in day_blocks if day_block is not None]
+
+                day_block = self.obj.merge_day_blocks(day_blocks)
+                if start_time is not None or end_time is not None:
+                    day_block = self.obj.subset_data(day_block, start_time, end_time)
+                return day_block
+            else:
+                try:
+                    block_start, block_end = get_block_window(start_time, end_time)
+                    data = self.read_day_file(owner_id, stream_id, day, start_time=block_start, end_time=block_end,
+                                              columnar=columnar, connection=connection)
+                    if len(data) > 0:
+                        #clean_data = self.obj.filter_sort_datapoints(data) TODO: Remove after testing. Already sorted and dedup during storage of data
+                        clean_data = self.obj.convert_to_localtime(data, localtime)
+                        if start_time is not None or end_time is not None:
+                            clean_data = self.obj.subset_data(clean_data, start_time, end_time)
+                        return clean_data
+                    else:
+                        return []
+                except Exception as e:
+                    self.obj.logging.log(
+                        error_message="Error loading from " + self.storage_name + ": Cannot parse row. " + str(traceback.format_exc())+" - Exception: "+str(e),
+                        error_type=self.obj.logtypes.CRITICAL)
+                    return []
+
+    def read_day_file(self, owner_id: uuid, stream_id: uuid, day: str, filenames: List[str] = None,
+                      start_time: int = None, end_time: int = None, columnar: bool = False,
+                      file_versions: dict = None, connection: object = None) -> List[DataPoint]:
+        """
+        Read and decode the day file of any supported format (.pickle, .gz, .parquet or .arrow) of a stream-day and
+        merge its segments
+        :param owner_id:
+        :param stream_id:
+        :param day: format (YYYYMMDD)
+        :param filenames: day file and segments to read, all files of the day (cached, see DayBlockCache) if None
+        :param start_time: only decode blocks after this time, microseconds since epoch (UTC)
+        :param end_time: only decode blocks before this time, microseconds since epoch (UTC)
+        :param columnar: return DataColumns instead of a list of DataPoints
+        :param file_versions: {file path: version} of the listed files, see list_files
+        :param connection: see connect, a new connection if None
+        :return: unique and sorted list of DataPoints stored for the day, empty list if there is no file
+        :rtype: List[DataPoint]
+        :raises FileNotFoundError: if a file of filenames does not exist, or if a listed file is removed twice while the
+        day is read
+        """
+        with self.use_connection(connection) as connection:
+            if filenames is None:
+                # a compaction removes the segments it merged, the day is listed and read once more if a listed file
+                # was removed before it was read
+                for attempt in range(2):
+                    file_versions = self.list_day_files(owner_id, stream_id, day, connection)
+                    versions = tuple((filename,) + tuple(version) for filename, version in file_versions.items()) \
+                        if self.obj.day_cache.enabled else None
+                    try:
+                        return self.obj.read_cached_day_block(
+                            owner_id, stream_id, day, versions, start_time, end_time, columnar,
+                            lambda block_start, block_end, file_versions=file_versions: self.read_day_file(
+                                owner_id, stream_id, day, list(file_versions), block_start, block_end, columnar,
+                                file_versions, connection))
+                    except FileNotFoundError:
+                        if attempt > 0:
+                            raise
+            blocks = []
+            file_versions = file_versions or {}
+            for filename in filenames:
+                day_file = self.open_day_file(filename, connection, file_versions.get(filename))
+                if day_file is None:
+                    raise FileNotFoundError("Day file was removed while the stream-day was read: " + str(filename))
+                with day_file:
+                    blocks.append(deserialize_day_file(day_file, filename, start_time, end_time, columnar,
+                                                       self.obj.day_file_codec))
+            if len(blocks) == 0:
+                return []
+            return self.obj.merge_day_blocks(blocks)
+
+    def iter_day_file(self, owner_id: uuid, stream_id: uuid, day: str, start_time: int = None,
+                      end_time: int = None) -> Iterator[List[DataPoint]]:
+        """
+        Iterate unique DataPoints of a stream-day in time order, used by iter_stream. Files are decoded one block at a
+        time
+        :param owner_id:
+        :param stream_id:
+        :param day: format (YYYYMMDD)
+        :param start_time: only decode blocks after this time, microseconds since epoch (UTC)
+        :param end_time: only decode blocks before this time, microseconds since epoch (UTC)
+        :return: iterator of sorted lists of DataPoints, may contain DataPoints outside of the window
+        :rtype: Iterator[List[DataPoint]]
+        :raises FileNotFoundError: if a listed file is removed twice while the day is opened
+        """
+        with self.connect() as connection:
+            # all files are opened before the first block is returned, the day is listed and opened once more if a
+            # compaction removed a listed file before it was opened
+            for attempt in range(2):
+                file_versions = self.list_day_files(owner_id, stream_id, day, connection)
+                try:
+                    day_files = self.open_day_files(file_versions, connection)
+                    break
+                except FileNotFoundError:
+                    if attempt > 0:
+                        raise
+            with ExitStack() as stack:
+                for day_file in day_files:
+                    stack.enter_context(day_file)
+                yield from self.obj.merge_block_iterators([iter_day_file_blocks(day_file, filename, start_time,
+                                                                                end_time, self.obj.day_file_codec)
+                                                           for filename, day_file in zip(file_versions, day_files)])
+
+    def open_day_files(self, file_versions: dict, connection: object) -> list:
+        """
+        Open all files of a stream-day for reading
+        :param file_versions: {file path: version} of the files, see list_day_files
+        :param connection: see connect
+        :return: list of seekable file objects in the order of file_versions
+        :rtype: list
+        :raises FileNotFoundError: if a file does not exist, files opened before are closed
+        """
+        day_files = []
+        try:
+            for filename, version in file_versions.items():
+                day_file = self.open_day_file(filename, connection, version)
+                if day_file is None:
+                    raise FileNotFoundError("Day file was removed while the stream-day was read: " + str(filename))
+                day_files.append(day_file)
+        except BaseException:
+            for day_file in day_files:
+                day_file.close()
+            raise
+        return day_files
+
+    def get_day_files(self, owner_id: uuid, stream_id: uuid, day: str, connection: object = None) -> List[str]:
+        """
+        Returns paths of the segments (newest first) and the day file of a stream-day
+        :param owner_id:
+        :param stream_id:
+        :param day: format (YYYYMMDD)
+        :param connection: see connect, a new connection if None
+        :return: list of file paths
+        :rtype: List[str]
+        """
+        with self.use_connection(connection) as connection:
+            return list(self.list_day_files(owner_id, stream_id, day, connection))
+
+    def list_day_files(self, owner_id: uuid, stream_id: uuid, day: str, connection: object) -> dict:
+        """
+        Returns paths of the segments (newest first) and the day file of a stream-day with their versions
+        :param owner_id:
+        :param stream_id:
+        :param day: format (YYYYMMDD)
+        :param connection: see connect
+        :return: {file path: version}, see list_files
+        :rtype: dict
+        """
+        if not self.obj.has_stream_day(stream_id, day):
+            # the stream-day manifest has no entry for the day, skip the storage requests
+            return {}
+        dirname = self.get_stream_dir(owner_id, stream_id)
+        day_file_names = [dirname + day_file for day_file in get_day_file_names(day, self.obj.day_file_format)]
+        listed_files = self.list_files(dirname + str(day) + "/", day_file_names, connection)
+        file_versions = {}
+        for filename in sorted(listed_files, reverse=True):
+            if filename.startswith(dirname + str(day) + "/") and is_day_file(filename):
+                file_versions[filename] = listed_files[filename]
+        for filename in day_file_names:
+            if filename in listed_files:
+                file_versions[filename] = listed_files[filename]
+        return file_versions
 
     ###################################################################
     ################## STORE DATA METHODS #############################
     ###################################################################
 
+    def get_compaction_candidates(self, owner_id: uuid = None, stream_id: uuid = None) -> List[tuple]:
+        """
+        Returns stream-days that have segments, legacy .pickle files or day files of another format than the configured one
+        :param owner_id: only check streams of this owner, all owners if None
+        :param stream_id: only check this stream, all streams if None
+        :return: list of (owner_id, stream_id, day) tuples
+        :rtype: List[tuple]
+        """
+        candidates = []
+        with self.connect(write=True) as connection:
+            for owner, stream, names in self.list_stream_files(owner_id, stream_id, connection):
+                for day in get_days_to_compact(names, self.obj.day_file_format):
+                    candidates.append((owner, stream, day))
+        return candidates
+
     def write_file(self, participant_id: uuid, stream_id: uuid, data: List[DataPoint]) -> bool:
         """
-        Stores data to NoSQL storage.
+        Stores data to NoSQL storage. If data contains multiple days then one file will be created for each day.
+        In append write mode, data of each day is stored as a new segment (<day>/<segment>) of the day file.
         :param participant_id:
         :param stream_id:
         :param data:
         :return True if data is successfully stored
         :rtype bool
         """
+        outputdata = {}
+        success = False
 
-        # TODO: implement your own storage layer to write data
-        pass
+        # Data Processing loop
+        for row in data:
+            day = row.start_time.strftime("%Y%m%d")
+            if day not in outputdata:
+                outputdata[day] = []
+            outputdata[day].append(row)
+
+        # Data Write loop
+        with self.connect(write=True) as connection:
+            for day, dps in outputdata.items():
+                if len(dps) > 0:
+                    if self.obj.day_file_write_mode == APPEND_MODE:
+                        success = self.write_segment(participant_id, stream_id, day, dps, connection)
+                    else:
+                        success = self.rewrite_day_file(participant_id, stream_id, day, dps, connection)
+                    self.obj.day_cache.invalidate(participant_id, stream_id, day)
+        return success
+
+    def write_segment(self, participant_id: uuid, stream_id: uuid, day: str, data: List[DataPoint],
+                      connection: object) -> bool:
+        """
+        Stores DataPoints of a day as a new segment of the day file
+        :param participant_id:
+        :param stream_id:
+        :param day: format (YYYYMMDD)
+        :param data: DataPoints of the day
+        :param connection: see connect
+        :return True if data is successfully stored
+        :rtype bool
+        """
+        filename = self.get_stream_dir(participant_id, stream_id) + str(day) + "/" + get_segment_name(
+            self.obj.day_file_format)
+        try:
+            data = self.obj.filter_sort_datapoints(data)
+            size = self.write_day_file_contents(filename, data, connection)
+            self.obj.record_stream_day(participant_id, stream_id, day, filename, data, size)
+            return True
+        except Exception as ex:
+            self.obj.logging.log(
+                error_message="Error in writing data to " + self.storage_name + ". STREAM ID: " + str(
+                    stream_id) + "Owner ID: " + str(participant_id) + "Files: " + str(
+                    filename) + " - Exception: " + str(ex), error_type=self.obj.logtypes.DEBUG)
+            return False
+
+    def rewrite_day_file(self, participant_id: uuid, stream_id: uuid, day: str, data: List[DataPoint],
+                         connection: object, newer: bool = True) -> bool:
+        """
+        Merge DataPoints with the day file and all its segments, store the result as one day file of the configured
+        format and remove the merged segments and files
+        :param participant_id:
+        :param stream_id:
+        :param day: format (YYYYMMDD)
+        :param data: new DataPoints of the day, can be empty
+        :param connection: see connect
+        :param newer: on equal start times DataPoints of data replace the stored ones, stored DataPoints are kept if
+        False (e.g., older DataPoints moved between tiers)
+        :return True if data is successfully stored
+        :rtype bool
+        """
+        dirname = self.get_stream_dir(participant_id, stream_id)
+        filename = dirname + str(day) + FILE_EXTENSIONS[self.obj.day_file_format]
+        try:
+            merged_files = self.get_day_files(participant_id, stream_id, day, connection)
+            blocks = [self.obj.filter_sort_datapoints(data),
+                      self.read_day_file(participant_id, stream_id, day, merged_files, connection=connection)]
+            data = self.obj.merge_day_blocks(blocks if newer else blocks[::-1])
+            if len(data) == 0:
+                return False
+            size = self.write_day_file_contents(filename, data, connection)
+
+            # remove segments and files of other formats, their data is merged in the new day file
+            self.remove_files([merged_file for merged_file in merged_files if merged_file != filename],
+                              dirname + str(day), connection)
+            self.obj.record_stream_day(participant_id, stream_id, day, filename, data, size, replace=True)
+            return True
+        except Exception as ex:
+            self.obj.logging.log(
+                error_message="Error in writing data to " + self.storage_name + ". STREAM ID: " + str(
+                    stream_id) + "Owner ID: " + str(participant_id) + "Files: " + str(
+                    filename) + " - Exception: " + str(ex), error_type=self.obj.logtypes.DEBUG)
+            return False
+
+    def compact_day_file(self, owner_id: uuid, stream_id: uuid, day: str) -> bool:
+        """
+        Merge segments and legacy files of a stream-day into one sorted and unique day file of the configured format
+        :param owner_id:
+        :param stream_id:
+        :param day: format (YYYYMMDD)
+        :return True if the day was compacted
+        :rtype bool
+        """
+        with self.connect(write=True) as connection:
+            compacted = self.rewrite_day_file(owner_id, stream_id, day, [], connection)
+            self.obj.day_cache.invalidate(owner_id, stream_id, day)
+            return compacted
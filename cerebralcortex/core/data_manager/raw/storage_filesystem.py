@@ -24,178 +24,152 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
-import gzip
 import os
-import pickle
-import traceback
+import threading
 import uuid
-from datetime import datetime, timedelta
-from typing import List
+from typing import Iterator, List
+
+import pyarrow
 
 from cerebralcortex.core.datatypes.datapoint import DataPoint
-from cerebralcortex.core.util.data_types import deserialize_obj
+from cerebralcortex.core.data_manager.raw.day_file_format import serialize_day_file
+from cerebralcortex.core.data_manager.raw.storage_blueprint import BlueprintStorage
+
+class FileSystemStorage(BlueprintStorage):
+
+    storage_name = "FileSystem"
 
-class FileSystemStorage():
-    
     def __init__(self, obj):
         self.obj = obj
 
     ###################################################################
-    ################## GET DATA METHODS ###############################
+    ################## STORAGE PRIMITIVES #############################
     ###################################################################
 
-    def read_file(self, owner_id: uuid, stream_id: uuid, day: str, start_time: datetime = None,
-                                 end_time: datetime = None, localtime: bool = True) -> List[DataPoint]:
+    def get_stream_dir(self, owner_id: uuid, stream_id: uuid) -> str:
         """
-        Read and Process (read, unzip, unpickle, remove duplicates) data from a file system
         :param owner_id:
         :param stream_id:
-        :param day: format (YYYYMMDD)
-        :param start_time:
-        :param end_time:
-        :param localtime:
-        :return: returns unique (based on start time) list of DataPoints
-        :rtype: DataPoint
+        :return: path of the directory of a stream, ends with /
+        :rtype: str
         """
-        if localtime:
-            days = [datetime.strftime(datetime.strptime(day, '%Y%m%d') - timedelta(hours=24), "%Y%m%d"), day,
-                    datetime.strftime(datetime.strptime(day, '%Y%m%d') + timedelta(hours=24), "%Y%m%d")]
-            day_start_time = datetime.strptime(day, '%Y%m%d')
-            day_end_time = day_start_time + timedelta(hours=24)
-            day_block = []
-            for d in days:
-                data = None
-                filename = self.obj.filesystem_path + str(owner_id) + "/" + str(stream_id) + "/" + str(d) + ".pickle"
-                gz_filename = filename.replace(".pickle", ".gz")
-                if os.path.exists(filename):
-                    curfile = open(filename, "rb")
-                    data = curfile.read()
-                    curfile.close()
-                elif os.path.exists(gz_filename):
-                    curfile = open(gz_filename, "rb")
-                    data = curfile.read()
-                    curfile.close()
-                    if data is not None and data != b'':
-                        try:
-                            data = gzip.decompress(data)
-                            data = deserialize_obj(data)
-                        except:
-                            self.obj.logging.log(
-                                error_message="Error! cannot decompress GZ file. FILE: "+gz_filename+" --- " + str(traceback.format_exc()),
-                                error_type=self.obj.logtypes.CRITICAL)
-                            #os.remove(gz_filename)
-                    
-                if data is not None and data != b'':
-                    #clean_data = self.obj.filter_sort_datapoints(data) TODO: Remove after testing. Already sorted and dedup during storage of data
-                    self.obj.compress_store_pickle(filename, data)
-                    clean_data = self.obj.convert_to_localtime(data, localtime)
-                    # day_start_time = datetime.fromtimestamp(day_start_time.timestamp(), clean_data[0].start_time.tzinfo)
-                    # day_end_time = datetime.fromtimestamp(day_end_time.timestamp(), clean_data[0].start_time.tzinfo)
-                    day_block.extend(self.obj.subset_data(clean_data, day_start_time, day_end_time))
-
-            day_block = self.obj.filter_sort_datapoints(day_block)
-            if start_time is not None or end_time is not None:
-                day_block = self.obj.subset_data(day_block, start_time, end_time)
-            return day_block
-        else:
-            filename = self.obj.filesystem_path + str(owner_id) + "/" + str(stream_id) + "/" + str(day) + ".pickle"
-            gz_filename = filename.replace(".pickle", ".gz")
-            data = None
+        return self.obj.filesystem_path + str(owner_id) + "/" + str(stream_id) + "/"
 
+    def list_files(self, dirname: str, filenames: List[str], connection: object) -> dict:
+        """
+        Returns the files of a directory and the files of a list that exist, with their modification time and size
+        :param dirname: directory to list, can be missing
+        :param filenames: paths to check
+        :param connection: not used
+        :return: {file path: (modification time, size)}
+        :rtype: dict
+        """
+        try:
+            paths = [dirname + name for name in os.listdir(dirname)]
+        except FileNotFoundError:
+            paths = []
+        file_versions = {}
+        for path in paths + filenames:
             try:
-                if os.path.exists(filename):
-                    curfile = open(filename, "rb")
-                    data = curfile.read()
-                    curfile.close()
-                elif os.path.exists(gz_filename):
-                    curfile = open(gz_filename, "rb")
-                    data = curfile.read()
-                    curfile.close()
-                    try:
-                        data = gzip.decompress(data)
-                        data = deserialize_obj(data)
-                    except:
-                        self.obj.logging.log(
-                            error_message="Error! cannot decompress GZ file and/or unpicle file. FILE: "+gz_filename+" --- " + str(traceback.format_exc()),
-                            error_type=self.obj.logtypes.CRITICAL)
-                        #os.remove(gz_filename)
-                    
-                else:
-                    return []
-                if data is not None and data != b'':
-                    #clean_data = self.obj.filter_sort_datapoints(data) TODO: Remove after testing. Already sorted and dedup during storage of data
-                    self.obj.compress_store_pickle(filename, data)
-                    clean_data = self.obj.convert_to_localtime(data, localtime)
-                    if start_time is not None or end_time is not None:
-                        clean_data = self.obj.subset_data(clean_data, start_time, end_time)
-                    return clean_data
-                else:
-                    return []
-            except Exception as e:
-                self.obj.logging.log(
-                    error_message="Error loading from FileSystem: Cannot parse row. " + str(traceback.format_exc()),
-                    error_type=self.obj.logtypes.CRITICAL)
-                return []
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            file_versions[path] = (stat.st_mtime_ns, stat.st_size)
+        return file_versions
 
-    ###################################################################
-    ################## STORE DATA METHODS #############################
-    ###################################################################
-
-    def write_file(self, participant_id: uuid, stream_id: uuid, data: List[DataPoint]) -> bool:
+    def open_day_file(self, filename: str, connection: object, version: tuple = None) -> object:
         """
-        Stores data in file system. If data contains multiple days then one file will be created for each day
-        :param participant_id:
-        :param stream_id:
-        :param data:
-        :return True if data is successfully stored
-        :rtype bool
+        Open a day file for reading
+        :param filename:
+        :param connection: not used
+        :param version: not used
+        :return: memory mapped file, None if the file does not exist
+        :rtype: object
         """
-        existing_data = None
-        outputdata = {}
-        success = False
+        try:
+            # day files are decoded from the page cache without reading them into python objects first
+            return pyarrow.memory_map(filename)
+        except FileNotFoundError:
+            return None
 
-        # Data Processing loop
-        for row in data:
-            day = row.start_time.strftime("%Y%m%d")
-            if day not in outputdata:
-                outputdata[day] = []
-            outputdata[day].append(row)
-
-        # Data Write loop
-        for day, dps in outputdata.items():
-            existing_data = None
-            filename = self.obj.filesystem_path + str(participant_id) + "/" + str(stream_id)
-            if not os.path.exists(filename):
-                os.makedirs(filename, exist_ok=True)
-            filename = filename + "/" + str(day) + ".gz"
-            if len(dps) > 0:
+    def write_day_file_contents(self, filename: str, data: List[DataPoint], connection: object) -> int:
+        """
+        Encode DataPoints in the configured format and write them to a temporary file first, so readers never see a
+        partially written day file
+        :param filename:
+        :param data: sorted and unique list of DataPoints
+        :param connection: not used
+        :return: size of the day file in bytes
+        :rtype: int
+        """
+        # one temporary file per writer, e.g., compaction and ingestion of the same day
+        tmp_filename = filename + "." + str(os.getpid()) + "." + str(threading.get_ident()) + ".tmp"
+        try:
+            contents = serialize_day_file(data, self.obj.day_file_format, self.obj.day_file_block_size,
+                                          self.obj.day_file_codec)
+            for attempt in range(2):
+                os.makedirs(os.path.dirname(filename), exist_ok=True)
                 try:
-                    if os.path.exists(filename):
-                        curfile = open(filename, "rb")
-                        existing_data = curfile.read()
-                        curfile.close()
-                    if existing_data is not None and existing_data != b'':
-                        existing_data = gzip.decompress(existing_data)
-                        existing_data = pickle.loads(existing_data)
-                        dps.extend(existing_data)
-                        # dps = existing_data
-                    dps = self.obj.filter_sort_datapoints(dps)
-                    f = open(filename, "wb")
-                    dps = pickle.dumps(dps)
-                    dps = gzip.compress(dps)
-                    f.write(dps)
-                    f.close()
-                    if os.path.exists(filename.replace(".gz", ".pickle")):
-                        os.remove(filename.replace(".gz", ".pickle"))
-                    success = True
-                except Exception as ex:
-                    # delete file if file was opened and no data was written to it
-                    if os.path.exists(filename):
-                        if os.path.getsize(filename) == 0:
-                            os.remove(filename)
-                    self.obj.logging.log(
-                        error_message="Error in writing data to FileSystem. STREAM ID: " + str(
-                            stream_id) + "Owner ID: " + str(participant_id) + "Files: " + str(
-                            filename) + " - Exception: " + str(ex), error_type=self.obj.logtypes.DEBUG)
-        return success
+                    f = open(tmp_filename, "wb")
+                    break
+                except FileNotFoundError:
+                    # a compaction removed the empty segment directory of the day
+                    if attempt > 0:
+                        raise
+            with f:
+                f.write(contents)
+            os.replace(tmp_filename, filename)
+            return len(contents)
+        finally:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+
+    def remove_files(self, filenames: List[str], dirname: str, connection: object):
+        """
+        Remove files and their directory if it is empty afterwards. Missing files are ignored
+        :param filenames:
+        :param dirname: directory of the segments of the files
+        :param connection: not used
+        """
+        for filename in filenames:
+            if os.path.exists(filename):
+                os.remove(filename)
+        if os.path.isdir(dirname) and not os.listdir(dirname):
+            try:
+                os.rmdir(dirname)
+            except OSError:
+                # a segment was written in the meantime
+                pass
 
+    def list_stream_files(self, owner_id: uuid = None, stream_id: uuid = None,
+                          connection: object = None) -> Iterator[tuple]:
+        """
+        Iterate the files of streams
+        :param owner_id: only list streams of this owner, all owners if None
+        :param stream_id: only list this stream, all streams if None
+        :param connection: not used
+        :return: iterator of (owner_id, stream_id, names) tuples, names are relative to the stream directory
+        :rtype: Iterator[tuple]
+        """
+        if owner_id is not None:
+            owners = [str(owner_id)]
+        elif os.path.isdir(self.obj.filesystem_path):
+            owners = sorted(os.listdir(self.obj.filesystem_path))
+        else:
+            owners = []
+        for owner in owners:
+            owner_dir = self.obj.filesystem_path + owner + "/"
+            if not os.path.isdir(owner_dir):
+                continue
+            streams = [str(stream_id)] if stream_id is not None else sorted(os.listdir(owner_dir))
+            for stream in streams:
+                stream_dir = owner_dir + stream + "/"
+                if not os.path.isdir(stream_dir):
+                    continue
+                names = []
+                for name in os.listdir(stream_dir):
+                    if os.path.isdir(stream_dir + name):
+                        names.extend([name + "/" + segment for segment in os.listdir(stream_dir + name)])
+                    else:
+                        names.append(name)
+                yield owner, stream, names
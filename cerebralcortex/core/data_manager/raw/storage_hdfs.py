@@ -23,198 +23,237 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-import gzip
-import pickle
-import traceback
+import posixpath
 import uuid
-from datetime import datetime, timedelta
-from typing import List
-
-import pyarrow
+from typing import Iterator, List
 
 from cerebralcortex.core.datatypes.datapoint import DataPoint
-from cerebralcortex.core.util.data_types import deserialize_obj
+from cerebralcortex.core.data_manager.raw.day_file_format import serialize_day_file
+from cerebralcortex.core.data_manager.raw.storage_blueprint import BlueprintStorage
+
+# suffix of a replaced day file, it is renamed aside into the segment directory of the day until the new file took its
+# name (<day dir>/<day file name>.<id>.old)
+REPLACED_FILE_SUFFIX = ".old"
+
+
+def get_file_version(info: dict) -> tuple:
+    """
+    Returns the version of a HDFS file, used to detect changed files
+    :param info: file entry of ls(detail=True) or info()
+    :return: (modification time, size)
+    :rtype: tuple
+    """
+    # ls names the modification time last_modified_time, info names it last_modified
+    return info.get("last_modified_time", info.get("last_modified")), info.get("size")
+
 
-class HDFSStorage():
+class HDFSStorage(BlueprintStorage):
+
+    storage_name = "HDFS"
 
     def __init__(self, obj):
         self.obj = obj
 
-    def read_file(self, owner_id: uuid, stream_id: uuid, day: str, start_time: datetime = None,
-                           end_time: datetime = None, localtime: bool = False) -> List[DataPoint]:
+    ###################################################################
+    ################## STORAGE PRIMITIVES #############################
+    ###################################################################
+
+    def connect(self, write: bool = False):
+        """
+        Context manager of a pooled HDFS connection (libhdfs)
+        :param write: not used
+        :return: hdfs connection object
+        """
+        return self.obj.hdfs_pool.connection()
+
+    def get_stream_dir(self, owner_id: uuid, stream_id: uuid) -> str:
         """
-        Read and Process (read, unzip, unpickle, remove duplicates) data from HDFS
         :param owner_id:
         :param stream_id:
-        :param day: format (YYYYMMDD)
-        :param start_time:
-        :param end_time:
-        :param localtime:
-        :return: returns unique (based on start time) list of DataPoints
-        :rtype: DataPoint
-        """
-        # Using libhdfs,
-        hdfs = pyarrow.hdfs.connect(self.obj.hdfs_ip, self.obj.hdfs_port)
-
-        if localtime:
-            days = [datetime.strftime(datetime.strptime(day, '%Y%m%d') - timedelta(hours=24), "%Y%m%d"), day,
-                    datetime.strftime(datetime.strptime(day, '%Y%m%d') + timedelta(hours=24), "%Y%m%d")]
-            day_start_time = datetime.strptime(day, '%Y%m%d')
-            day_end_time = day_start_time + timedelta(hours=24)
-            day_block = []
-            for d in days:
-
-                filename = self.obj.raw_files_dir + str(owner_id) + "/" + str(stream_id) + "/" + str(d) + ".pickle"
-                gz_filename = filename.replace(".pickle", ".gz")
-                data = None
-                if hdfs.exists(filename):
-                    try:
-                        curfile = hdfs.open(filename, "rb")
-                        data = curfile.read()
-                    except Exception as e:
-                        self.obj.logging.log(
-                            error_message="Error! cannot open file: "+gz_filename+" --- " + str(traceback.format_exc())+" - Exception: "+str(e),
-                            error_type=self.obj.logtypes.CRITICAL)
-                    #curfile.close()
-                elif hdfs.exists(gz_filename):
-                    try:
-                        curfile = hdfs.open(gz_filename, "rb")
-                        data = curfile.read()
-                    except Exception as e:
-                        self.obj.logging.log(
-                            error_message="Error! cannot open file: "+gz_filename+" --- " + str(traceback.format_exc())+" - Exception: "+str(e),
-                            error_type=self.obj.logtypes.CRITICAL)
-                    #curfile.close()
-                    if data is not None and data != b'':
-                        try:
-                            data = gzip.decompress(data)
-                            data = deserialize_obj(data)
-                        except Exception as e:
-                            self.obj.logging.log(
-                                error_message="Error! cannot decompress GZ file. FILE: "+gz_filename+" --- " + str(traceback.format_exc())+" - Exception: "+str(e),
-                                error_type=self.obj.logtypes.CRITICAL)
-                        #curfile.close()
-                        #hdfs.delete(gz_filename)
-
-                if data is not None and data != b'':
-                    #clean_data = self.obj.filter_sort_datapoints(data)
-                    self.obj.compress_store_pickle(filename, data, hdfs)
-                    clean_data = self.obj.convert_to_localtime(data, localtime)
-                    day_block.extend(self.obj.subset_data(clean_data, day_start_time, day_end_time))
-            day_block = self.obj.filter_sort_datapoints(day_block)
-            if start_time is not None or end_time is not None:
-                day_block = self.obj.subset_data(day_block, start_time, end_time)
-            return day_block
-        else:
-            filename = self.obj.raw_files_dir + str(owner_id) + "/" + str(stream_id) + "/" + str(day) + ".pickle"
-            gz_filename = filename.replace(".pickle", ".gz")
-            data = None
-            try:
-                if hdfs.exists(filename):
-                    try:
-                        curfile = hdfs.open(filename, "rb")
-                        data = curfile.read()
-                    except Exception as e:
-                        curfile.close()
-                        self.obj.logging.log(
-                            error_message="Error! cannot open file: "+gz_filename+" --- " + str(traceback.format_exc())+" - Exception: "+str(e),
-                            error_type=self.obj.logtypes.CRITICAL)
-                elif hdfs.exists(gz_filename):
-                    try:
-                        curfile = hdfs.open(gz_filename, "rb")
-                        data = curfile.read()
-                    except Exception as e:
-                        curfile.close()
-                        self.obj.logging.log(
-                            error_message="Error! cannot open file: "+gz_filename+" --- " + str(traceback.format_exc())+" - Exception: "+str(e),
-                            error_type=self.obj.logtypes.CRITICAL)
-                    try:
-                        data = gzip.decompress(data)
-                        data = deserialize_obj(data)
-                    except Exception as e:
-                        self.obj.logging.log(
-                            error_message="Error! cannot decompress GZ file. FILE: "+gz_filename+" --- " + str(traceback.format_exc())+" - Exception: "+str(e),
-                            error_type=self.obj.logtypes.CRITICAL)
-                        #hdfs.delete(gz_filename)
-                else:
-                    return []
-                if data is not None and data != b'':
-                   # clean_data = self.obj.filter_sort_datapoints(data) TODO: Remove after testing. Already sorted and dedup during storage of data
-                    self.obj.compress_store_pickle(filename, data, hdfs)
-                    clean_data = self.obj.convert_to_localtime(data, localtime)
-                    if start_time is not None or end_time is not None:
-                        clean_data = self.obj.subset_data(clean_data, start_time, end_time)
-                    return clean_data
+        :return: path of the directory of a stream, ends with /
+        :rtype: str
+        """
+        return self.obj.raw_files_dir + str(owner_id) + "/" + str(stream_id) + "/"
+
+    def list_files(self, dirname: str, filenames: List[str], hdfs: object) -> dict:
+        """
+        Returns the files of a directory and the files of a list that exist, with their modification time and size. The
+        directory is listed with one request, each file of the list is probed with one request. A missing file of the
+        list whose replaced file was left in the directory by an interrupted write is restored
+        :param dirname: directory to list, can be missing
+        :param filenames: paths to check
+        :param hdfs: hdfs connection object
+        :return: {file path: (modification time, size)}
+        :rtype: dict
+        """
+        file_versions = {}
+        try:
+            entries = hdfs.ls(dirname, detail=True)
+        except IOError:
+            # directory does not exist
+            entries = []
+        replaced_files = []
+        for entry in entries:
+            if entry["kind"] == "file":
+                name = dirname + posixpath.basename(entry["name"])
+                if name.endswith(REPLACED_FILE_SUFFIX):
+                    replaced_files.append(name)
                 else:
-                    return []
-            except Exception as e:
-                self.obj.logging.log(
-                    error_message="Error loading from HDFS: Cannot parse row. " + str(traceback.format_exc())+" - Exception: "+str(e),
-                    error_type=self.obj.logtypes.CRITICAL)
-                return []
+                    file_versions[name] = get_file_version(entry)
+        for filename in filenames:
+            try:
+                file_versions[filename] = get_file_version(hdfs.info(filename))
+            except IOError:
+                if not self.restore_replaced_file(filename, replaced_files, hdfs):
+                    continue
+                try:
+                    file_versions[filename] = get_file_version(hdfs.info(filename))
+                except IOError:
+                    continue
+        return file_versions
 
+    def restore_replaced_file(self, filename: str, replaced_files: List[str], hdfs: object) -> bool:
+        """
+        Rename a replaced day file back to its name, a write that replaced the file stopped after it renamed the file
+        aside (see write_day_file_contents)
+        :param filename: missing day file
+        :param replaced_files: replaced files of the segment directory of the day
+        :param hdfs: hdfs connection object
+        :return: True if a replaced file of the day file was found
+        :rtype: bool
+        """
+        for replaced_file in replaced_files:
+            if posixpath.basename(replaced_file).startswith(posixpath.basename(filename) + "."):
+                try:
+                    hdfs.rename(replaced_file, filename)
+                except IOError:
+                    # restored by another reader, or the write completed in the meantime
+                    pass
+                return True
+        return False
 
-    def write_file(self, participant_id: uuid, stream_id: uuid, data: List[DataPoint]) -> bool:
+    def open_day_file(self, filename: str, hdfs: object, version: tuple = None) -> object:
         """
-        Stores data in HDFS. If data contains multiple days then one file will be created for each day
-        :param participant_id:
-        :param stream_id:
-        :param data:
-        :return True if data is successfully stored
-        :rtype bool
+        Open a day file for reading. If the local disk cache is enabled and the version of the file is known, the file
+        is read from its local copy unless its size or modification time changed (see DayFileDiskCache)
+        :param filename:
+        :param hdfs: hdfs connection object
+        :param version: (modification time, size) of the file
+        :return: seekable file object, None if the file does not exist
+        :rtype: object
         """
+        if self.obj.disk_cache.enabled and version is not None:
+            def fetch():
+                remote_file = self.open_day_file(filename, hdfs)
+                if remote_file is None:
+                    return None
+                with remote_file:
+                    return remote_file.read()
 
-        # Using libhdfs
-        hdfs = pyarrow.hdfs.connect(self.obj.hdfs_ip, self.obj.hdfs_port)
-        outputdata = {}
-        success = False
+            return self.obj.disk_cache.open(
+                "hdfs://" + str(self.obj.hdfs_ip) + ":" + str(self.obj.hdfs_port) + filename, version, fetch)
+        try:
+            # a missing file fails to open, no separate existence check
+            return hdfs.open(filename, "rb")
+        except IOError:
+            return None
 
-        # Data Processing loop
-        for row in data:
-            day = row.start_time.strftime("%Y%m%d")
-            if day not in outputdata:
-                outputdata[day] = []
+    def write_day_file_contents(self, filename: str, data: List[DataPoint], hdfs: object) -> int:
+        """
+        Encode DataPoints in the configured format and write them to a temporary file first, so readers never see a
+        partially written day file. HDFS cannot rename over an existing file, a replaced day file is renamed aside into
+        the segment directory of the day and only removed once the new file took its name. If the write stops in
+        between, the next listing of the day restores the replaced file (see list_files)
+        :param filename:
+        :param data: sorted and unique list of DataPoints
+        :param hdfs: hdfs connection object
+        :return: size of the day file in bytes
+        :rtype: int
+        """
+        # one temporary file per writer, writers of a day can run on different hosts
+        tmp_filename = filename + "." + uuid.uuid4().hex + ".tmp"
+        try:
+            contents = serialize_day_file(data, self.obj.day_file_format, self.obj.day_file_block_size,
+                                          self.obj.day_file_codec)
+            with hdfs.open(tmp_filename, "wb") as f:
+                f.write(contents)
+            old_filename = None
+            if hdfs.exists(filename):
+                # segment directory of a day file <stream dir>/<day>.<extension>
+                day_dir = posixpath.dirname(filename) + "/" + posixpath.basename(filename).split(".")[0] + "/"
+                old_filename = day_dir + posixpath.basename(filename) + "." + uuid.uuid4().hex[:8] + \
+                               REPLACED_FILE_SUFFIX
+                for attempt in range(2):
+                    hdfs.mkdir(day_dir)
+                    try:
+                        hdfs.rename(filename, old_filename)
+                        break
+                    except IOError:
+                        # a compaction removed the empty segment directory of the day
+                        if attempt > 0:
+                            raise
+            try:
+                hdfs.rename(tmp_filename, filename)
+            except Exception:
+                if old_filename is not None:
+                    hdfs.rename(old_filename, filename)
+                raise
+            if old_filename is not None:
+                hdfs.delete(old_filename)
+            return len(contents)
+        finally:
+            if hdfs.exists(tmp_filename):
+                hdfs.delete(tmp_filename)
 
-            outputdata[day].append(row)
+    def remove_files(self, filenames: List[str], dirname: str, hdfs: object):
+        """
+        Remove files and their directory if it is empty afterwards. Missing files are ignored
+        :param filenames:
+        :param dirname: directory of the segments of the files
+        :param hdfs: hdfs connection object
+        """
+        for filename in filenames:
+            if hdfs.exists(filename):
+                hdfs.delete(filename)
+        if hdfs.exists(dirname) and len(hdfs.ls(dirname)) == 0:
+            hdfs.delete(dirname, recursive=True)
 
-        # Data Write loop
-        for day, dps in outputdata.items():
-            existing_data = None
-            filename = self.obj.raw_files_dir + str(participant_id) + "/" + str(stream_id) + "/" + str(day) + ".gz"
-            if len(dps) > 0:
-                try:
-                    if hdfs.exists(filename):
-                        curfile = hdfs.open(filename, "rb")
-                        existing_data = curfile.read()
-                        #curfile.close()
-                    if existing_data is not None and existing_data != b'':
-                        existing_data = gzip.decompress(existing_data)
-                        existing_data = pickle.loads(existing_data)
-                        dps.extend(existing_data)
-                        # dps = existing_data
-
-
-                    dps = self.obj.filter_sort_datapoints(dps)
-                    f = hdfs.open(filename, "wb")
-                    dps = pickle.dumps(dps)
-                    dps = gzip.compress(dps)
-                    f.write(dps)
-                    #f.close()
-
-                    if hdfs.exists(filename.replace(".gz", ".pickle")):
-                        hdfs.delete(filename.replace(".gz", ".pickle"))
-                    success = True
-                except Exception as ex:
-                    success = False
-                    # delete file if file was opened and no data was written to it
-                    if hdfs.exists(filename):
-                        if hdfs.info(filename)["size"] == 0:
-                            hdfs.delete(filename)
-                    self.obj.logging.log(
-                        error_message="Error in writing data to HDFS. STREAM ID: " + str(
-                            stream_id) + "Owner ID: " + str(participant_id) + "Files: " + str(
-                            filename) + " - Exception: " + str(ex), error_type=self.obj.logtypes.DEBUG)
-        return success
+    def list_stream_files(self, owner_id: uuid = None, stream_id: uuid = None,
+                          hdfs: object = None) -> Iterator[tuple]:
+        """
+        Iterate the files of streams
+        :param owner_id: only list streams of this owner, all owners if None
+        :param stream_id: only list this stream, all streams if None
+        :param hdfs: hdfs connection object
+        :return: iterator of (owner_id, stream_id, names) tuples, names are relative to the stream directory
+        :rtype: Iterator[tuple]
+        """
+        if owner_id is not None:
+            owners = [str(owner_id)]
+        elif hdfs.exists(self.obj.raw_files_dir):
+            owners = sorted([posixpath.basename(owner) for owner in hdfs.ls(self.obj.raw_files_dir)])
+        else:
+            owners = []
+        for owner in owners:
+            owner_dir = self.obj.raw_files_dir + owner + "/"
+            if not hdfs.exists(owner_dir):
+                continue
+            if stream_id is not None:
+                streams = [str(stream_id)]
+            else:
+                streams = sorted([posixpath.basename(stream) for stream in hdfs.ls(owner_dir)])
+            for stream in streams:
+                stream_dir = owner_dir + stream + "/"
+                if not hdfs.exists(stream_dir):
+                    continue
+                names = []
+                for entry in hdfs.ls(stream_dir, detail=True):
+                    name = posixpath.basename(entry["name"])
+                    if entry["kind"] == "directory":
+                        names.extend([name + "/" + posixpath.basename(segment) for segment in hdfs.ls(stream_dir + name)])
+                    else:
+                        names.append(name)
+                yield owner, stream, names
 
     # def get_file_contents(self, storage_type):
     #     if storage_type=="filesystem":
@@ -0,0 +1,235 @@
+# Copyright (c) 2018, MD2K Center of Excellence
+# - Nasir Ali <nasir.ali08@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterator, List
+
+from cerebralcortex.core.datatypes.datapoint import DataPoint
+from cerebralcortex.core.data_manager.raw.day_file_format import is_day_file
+
+DEFAULT_HOT_DAYS = 30
+
+
+class TieredStorage():
+
+    def __init__(self, obj, hot: object, cold: object, hot_days: int = DEFAULT_HOT_DAYS):
+        """
+        Stores recent stream-days in a hot tier (FileSystemStorage, e.g., local SSD) and older stream-days in a cold
+        tier (HDFSStorage or AwsS3Storage). Writes of days of the last hot_days days go to the hot tier, older days are
+        written to the cold tier. Demotion (see demote_day_file) moves days that became older than hot_days from the hot
+        to the cold tier. Recent days are only read from the hot tier, older days are read from the cold tier and from
+        the hot tier if they were not demoted yet
+        :param obj: RawData object reference
+        :param hot: FileSystemStorage
+        :param cold: HDFSStorage or AwsS3Storage
+        :param hot_days: number of days kept in the hot tier
+        """
+        self.obj = obj
+        self.hot = hot
+        self.cold = cold
+        self.hot_days = hot_days
+
+    ###################################################################
+    ################## GET DATA METHODS ###############################
+    ###################################################################
+
+    def read_file(self, owner_id: uuid, stream_id: uuid, day: str, start_time: datetime = None,
+                  end_time: datetime = None, localtime: bool = True, columnar: bool = False) -> List[DataPoint]:
+        """
+        Read a stream-day from the tier(s) holding its files
+        :param owner_id:
+        :param stream_id:
+        :param day: format (YYYYMMDD)
+        :param start_time:
+        :param end_time:
+        :param localtime:
+        :param columnar: return DataColumns instead of a list of DataPoints
+        :return: returns unique (based on start time) list of DataPoints
+        :rtype: DataPoint
+        """
+        # a local day can contain DataPoints of the previous and the next UTC day
+        if localtime:
+            utc_days = [datetime.strftime(datetime.strptime(day, '%Y%m%d') + timedelta(days=delta), "%Y%m%d") for
+                        delta in (-1, 0, 1)]
+        else:
+            utc_days = [day]
+        tiers = []
+        for utc_day in utc_days:
+            for tier in self.get_tiers(owner_id, stream_id, utc_day):
+                if tier not in tiers:
+                    tiers.append(tier)
+        if len(tiers) == 1:
+            return tiers[0].read_file(owner_id, stream_id, day, start_time, end_time, localtime, columnar)
+        # newest tier first, see get_tiers
+        return self.obj.merge_day_blocks([tier.read_file(owner_id, stream_id, day, start_time, end_time, localtime,
+                                                         columnar) for tier in tiers])
+
+    def iter_day_file(self, owner_id: uuid, stream_id: uuid, day: str, start_time: int = None,
+                      end_time: int = None) -> Iterator[List[DataPoint]]:
+        """
+        Iterate unique DataPoints of a stream-day in time order, from the tier(s) holding its files
+        :param owner_id:
+        :param stream_id:
+        :param day: format (YYYYMMDD)
+        :param start_time: only decode blocks after this time, microseconds since epoch (UTC)
+        :param end_time: only decode blocks before this time, microseconds since epoch (UTC)
+        :return: iterator of sorted lists of DataPoints, may contain DataPoints outside of the window
+        :rtype: Iterator[List[DataPoint]]
+        """
+        tiers = self.get_tiers(owner_id, stream_id, day)
+        if len(tiers) == 1:
+            return tiers[0].iter_day_file(owner_id, stream_id, day, start_time, end_time)
+        return self.obj.merge_block_iterators([tier.iter_day_file(owner_id, stream_id, day, start_time, end_time)
+                                               for tier in tiers])
+
+    def get_tiers(self, owner_id: uuid, stream_id: uuid, day: str) -> List[object]:
+        """
+        Returns the tiers that can hold files of a stream-day, the tier holding the newest DataPoints first. Only the
+        local hot tier is checked for files, days older than hot_days are always read from the cold tier. Writes of
+        these days only go to the cold tier, the files left in the hot tier are older
+        :param owner_id:
+        :param stream_id:
+        :param day: format (YYYYMMDD)
+        :return: list of storages
+        :rtype: List[object]
+        """
+        if self.is_hot_day(day):
+            return [self.hot]
+        if len(self.hot.get_day_files(owner_id, stream_id, day)) > 0:
+            # not demoted yet
+            return [self.cold, self.hot]
+        return [self.cold]
+
+    def is_hot_day(self, day: str) -> bool:
+        """
+        :param day: format (YYYYMMDD)
+        :return: True if the day belongs to the last hot_days days (UTC), future days included
+        :rtype: bool
+        """
+        return str(day) >= (datetime.utcnow() - timedelta(days=self.hot_days)).strftime("%Y%m%d")
+
+    ###################################################################
+    ################## STORE DATA METHODS #############################
+    ###################################################################
+
+    def get_compaction_candidates(self, owner_id: uuid = None, stream_id: uuid = None) -> List[tuple]:
+        """
+        Returns stream-days of both tiers that have segments or day files of another format than the configured one
+        :param owner_id: only check streams of this owner, all owners if None
+        :param stream_id: only check this stream, all streams if None
+        :return: list of (owner_id, stream_id, day) tuples
+        :rtype: List[tuple]
+        """
+        candidates = self.hot.get_compaction_candidates(owner_id, stream_id)
+        for candidate in self.cold.get_compaction_candidates(owner_id, stream_id):
+            if candidate not in candidates:
+                candidates.append(candidate)
+        return candidates
+
+    def compact_day_file(self, owner_id: uuid, stream_id: uuid, day: str) -> bool:
+        """
+        Compact a stream-day in each tier holding its files
+        :param owner_id:
+        :param stream_id:
+        :param day: format (YYYYMMDD)
+        :return True if the day was compacted in a tier
+        :rtype bool
+        """
+        compacted = False
+        for tier in self.get_tiers(owner_id, stream_id, day):
+            if tier.compact_day_file(owner_id, stream_id, day):
+                compacted = True
+        return compacted
+
+    def write_file(self, participant_id: uuid, stream_id: uuid, data: List[DataPoint]) -> bool:
+        """
+        Stores data of recent days in the hot tier and data of older days in the cold tier
+        :param participant_id:
+        :param stream_id:
+        :param data:
+        :return True if data is successfully stored
+        :rtype bool
+        """
+        hot_data = []
+        cold_data = []
+        for row in data:
+            if self.is_hot_day(row.start_time.strftime("%Y%m%d")):
+                hot_data.append(row)
+            else:
+                cold_data.append(row)
+        success = True
+        if len(hot_data) > 0:
+            success = self.hot.write_file(participant_id, stream_id, hot_data) and success
+        if len(cold_data) > 0:
+            success = self.cold.write_file(participant_id, stream_id, cold_data) and success
+        return success
+
+    ###################################################################
+    ################## DEMOTION METHODS ###############################
+    ###################################################################
+
+    def get_demotion_candidates(self, owner_id: uuid = None, stream_id: uuid = None) -> List[tuple]:
+        """
+        Returns stream-days of the hot tier that are older than hot_days
+        :param owner_id: only check streams of this owner, all owners if None
+        :param stream_id: only check this stream, all streams if None
+        :return: list of (owner_id, stream_id, day) tuples
+        :rtype: List[tuple]
+        """
+        candidates = []
+        for owner, stream, names in self.hot.list_stream_files(owner_id, stream_id):
+            # day files (<day>.<ext>) and segments (<day>/<segment>)
+            for day in sorted({name[:8] for name in names if is_day_file(name)}):
+                if not self.is_hot_day(day):
+                    candidates.append((owner, stream, day))
+        return candidates
+
+    def demote_day_file(self, owner_id: uuid, stream_id: uuid, day: str) -> bool:
+        """
+        Move a stream-day from the hot to the cold tier. Day file and segments of the hot tier are merged into the cold
+        day file, hot files are removed after the cold tier stored the data. DataPoints written to the cold tier after
+        the day left the hot tier are newer and replace hot DataPoints of equal start times. Readers find the data in
+        the hot tier until it is removed
+        :param owner_id:
+        :param stream_id:
+        :param day: format (YYYYMMDD)
+        :return True if the day was demoted
+        :rtype bool
+        """
+        filenames = self.hot.get_day_files(owner_id, stream_id, day)
+        if len(filenames) == 0:
+            return False
+        data = self.hot.read_day_file(owner_id, stream_id, day, filenames)
+        if len(data) > 0:
+            # the rewritten day replaces the manifest entry of the day, hot rows are not counted twice
+            with self.cold.connect(write=True) as connection:
+                demoted = self.cold.rewrite_day_file(owner_id, stream_id, day, data, connection, newer=False)
+            if not demoted:
+                return False
+        with self.hot.connect(write=True) as connection:
+            self.hot.remove_files(filenames, self.hot.get_stream_dir(owner_id, stream_id) + str(day), connection)
+        self.obj.day_cache.invalidate(owner_id, stream_id, day)
+        return True
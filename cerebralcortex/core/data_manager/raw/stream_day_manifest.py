@@ -0,0 +1,135 @@
+# Copyright (c) 2018, MD2K Center of Excellence
+# - Nasir Ali <nasir.ali08@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import threading
+import time
+import uuid
+from typing import List
+
+from cerebralcortex.core.datatypes.datapoint import DataPoint
+
+# manifest modes, see conf/cerebralcortex.yml
+NO_MANIFEST = "none"
+RECORD_MANIFEST = "record"
+USE_MANIFEST = "use"
+MANIFEST_MODES = [NO_MANIFEST, RECORD_MANIFEST, USE_MANIFEST]
+
+DEFAULT_REFRESH_INTERVAL = 10
+
+
+class StreamDayManifest():
+    def __init__(self, store: object = None, trusted: bool = False,
+                 refresh_interval: float = DEFAULT_REFRESH_INTERVAL):
+        """
+        Manifest of the stored days of each stream: file of the last write, number of rows, bytes, first and last start
+        time and codec of a stream-day. Entries are written by write_file of the storages. A trusted manifest lists all
+        stored days, readers skip days without an entry instead of probing HDFS, AWS-S3 or the file system for files.
+        Days of a stream are cached for refresh_interval seconds, days written by other processes within that time are
+        not seen by has_day
+        :param store: stores the entries (SqlData, see save_stream_day and get_stream_day_manifest), None disables the
+        manifest
+        :param trusted: True if the manifest has an entry for every stored stream-day
+        :param refresh_interval: seconds days of a stream are cached
+        """
+        self.store = store
+        self.trusted = trusted and store is not None
+        self.refresh_interval = refresh_interval
+        # stream id -> (load time, set of days)
+        self.streams = {}
+        # (stream id, day) of written days whose entry could not be stored, has_day probes them
+        self.missing_days = set()
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.store is not None
+
+    def record(self, owner_id: uuid, stream_id: uuid, day: str, file_name: str, data: List[DataPoint],
+               size: int = None, codec: str = None, replace: bool = False):
+        """
+        Store the entry of a written stream-day
+        :param owner_id:
+        :param stream_id:
+        :param day: format (YYYYMMDD)
+        :param file_name: written day file or segment
+        :param data: sorted list of written DataPoints
+        :param size: bytes written
+        :param codec: compression of the written file
+        :param replace: True if data holds all DataPoints of the day (e.g., rewritten day file), False adds the rows and
+        bytes of a segment to the entry
+        :raises Exception: if the store cannot save the entry, the day is probed by has_day of this process until its
+        entry is saved
+        """
+        if not self.enabled or len(data) == 0:
+            return
+        try:
+            self.store.save_stream_day(owner_id, stream_id, day, file_name, len(data), size, data[0].start_time,
+                                       data[-1].start_time, codec, replace)
+        except Exception:
+            with self.lock:
+                self.missing_days.add((str(stream_id), str(day)))
+            raise
+        with self.lock:
+            self.missing_days.discard((str(stream_id), str(day)))
+            if str(stream_id) in self.streams:
+                self.streams[str(stream_id)][1].add(str(day))
+
+    def get_entries(self, stream_id: uuid) -> List[dict]:
+        """
+        :param stream_id:
+        :return: entries of the stream sorted on day
+        :rtype: List[dict]
+        """
+        if not self.enabled:
+            return []
+        entries = self.store.get_stream_day_manifest(stream_id)
+        with self.lock:
+            self.streams[str(stream_id)] = (time.monotonic(), {str(entry["day"]) for entry in entries})
+        return entries
+
+    def get_days(self, stream_id: uuid) -> List[str]:
+        """
+        :param stream_id:
+        :return: sorted days (format YYYYMMDD) that have an entry
+        :rtype: List[str]
+        """
+        return [str(entry["day"]) for entry in self.get_entries(stream_id)]
+
+    def has_day(self, stream_id: uuid, day: str) -> bool:
+        """
+        :param stream_id:
+        :param day: format (YYYYMMDD)
+        :return: False if the manifest is trusted and has no entry for the day, True otherwise
+        :rtype: bool
+        """
+        if not self.trusted:
+            return True
+        with self.lock:
+            if (str(stream_id), str(day)) in self.missing_days:
+                return True
+            cached = self.streams.get(str(stream_id))
+        if cached is not None and (str(day) in cached[1] or time.monotonic() - cached[0] < self.refresh_interval):
+            return str(day) in cached[1]
+        return str(day) in self.get_days(stream_id)
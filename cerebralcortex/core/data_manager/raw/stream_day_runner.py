@@ -0,0 +1,160 @@
+# Copyright (c) 2018, MD2K Center of Excellence
+# - Nasir Ali <nasir.ali08@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import argparse
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List
+
+from cerebralcortex.core.log_manager.log_handler import LogTypes
+
+# CerebralCortex object of a worker process, created once by init_worker
+worker_CC = None
+
+
+def init_worker(config_filepath: str):
+    """
+    Creates the CerebralCortex object of a worker process
+    :param config_filepath: CerebralCortex configuration directory
+    """
+    global worker_CC
+    from cerebralcortex.cerebralcortex import CerebralCortex
+    worker_CC = CerebralCortex(config_filepath)
+
+
+def run_in_worker(work: Callable, owner_id: str, stream_id: str, day: str) -> bool:
+    """
+    Processes one stream-day in a worker process
+    :param work: module level function (nosql, owner_id, stream_id, day) -> bool
+    :param owner_id:
+    :param stream_id:
+    :param day: format (YYYYMMDD)
+    :return result of work
+    :rtype bool
+    """
+    return work(worker_CC.RawData.nosql, owner_id, stream_id, day)
+
+
+class StreamDayRunner():
+    '''Processes the stream-days returned by a candidates function with a work function, once or periodically. With
+    more than one worker, days are processed in a bounded pool of processes, each process has its own CerebralCortex
+    object.'''
+
+    # name of the task in log messages, e.g. compaction
+    name = "processing"
+    # past tense of the task in log messages, e.g. Compacted
+    done = "Processed"
+
+    def __init__(self, CC, get_candidates: Callable, work: Callable, max_workers: int):
+        """
+
+        :param CC: CerebralCortex object reference
+        :param get_candidates: function (owner_id, stream_id) -> list of (owner_id, stream_id, day) tuples
+        :param work: module level function (nosql, owner_id, stream_id, day) -> bool, True if the day was processed.
+        Module level functions can be sent to worker processes
+        :param max_workers: number of worker processes
+        """
+        self.CC = CC
+        self.nosql = CC.RawData.nosql
+        self.logging = CC.logging
+        self.logtypes = LogTypes()
+        self.get_candidates = get_candidates
+        self.work = work
+
+        if int(max_workers) < 1:
+            raise ValueError(self.name.capitalize() + " requires at least one worker.")
+        self.max_workers = int(max_workers)
+
+    def process(self, owner_id: uuid = None, stream_id: uuid = None) -> int:
+        """
+        Processes all candidate stream-days
+        :param owner_id: only process streams of this owner, all owners if None
+        :param stream_id: only process this stream, all streams if None
+        :return: number of processed stream-days
+        :rtype: int
+        """
+        candidates = self.get_candidates(owner_id, stream_id)
+        processed = 0
+        if self.max_workers == 1 or len(candidates) < 2:
+            for owner, stream, day in candidates:
+                if self.work(self.nosql, owner, stream, day):
+                    processed += 1
+        else:
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, len(candidates)), initializer=init_worker,
+                                     initargs=(self.CC.config_filepath,)) as executor:
+                futures = [(candidate, executor.submit(run_in_worker, self.work, *candidate)) for candidate in
+                           candidates]
+                for candidate, future in futures:
+                    try:
+                        if future.result():
+                            processed += 1
+                    except Exception as e:
+                        self.logging.log(
+                            error_message="Error in " + self.name + " of stream-day " + str(candidate) + " - " + str(
+                                traceback.format_exc()) + " - Exception: " + str(e),
+                            error_type=self.logtypes.CRITICAL)
+        return processed
+
+    def run(self, interval: int, owner_id: uuid = None, stream_id: uuid = None):
+        """
+        Processes stream-days periodically, never returns
+        :param interval: seconds to wait between two runs
+        :param owner_id: only process streams of this owner, all owners if None
+        :param stream_id: only process this stream, all streams if None
+        """
+        while True:
+            try:
+                processed = self.process(owner_id, stream_id)
+                self.logging.log(error_message=self.done + " " + str(processed) + " stream-days.",
+                                 error_type=self.logtypes.DEBUG)
+            except Exception as e:
+                self.logging.log(
+                    error_message="Error in " + self.name + " run - " + str(traceback.format_exc()) + " - Exception: " +
+                                  str(e), error_type=self.logtypes.CRITICAL)
+            time.sleep(interval)
+
+
+def run_main(runner_class: type, description: str):
+    """
+    Command line entry point of a StreamDayRunner, processes stream-days once or periodically (--interval)
+    :param runner_class: StreamDayRunner subclass created with (CC, max_workers)
+    :param description: description of the command
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("-c", "--config_dir", help="CerebralCortex configuration directory", required=True)
+    parser.add_argument("-o", "--owner_id", help="Only process streams of this owner", required=False)
+    parser.add_argument("-s", "--stream_id", help="Only process this stream", required=False)
+    parser.add_argument("-w", "--workers", help="Number of worker processes", type=int, required=False)
+    parser.add_argument("-i", "--interval", help="Run as daemon, process stream-days every INTERVAL seconds", type=int,
+                        required=False)
+    args = vars(parser.parse_args())
+
+    from cerebralcortex.cerebralcortex import CerebralCortex
+    runner = runner_class(CerebralCortex(args["config_dir"]), args["workers"])
+    if args["interval"]:
+        runner.run(args["interval"], args["owner_id"], args["stream_id"])
+    else:
+        print(runner.done + " " + str(runner.process(args["owner_id"], args["stream_id"])) + " stream-days.")
@@ -24,23 +24,86 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
-import gzip
+import heapq
 import json
+import operator
 import os
 import pickle
 import traceback
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from enum import Enum
-from typing import List
+from itertools import chain
+from typing import Callable, Iterator, List
 
+import numpy
 import pytz
-from pytz import timezone as pytimezone
 
 from cerebralcortex.core.datatypes.datapoint import DataPoint
 from cerebralcortex.core.datatypes.datastream import DataStream
+from cerebralcortex.core.datatypes.columnar_datastream import ColumnarDataStream, DataColumns
+from cerebralcortex.core.data_manager.raw.compression import DEFAULT_CODEC
+from cerebralcortex.core.data_manager.raw.day_block_cache import DayBlockCache, copy_block
+from cerebralcortex.core.data_manager.raw.day_file_disk_cache import DayFileDiskCache
+from cerebralcortex.core.data_manager.raw.write_buffer import WriteBuffer, BufferedStream
+from cerebralcortex.core.data_manager.raw.stream_day_manifest import StreamDayManifest
+from cerebralcortex.core.data_manager.raw.day_file_format import FILE_EXTENSIONS, PARQUET_FORMAT, ARROW_FORMAT, \
+    MAX_UTC_OFFSET, DEFAULT_BLOCK_SIZE, get_block_window, get_day_file_codec
 from cerebralcortex.core.util.data_types import deserialize_obj
-from cerebralcortex.core.util.datetime_helper_methods import get_timezone
+from cerebralcortex.core.util.datetime_helper_methods import to_local_datetimes, to_utc_times, \
+    TIMEZONE_CONVERSION, OFFSET_CONVERSION, EPOCH, datetime_to_epoch_us
+
+# length of the UTC window of a local day in microseconds, see get_block_window
+DAY_BLOCK_WINDOW = (timedelta(hours=24) + 2 * MAX_UTC_OFFSET) // timedelta(microseconds=1)
+
+# number of threads reading stream-days of multi-day reads
+DEFAULT_READ_WORKERS = 8
+
+# number of DataPoints per chunk of iter_stream
+DEFAULT_CHUNK_SIZE = 10000
+
+# sort key of DataPoints, compares UTC microseconds instead of going through DataPoint.__lt__. Day files of different
+# formats decode to naive (parquet, arrow) or timezone aware (pickle) datetimes, these cannot be compared directly
+START_TIME = operator.attrgetter("start_timestamp")
+
+
+def bisect_start_time(data: List[DataPoint], value: datetime, low: int, high: int, right: bool = False) -> int:
+    """
+    Binary search in a list of DataPoints sorted on start time
+    :param data:
+    :param value: start time to search for, naive datetimes are treated as UTC
+    :param low: first index of the search range
+    :param high: end (exclusive) of the search range
+    :param right: return the index after DataPoints whose start time equals value, else the index of the first of them
+    :return: index where a DataPoint starting at value would be inserted
+    :rtype: int
+    """
+    value = datetime_to_epoch_us(value)
+    while low < high:
+        middle = (low + high) // 2
+        start_time = data[middle].start_timestamp
+        if start_time < value or (right and start_time == value):
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def get_days(start_time: datetime, end_time: datetime) -> List[str]:
+    """
+    Returns all days from the day of start_time to the day of end_time
+    :param start_time:
+    :param end_time:
+    :return: list of days (format YYYYMMDD)
+    :rtype: List[str]
+    """
+    days = []
+    day = start_time.date()
+    while day <= end_time.date():
+        days.append(day.strftime("%Y%m%d"))
+        day += timedelta(days=1)
+    return days
 
 
 class DataSet(Enum):
@@ -50,27 +113,52 @@ class DataSet(Enum):
 
 
 class StreamHandler():
+    # how local times are computed, see conf/cerebralcortex.yml
+    localtime_conversion = TIMEZONE_CONVERSION
+    # compression of written day files, see conf/cerebralcortex.yml
+    day_file_codec = DEFAULT_CODEC
+    # decoded stream-day blocks, disabled unless RawData is configured with a cache size
+    day_cache = DayBlockCache()
+    disk_cache = DayFileDiskCache()
+    # save_stream calls that were not written yet, disabled unless RawData is configured with a buffer size
+    write_buffer = WriteBuffer()
+    # stored days of each stream, disabled unless RawData is configured with a manifest mode
+    day_manifest = StreamDayManifest()
+    # number of threads reading stream-days of multi-day reads, see read_days
+    read_workers = DEFAULT_READ_WORKERS
     
     ###################################################################
     ################## GET DATA METHODS ###############################
     ###################################################################
-    def get_stream(self, stream_id: uuid = None, owner_id: uuid = None, day: str = None, start_time: datetime = None,
+    def get_stream(self, stream_id: uuid = None, owner_id: uuid = None, day=None, start_time: datetime = None,
                    end_time: datetime = None, localtime: bool = False,
-                   data_type=DataSet.COMPLETE) -> DataStream:
+                   data_type=DataSet.COMPLETE, columnar: bool = False) -> DataStream:
         """
-        Returns a DataStream object with metadata of a stream and data for a given day.
+        Returns a DataStream object with metadata of a stream and data for a given day or list of days. If day is None,
+        data of all days from start_time to end_time is returned
         :param stream_id: UUID of a stream
         :param owner_id: UUID of a stream
-        :param day: day format (YYYYMMDD)
+        :param day: day format (YYYYMMDD) or list of days
         :param start_time: start time of @day
         :param end_time: end time of @day
         :param localtime: get data in participant's local time
         :param data_type: get metadata, data both or just metadata or data
+        :param columnar: return a ColumnarDataStream (DataColumns if data_type is ONLY_DATA)
         :return: DataStream object
         :rtype: DataStream
         """
-        if stream_id is None or day is None:
+        if stream_id is None or (day is None and start_time is None):
             return DataStream()
+        if len(self.write_buffer) > 0:
+            # metadata and data of buffered writes
+            self.flush(stream_id)
+
+        if day is None:
+            days = get_days(start_time, end_time if end_time is not None else start_time)
+        elif isinstance(day, str):
+            days = [day]
+        else:
+            days = list(day)
 
         # query datastream(mysql) for metadata
         datastream_metadata = self.sql_data.get_stream_metadata(stream_id)
@@ -78,10 +166,10 @@ class StreamHandler():
         if len(datastream_metadata) > 0:
             owner_id = datastream_metadata[0]["owner"]
             if data_type == DataSet.COMPLETE:
-                dps = self.nosql.read_file(owner_id, stream_id, day, start_time, end_time, localtime)
+                dps = self.read_days(owner_id, [stream_id], days, start_time, end_time, localtime, columnar)
                 stream = self.map_datapoint_and_metadata_to_datastream(stream_id, datastream_metadata, dps, localtime)
             elif data_type == DataSet.ONLY_DATA:
-                stream = self.nosql.read_file(owner_id, stream_id, day, start_time, end_time, localtime)                
+                stream = self.read_days(owner_id, [stream_id], days, start_time, end_time, localtime, columnar)
             elif data_type == DataSet.ONLY_METADATA:
                 stream = self.map_datapoint_and_metadata_to_datastream(stream_id, datastream_metadata, None)
             else:
@@ -90,77 +178,209 @@ class StreamHandler():
         else:
             return DataStream()
 
+    def read_data(self, owner_id: uuid, stream_id: uuid, day: str, start_time: datetime = None,
+                  end_time: datetime = None, localtime: bool = False, columnar: bool = False):
+        """
+        Read data of a stream-day from the configured nosql storage
+        :param owner_id:
+        :param stream_id:
+        :param day: format (YYYYMMDD)
+        :param start_time:
+        :param end_time:
+        :param localtime:
+        :param columnar: return DataColumns instead of a list of DataPoints
+        :return: list of DataPoints or DataColumns
+        :rtype: List[DataPoint]|DataColumns
+        """
+        if len(self.write_buffer) > 0:
+            self.flush(stream_id)
+        data = self.nosql.read_file(owner_id, stream_id, day, start_time, end_time, localtime, columnar)
+        if columnar and not isinstance(data, DataColumns):
+            # empty day or read error
+            data = DataColumns.merge([data])
+            data.localtime = localtime
+        return data
+
+    def read_days(self, owner_id: uuid, stream_ids: List[uuid], days: List[str], start_time: datetime = None,
+                  end_time: datetime = None, localtime: bool = False, columnar: bool = False):
+        """
+        Read data of all days of all stream ids. Stream-days are read in parallel by read_workers threads and merged
+        in time order. DataPoints are unique within a stream id, DataPoints of different stream ids (e.g., devices)
+        are all kept
+        :param owner_id:
+        :param stream_ids: stream ids of a stream name, DataPoints of equal start times are in the order of the stream
+        ids
+        :param days: list of days (format YYYYMMDD)
+        :param start_time:
+        :param end_time:
+        :param localtime:
+        :param columnar: return DataColumns instead of a list of DataPoints
+        :return: list of DataPoints or DataColumns
+        :rtype: List[DataPoint]|DataColumns
+        """
+        stream_days = [(stream_id, day) for stream_id in stream_ids for day in days]
+        if len(stream_days) == 1:
+            return self.read_data(owner_id, stream_ids[0], days[0], start_time, end_time, localtime, columnar)
+
+        def read_stream_day(stream_day):
+            return self.read_data(owner_id, stream_day[0], stream_day[1], start_time, end_time, localtime, columnar)
+
+        if len(stream_days) == 0:
+            blocks = []
+        elif self.read_workers > 1:
+            # reads are I/O bound (HDFS/AWS-S3), decoding releases the GIL partly
+            with ThreadPoolExecutor(max_workers=min(self.read_workers, len(stream_days))) as executor:
+                blocks = list(executor.map(read_stream_day, stream_days))
+        else:
+            blocks = [read_stream_day(stream_day) for stream_day in stream_days]
+
+        # days of a stream id are merged, stream ids are combined without dedup
+        stream_blocks = [blocks[index * len(days):(index + 1) * len(days)] for index in range(len(stream_ids))]
+        if columnar:
+            data = DataColumns.merge([DataColumns.merge(day_blocks) for day_blocks in stream_blocks], dedup=False)
+            data.localtime = localtime
+            data.localtime_conversion = self.localtime_conversion
+            return data
+        stream_blocks = [self.merge_day_blocks(day_blocks) for day_blocks in stream_blocks]
+        if len(stream_blocks) == 0:
+            return []
+        elif len(stream_blocks) == 1:
+            return stream_blocks[0]
+        # sorted is stable, DataPoints of equal start times stay in the order of the stream ids
+        return sorted(chain.from_iterable(stream_blocks), key=START_TIME)
+
+    def iter_stream(self, stream_id: uuid, start_time: datetime = None, end_time: datetime = None,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE, localtime: bool = False) -> Iterator[List[DataPoint]]:
+        """
+        Iterate data of a stream in time order without loading it completely. Days, and blocks of the day files, are
+        read lazily, so only a chunk and one block of each file of the current day are kept in memory
+        :param stream_id:
+        :param start_time: first day of the stream if None
+        :param end_time: last day of the stream if None
+        :param chunk_size: maximum number of DataPoints per chunk
+        :param localtime: get data in participant's local time, naive start/end times are local times
+        :return: iterator of sorted lists of at most chunk_size DataPoints
+        :rtype: Iterator[List[DataPoint]]
+        """
+        if len(self.write_buffer) > 0:
+            self.flush(stream_id)
+        datastream_metadata = self.sql_data.get_stream_metadata(stream_id)
+        if len(datastream_metadata) == 0:
+            return
+        owner_id = datastream_metadata[0]["owner"]
+
+        # day files are UTC days
+        block_start, block_end = get_block_window(start_time, end_time, localtime)
+        if block_start is not None and block_end is not None:
+            days = get_days(EPOCH + timedelta(microseconds=block_start), EPOCH + timedelta(microseconds=block_end))
+        else:
+            days = self.get_stream_days(stream_id)
+            if block_start is not None:
+                days = [day for day in days if day >= (EPOCH + timedelta(microseconds=block_start)).strftime("%Y%m%d")]
+            if block_end is not None:
+                days = [day for day in days if day <= (EPOCH + timedelta(microseconds=block_end)).strftime("%Y%m%d")]
+
+        chunk = []
+        for day in days:
+            try:
+                for block in self.nosql.iter_day_file(owner_id, stream_id, day, block_start, block_end):
+                    block = self.convert_to_localtime(block, localtime)
+                    chunk.extend(self.subset_data(block, start_time, end_time))
+                    while len(chunk) >= chunk_size:
+                        yield chunk[:chunk_size]
+                        chunk = chunk[chunk_size:]
+            except Exception:
+                self.logging.log(
+                    error_message="Error! cannot iterate day file. STREAM ID: " + str(stream_id) + " DAY: " + str(
+                        day) + " --- " + str(traceback.format_exc()), error_type=self.logtypes.CRITICAL)
+                # the caller would get the stream without the rest of the day otherwise
+                raise
+        if len(chunk) > 0:
+            yield chunk
+
     def get_stream_by_name(self, stream_name: uuid, user_id: uuid = None, start_time: datetime = None,
                            end_time: datetime = None, localtime: bool = False,
-                           data_type=DataSet.COMPLETE) -> DataStream:
+                           data_type=DataSet.COMPLETE, columnar: bool = False) -> DataStream:
         """
-        TODO: Return stream data for all stream-ids related to a stream-name
+        Return stream data for all stream-ids related to a stream-name. Metadata of the DataStream is the metadata
+        of the first stream-id
         :param stream_name:
         :param user_id:
-        :param start_time:
-        :param end_time:
+        :param start_time: all days of the streams if None
+        :param end_time: only the day of start_time if None
         :param localtime:
         :param data_type:
-        :return:
-
+        :param columnar: return a ColumnarDataStream (DataColumns if data_type is ONLY_DATA)
+        :return: DataStream object
+        :rtype: DataStream
         """
         if stream_name is None or user_id is None:
             return []
-        days = []
-        all_stream_days = {}
-        # get all stream ids for a stream name
-        stream_ids = self.sql_data.get_stream_id(user_id, stream_name)
-        for sid in stream_ids:
-            all_stream_days[sid] = self.get_stream_days(sid)
+        if len(self.write_buffer) > 0:
+            self.flush()
 
-        #     days.extend(self.get_stream_days(sid))
-        # all_stream_days = list(set(days))
+        # get all stream ids for a stream name
+        stream_ids = [row["identifier"] for row in self.sql_data.get_stream_id(user_id, stream_name)]
+        if len(stream_ids) == 0:
+            return DataStream()
 
         if start_time is not None and end_time is not None:
-            time_diff = end_time - start_time
-            for day in range(time_diff.days + 1):
-                days.append((start_time + timedelta(days=day)).strftime('%Y%m%d'))
+            days = get_days(start_time, end_time)
         elif start_time is not None and end_time is None:
             # make day out of start-time, just one day data
             days = [start_time.strftime("%Y%m%d")]
         elif start_time is None and end_time is not None:
             raise ValueError("Start time cannot be None if end time is provided.")
-            return []
         else:
             # get all days data
+            days = set()
             for sid in stream_ids:
-                days.extend(self.get_stream_days(sid))
-            days = list(set(days))
+                days.update(self.get_stream_days(sid))
+            days = sorted(days)
+
+        datastream_metadata = self.sql_data.get_stream_metadata(stream_ids[0])
+        if data_type == DataSet.COMPLETE:
+            dps = self.read_days(user_id, stream_ids, days, start_time, end_time, localtime, columnar)
+            return self.map_datapoint_and_metadata_to_datastream(stream_ids[0], datastream_metadata, dps, localtime)
+        elif data_type == DataSet.ONLY_DATA:
+            return self.read_days(user_id, stream_ids, days, start_time, end_time, localtime, columnar)
+        elif data_type == DataSet.ONLY_METADATA:
+            return self.map_datapoint_and_metadata_to_datastream(stream_ids[0], datastream_metadata, None)
+        else:
+            raise ValueError("STREAM NAME: " + str(stream_name) + "Failed to get data stream. Invalid type parameter.")
 
-        # query datastream(mysql) for metadata
-        # datastream_metadata = self.sql_data.get_stream_metadata(stream_name)
-        # if len(datastream_metadata)>0:
-        #     owner_id = datastream_metadata[0]["owner"]
-        #     if data_type == DataSet.COMPLETE:
-        #         if self.nosql_store=="hdfs":
-        #             dps = self.read_hdfs_day_file(owner_id, stream_name, day, start_time, end_time, localtime)
-        #         elif self.nosql_store=="filesystem":
-        #             dps =  self.read_filesystem_day_file(owner_id, stream_name, day, start_time, end_time, localtime)
-        #         else:
-        #             dps = self.load_cassandra_data(stream_name, day, start_time, end_time)
-        #         stream = self.map_datapoint_and_metadata_to_datastream(stream_name, datastream_metadata, dps, localtime)
-        #     elif data_type == DataSet.ONLY_DATA:
-        #         if self.nosql_store=="hdfs":
-        #             return self.read_hdfs_day_file(owner_id, stream_name, day, start_time, end_time, localtime)
-        #         elif self.nosql_store=="filesystem":
-        #             return self.read_filesystem_day_file(owner_id, stream_name, day, start_time, end_time, localtime)
-        #         else:
-        #             return self.load_cassandra_data(stream_name, day, start_time, end_time)
-        #     elif data_type == DataSet.ONLY_METADATA:
-        #         stream = self.map_datapoint_and_metadata_to_datastream(stream_name, datastream_metadata, None)
-        #     else:
-        #         self.logging.log(
-        #             error_message="STREAM ID: " + stream_name + "Failed to get data stream. Invalid type parameter.",
-        #             error_type=self.logtypes.DEBUG)
-        #         return None
-        #     return stream
-        # else:
-        #     return DataStream()
+    def get_stream_days(self, stream_id: uuid) -> List[str]:
+        """
+        Returns the days of a stream. Days are taken from the stream-day manifest if it is used, otherwise all days
+        between start and end time of the stream are returned, whether they hold data or not
+        :param stream_id:
+        :return: list of days (format YYYYMMDD)
+        :rtype: List[str]
+        """
+        if self.day_manifest.trusted:
+            try:
+                return self.day_manifest.get_days(stream_id)
+            except Exception:
+                self.logging.log(
+                    error_message="STREAM ID: " + str(stream_id) + " - Cannot read stream-day manifest. " + str(
+                        traceback.format_exc()), error_type=self.logtypes.CRITICAL)
+        return self.sql_data.get_stream_days(stream_id)
+
+    def has_stream_day(self, stream_id: uuid, day: str) -> bool:
+        """
+        Used by the storages to skip probing days of a stream that have no files
+        :param stream_id:
+        :param day: format (YYYYMMDD)
+        :return: False if the stream-day manifest is used and has no entry for the day, True otherwise
+        :rtype: bool
+        """
+        try:
+            return self.day_manifest.has_day(stream_id, day)
+        except Exception:
+            self.logging.log(
+                error_message="STREAM ID: " + str(stream_id) + " - Cannot read stream-day manifest. " + str(
+                    traceback.format_exc()), error_type=self.logtypes.CRITICAL)
+            return True
 
     def map_datapoint_and_metadata_to_datastream(self, stream_id: uuid, metadata: dict,
                                                  data: List[DataPoint], localtime: bool = True) -> DataStream:
@@ -187,6 +407,9 @@ class StreamHandler():
                 stream_timezone = "local"
             else:
                 stream_timezone = "utc"
+            if isinstance(data, DataColumns):
+                return ColumnarDataStream(stream_id, ownerID, name, data_descriptor, execution_context, annotations,
+                                          stream_type, start_time, end_time, data, stream_timezone)
             return DataStream(stream_id, ownerID, name, data_descriptor, execution_context, annotations,
                               stream_type, start_time, end_time, data, stream_timezone)
         except Exception as e:
@@ -196,7 +419,7 @@ class StreamHandler():
 
     def compress_store_pickle(self, filename: str, data: pickle, hdfs: object = None):
         """
-        Compress (using gzip compression) pickled binary object and store it to HDFS or File System
+        Compress (using the configured day file codec) pickled binary object and store it to HDFS or File System
         :param filename: pickle file name
         :param data: pickled data (binary object)
         :param hdfs: hdfs connection object, store in a file system if object is None
@@ -209,7 +432,7 @@ class StreamHandler():
                     if not os.path.exists(gz_filename):
                         # moved inside if condition so if exist do not even pickle/compress
                         data = pickle.dumps(data)
-                        compressed_data = gzip.compress(data)
+                        compressed_data = self.day_file_codec.compress(data)
                         gzwrite = open(gz_filename, "wb")
                         gzwrite.write(compressed_data)
                         gzwrite.close()
@@ -225,7 +448,7 @@ class StreamHandler():
                     if not hdfs.exists(gz_filename):
                         # moved inside if condition so if exist do not even pickle/compress
                         data = pickle.dumps(data)
-                        compressed_data = gzip.compress(data)
+                        compressed_data = self.day_file_codec.compress(data)
                         gzwrite = hdfs.open(gz_filename, "wb")
                         gzwrite.write(compressed_data)
                         gzwrite.close()
@@ -242,91 +465,194 @@ class StreamHandler():
     def subset_data(self, data: List[DataPoint], start_time: datetime = None, end_time: datetime = None) -> List[
         DataPoint]:
         """
-        It accepts list of DataPoints and subset it based on start/end time
-        :param data: List of DataPoint
+        It accepts a sorted list of DataPoints and subset it based on start/end time (inclusive). Window boundaries are
+        located with binary search
+        :param data: List of DataPoint, sorted on start time
         :param start_time:
         :param end_time:
         :return: data
         :rtype: List[DataPoint]
         """
+        if isinstance(data, DataColumns):
+            return data.subset(start_time, end_time)
         if len(data)>0:
-            subset_data = []
-            if start_time.tzinfo is None or start_time.tzinfo == "":
-                start_time = start_time.replace(tzinfo=data[0].start_time.tzinfo)
-            if end_time.tzinfo is None or end_time.tzinfo == "":
-                end_time = end_time.replace(tzinfo=data[0].start_time.tzinfo)
-
-            if start_time is not None and end_time is not None:
-                for dp in data:
-                    if dp.start_time >= start_time and dp.start_time <= end_time:
-                        subset_data.append(dp)
-                return subset_data
-            elif start_time is not None and end_time is None:
-                for dp in data:
-                    if dp.start_time >= start_time:
-                        subset_data.append(dp)
-                return subset_data
-            elif start_time is None and end_time is not None:
-                for dp in data:
-                    if dp.start_time <= end_time:
-                        subset_data.append(dp)
-                return subset_data
-            else:
+            start_index = 0
+            end_index = len(data)
+            if start_time is not None:
+                if start_time.tzinfo is None or start_time.tzinfo == "":
+                    start_time = start_time.replace(tzinfo=data[0].start_time.tzinfo)
+                start_index = bisect_start_time(data, start_time, 0, len(data), right=False)
+            if end_time is not None:
+                if end_time.tzinfo is None or end_time.tzinfo == "":
+                    end_time = end_time.replace(tzinfo=data[0].start_time.tzinfo)
+                end_index = bisect_start_time(data, end_time, start_index, len(data), right=True)
+            if start_index == 0 and end_index == len(data):
                 return data
+            return data[start_index:end_index]
         else:
             return data
 
     def filter_sort_datapoints(self, data: List[DataPoint]) -> List[DataPoint]:
         """
-        Remove duplicate datapoints and sort them based on the start time
+        Remove duplicate datapoints and sort them based on the start time. Already sorted and unique data is returned
+        as is. On equal start times the first DataPoint is kept
         :param data:
         :return: contains unique and sorted list of Datapoints
         :rtype: List[DataPoint]
         """
+        if isinstance(data, DataColumns):
+            return data.sort_dedup()
         if len(data) > 0:
             if not isinstance(data, list):
                 data = deserialize_obj(data)
-            clean_data = self.dedup(sorted(data))
+            start_times = list(map(START_TIME, data))
+            if all(map(operator.lt, start_times, start_times[1:])):
+                return data
+            clean_data = self.dedup(sorted(data, key=START_TIME))
             return clean_data
         else:
             return data
 
+    def merge_day_blocks(self, blocks: List[List[DataPoint]]) -> List[DataPoint]:
+        """
+        Merge DataPoints of a day file and its segments into one sorted and unique list. Blocks that do not overlap
+        in time are concatenated, overlapping blocks are merged and de-duplicated
+        :param blocks: lists of DataPoints or DataColumns, newest block first. On equal start times the newest DataPoint is kept
+        :return: contains unique and sorted list of Datapoints
+        :rtype: List[DataPoint]
+        """
+        if len(blocks) == 1:
+            return blocks[0]
+        if any(isinstance(block, DataColumns) for block in blocks):
+            return DataColumns.merge(blocks)
+        blocks = [self.filter_sort_datapoints(block) for block in blocks if len(block) > 0]
+        if len(blocks) == 0:
+            return []
+        elif len(blocks) == 1:
+            return blocks[0]
+
+        ordered_blocks = sorted(blocks, key=lambda block: block[0].start_timestamp)
+        if all(previous[-1].start_timestamp < block[0].start_timestamp for previous, block in
+               zip(ordered_blocks, ordered_blocks[1:])):
+            return list(chain.from_iterable(ordered_blocks))
+
+        # timsort detects the sorted blocks as runs and merges them, it is stable so dedup keeps the newest DataPoint
+        return self.dedup(sorted(chain.from_iterable(blocks), key=START_TIME))
+
     def dedup(self, data: List[DataPoint]) -> List[DataPoint]:
         """
-        Remove duplicate datapoints based on the start time
+        Remove duplicate datapoints of a sorted list based on the start time, the first DataPoint is kept
         :param data:
         :return: contains list of unique Datapoints
         :rtype: List[DataPoint]
         """
+        if len(data) == 0:
+            return data
+        start_times = list(map(START_TIME, data))
         result = [data[0]]
-        for dp in data[1:]:
-            if dp.start_time == result[-1].start_time:
-                continue
-            result.append(dp)
-
+        result.extend([dp for dp, previous_time, start_time in zip(data[1:], start_times, start_times[1:]) if
+                       start_time != previous_time])
         return result
 
+    def merge_block_iterators(self, iterators: List[Iterator[List[DataPoint]]],
+                              block_size: int = DEFAULT_BLOCK_SIZE) -> Iterator[List[DataPoint]]:
+        """
+        Lazily merge the blocks of a day file and its segments into unique DataPoints in time order
+        :param iterators: iterators of blocks of each file, newest file first. On equal start times the DataPoint of
+        the newest file is kept
+        :param block_size: number of DataPoints per merged block if more than one file is merged
+        :return: iterator of sorted and unique lists of DataPoints
+        :rtype: Iterator[List[DataPoint]]
+        """
+        if len(iterators) == 1:
+            for block in iterators[0]:
+                yield self.filter_sort_datapoints(block)
+            return
+
+        # heapq.merge is stable, of equal start times the DataPoint of the first iterator comes first
+        datapoints = heapq.merge(*[chain.from_iterable(map(self.filter_sort_datapoints, iterator)) for iterator in
+                                   iterators], key=START_TIME)
+        block = []
+        previous_time = None
+        for dp in datapoints:
+            start_time = dp.start_timestamp
+            if start_time != previous_time:
+                block.append(dp)
+                previous_time = start_time
+                if len(block) == block_size:
+                    yield block
+                    block = []
+        if len(block) > 0:
+            yield block
+
+    def read_cached_day_block(self, owner_id: uuid, stream_id: uuid, day: str, versions: tuple, start_time: int,
+                              end_time: int, columnar: bool, read_day_block: Callable) -> List[DataPoint]:
+        """
+        Returns the decoded DataPoints of a stream-day from the day block cache. On a cache miss, they are decoded by
+        read_day_block(start_time, end_time) and cached. Cached blocks are never returned, only their copies
+        :param owner_id:
+        :param stream_id:
+        :param day: format (YYYYMMDD)
+        :param versions: (file name, version...) of each file of the stream-day, None if the day cannot be cached
+        :param start_time: microseconds since epoch (UTC)
+        :param end_time: microseconds since epoch (UTC)
+        :param columnar: return DataColumns instead of a list of DataPoints
+        :param read_day_block: decodes the files of the stream-day
+        :return: unique and sorted list of DataPoints, may contain DataPoints outside of the window
+        :rtype: List[DataPoint]
+        """
+        if versions is None or not self.day_cache.enabled:
+            return read_day_block(start_time, end_time)
+
+        block_start, block_end = start_time, end_time
+        if not any(version[0].endswith((FILE_EXTENSIONS[PARQUET_FORMAT], FILE_EXTENSIONS[ARROW_FORMAT])) for version in
+                   versions) or start_time is None or end_time is None or end_time - start_time >= DAY_BLOCK_WINDOW:
+            # pickle files are decoded completely for any window. Parquet and arrow files are decoded completely for
+            # reads of a whole (local) day, reads of neighboring days are served by the same cached block
+            block_start = block_end = None
+        key = (str(owner_id), str(stream_id), str(day), columnar)
+        block = self.day_cache.get(key, versions, block_start, block_end)
+        if block is None:
+            block = read_day_block(block_start, block_end)
+            self.day_cache.put(key, versions, block_start, block_end, block)
+
+        if start_time is not None or end_time is not None:
+            block = self.subset_data(block, None if start_time is None else EPOCH + timedelta(microseconds=start_time),
+                                     None if end_time is None else EPOCH + timedelta(microseconds=end_time))
+        return copy_block(block)
+
     def convert_to_localtime(self, data: List[DataPoint], localtime) -> List[DataPoint]:
         """
-        Adds timezone to time. If locatime is false then it adds UTC timezone to start/end time
+        Adds timezone to time. If locatime is false then it adds UTC timezone to start/end time. Local times are
+        computed for all DataPoints in one array operation, see localtime_conversion
         :param data: List[DataPoint]
         :return: List of DataPoints with timezone embedded to start/end time
         :rtype: List[DataPoint]
         """
+        if isinstance(data, DataColumns):
+            # columns keep UTC times and offsets, local times are computed when needed
+            data.localtime = localtime
+            data.localtime_conversion = self.localtime_conversion
+            return data
 
         if len(data) > 0:
             if localtime:
-                if localtime:
-                    possible_tz = pytimezone(get_timezone(data[0].offset))
-                    for dp in data:
-
-                        if dp.end_time is not None:
-                            dp.end_time = dp.end_time.replace(tzinfo=pytz.utc)
-                            dp.end_time = datetime.fromtimestamp(dp.end_time.timestamp(),
-                                                                 possible_tz)
-                        dp.start_time = dp.start_time.replace(tzinfo=pytz.utc)
-                        dp.start_time = datetime.fromtimestamp(dp.start_time.timestamp(),
-                                                               possible_tz)
+                if self.localtime_conversion == OFFSET_CONVERSION:
+                    offsets = [dp.offset for dp in data]
+                else:
+                    offsets = [data[0].offset]
+                # stored times are UTC, timezone of already converted times is ignored. Merged blocks of different
+                # day file formats can mix naive and timezone aware times
+                start_times = [dp.start_time.replace(tzinfo=None) for dp in data]
+                start_times = to_local_datetimes(numpy.array(start_times, dtype="datetime64[us]"), offsets,
+                                                 self.localtime_conversion)
+                end_times = [None if dp.end_time is None else dp.end_time.replace(tzinfo=None) for dp in data]
+                if any(end_time is not None for end_time in end_times):
+                    end_times = to_local_datetimes(numpy.array(end_times, dtype="datetime64[us]"), offsets,
+                                                   self.localtime_conversion)
+                for dp, start_time, end_time in zip(data, start_times, end_times):
+                    dp.start_time = start_time
+                    dp.end_time = end_time
                 # TODO: for now, disabled it. Storing stream method already store all the data in UTC.
                 # else:
                 #     if dp.end_time is not None:
@@ -342,15 +668,19 @@ class StreamHandler():
         :return: List of DataPoints with timezone embedded to start/end time
         :rtype: List[DataPoint]
         """
-        local_tz_data = []
         if len(data) > 0:
-            possible_tz = pytimezone(get_timezone(0000))
-            for dp in data:
-                if dp.end_time is not None:
-                    dp.end_time = datetime.fromtimestamp(dp.end_time.timestamp(), possible_tz)
-                dp.start_time = datetime.fromtimestamp(dp.start_time.timestamp(), possible_tz)
-                local_tz_data.append(dp)
-        return local_tz_data
+            offsets = [dp.offset for dp in data]
+            zero_offsets = numpy.zeros(len(data), dtype=numpy.int64)
+            start_times = to_local_datetimes(to_utc_times([dp.start_time for dp in data], offsets,
+                                                          self.localtime_conversion), zero_offsets)
+            end_times = [dp.end_time for dp in data]
+            if any(end_time is not None for end_time in end_times):
+                end_times = to_local_datetimes(to_utc_times(end_times, offsets, self.localtime_conversion),
+                                               zero_offsets)
+            for dp, start_time, end_time in zip(data, start_times, end_times):
+                dp.start_time = start_time
+                dp.end_time = end_time
+        return list(data)
 
     ###################################################################
     ################## STORE DATA METHODS #############################
@@ -402,7 +732,20 @@ class StreamHandler():
                         new_end_time = datastream.end_time
 
                 stream_id = datastream.identifier
-                
+
+                if self.write_buffer.is_enabled():
+                    flushed = False
+                    if ingestInfluxDB or not isinstance(data, list):
+                        # keep the order of writes of the stream
+                        flushed = self.flush(stream_id)
+                    if not flushed and isinstance(data, list):
+                        # also buffered if older calls of the stream stay in the buffer after a failed write, they
+                        # must not be written after this call
+                        metadata = (stream_name, data_descriptor, execution_context, annotations, stream_type)
+                        self.write_buffered_streams(
+                            self.write_buffer.add(owner_id, stream_id, metadata, data, new_start_time, new_end_time))
+                        return
+
                 status = self.nosql.write_file(owner_id, stream_id, data)
 
                 if status:
@@ -423,3 +766,100 @@ class StreamHandler():
             self.logging.log(
                 error_message="STREAM ID: " + stream_id + " - Cannot save stream. " + str(traceback.format_exc()),
                 error_type=self.logtypes.CRITICAL)
+
+    def flush(self, stream_id: uuid = None) -> bool:
+        """
+        Write the DataPoints and metadata of save_stream calls waiting in the write buffer
+        :param stream_id: flush this stream only, all streams if None
+        :return: False if a stream could not be written, it stays in the write buffer
+        :rtype: bool
+        """
+        return self.write_buffered_streams(self.write_buffer.pop(stream_id))
+
+    def write_buffered_streams(self, streams: List[BufferedStream]) -> bool:
+        """
+        Store the buffered DataPoints of each stream with one write and its metadata with one update. On equal start
+        times the DataPoint of the latest save_stream call is kept. Streams that cannot be written are returned to the
+        write buffer and written again later
+        :param streams: streams removed from the write buffer
+        :return: False if a stream could not be written
+        :rtype: bool
+        """
+        success = True
+        for buffered in streams:
+            try:
+                data = self.merge_day_blocks(buffered.get_blocks())
+                status = self.nosql.write_file(buffered.owner_id, buffered.stream_id, data)
+            except Exception:
+                self.logging.log(
+                    error_message="STREAM ID: " + str(buffered.stream_id) + " - Cannot save buffered stream. " + str(
+                        traceback.format_exc()), error_type=self.logtypes.CRITICAL)
+                status = False
+            if not status:
+                self.logging.log(
+                    error_message="STREAM ID: " + str(buffered.stream_id) + " - Buffered stream was not saved, it is kept in the write buffer.",
+                    error_type=self.logtypes.CRITICAL)
+                self.write_buffer.restore(buffered)
+                success = False
+                continue
+            try:
+                stream_name, data_descriptor, execution_context, annotations, stream_type = buffered.metadata
+                self.sql_data.save_stream_metadata(buffered.stream_id, stream_name, buffered.owner_id,
+                                                   data_descriptor, execution_context, annotations, stream_type,
+                                                   buffered.start_time, buffered.end_time)
+            except Exception:
+                self.logging.log(
+                    error_message="STREAM ID: " + str(buffered.stream_id) + " - Cannot save metadata of buffered stream. " + str(
+                        traceback.format_exc()), error_type=self.logtypes.CRITICAL)
+        return success
+
+    def record_stream_day(self, owner_id: uuid, stream_id: uuid, day: str, file_name: str, data: List[DataPoint],
+                          size: int = None, replace: bool = False):
+        """
+        Update the stream-day manifest after a day file or segment was written, see StreamDayManifest.record
+        :param owner_id:
+        :param stream_id:
+        :param day: format (YYYYMMDD)
+        :param file_name: written day file or segment
+        :param data: sorted list of written DataPoints
+        :param size: bytes written
+        :param replace: True if data holds all DataPoints of the day
+        :raises Exception: if the manifest is used by readers (manifest: use) and cannot be updated, readers of other
+        processes skip the day until its entry is written (e.g., by index_stream_days)
+        """
+        if not self.day_manifest.enabled:
+            return
+        try:
+            self.day_manifest.record(owner_id, stream_id, day, file_name, data, size,
+                                     get_day_file_codec(self.day_file_format, self.day_file_codec), replace)
+        except Exception:
+            self.logging.log(
+                error_message="STREAM ID: " + str(stream_id) + " DAY: " + str(day) + " - Cannot update stream-day manifest. " + str(
+                    traceback.format_exc()), error_type=self.logtypes.CRITICAL)
+            if self.day_manifest.trusted:
+                # the write fails, the day has no entry and is not found by readers
+                raise
+
+    def index_stream_days(self, stream_id: uuid) -> int:
+        """
+        Add the days of a stream written before the manifest was enabled to the stream-day manifest. All days between
+        start and end time of the stream are read, run it with manifest: record before the manifest is used
+        :param stream_id:
+        :return: number of days with data
+        :rtype: int
+        """
+        datastream_metadata = self.sql_data.get_stream_metadata(stream_id)
+        if len(datastream_metadata) == 0 or not self.day_manifest.enabled:
+            return 0
+        owner_id = datastream_metadata[0]["owner"]
+        duration = self.sql_data.get_stream_duration(stream_id)
+        if duration["start_time"] is None or duration["end_time"] is None:
+            return 0
+        indexed = 0
+        for day in get_days(duration["start_time"], duration["end_time"]):
+            data = self.nosql.read_file(owner_id, stream_id, day, localtime=False)
+            if len(data) > 0:
+                # file name and size are unknown, rows and times are exact
+                self.day_manifest.record(owner_id, stream_id, day, None, data, replace=True)
+                indexed += 1
+        return indexed
@@ -0,0 +1,191 @@
+# Copyright (c) 2018, MD2K Center of Excellence
+# - Nasir Ali <nasir.ali08@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from itertools import groupby
+from typing import List
+
+from cerebralcortex.core.datatypes.datapoint import DataPoint
+
+DEFAULT_MAX_AGE = 10
+
+
+class BufferedStream():
+    def __init__(self, owner_id: uuid, stream_id: uuid, metadata: tuple):
+        """
+        DataPoints and metadata of the save_stream calls of a stream that were not written yet
+        :param owner_id:
+        :param stream_id:
+        :param metadata: (stream_name, data_descriptor, execution_context, annotations, stream_type)
+        """
+        self.owner_id = owner_id
+        self.stream_id = stream_id
+        self.metadata = metadata
+        # day (YYYYMMDD) -> sorted lists of DataPoints, one per save_stream call, oldest first
+        self.days = OrderedDict()
+        self.start_time = None
+        self.end_time = None
+        self.created = time.monotonic()
+
+    def add(self, data: List[DataPoint], start_time: datetime, end_time: datetime):
+        """
+        :param data: sorted and unique list of DataPoints (UTC)
+        :param start_time: start time of the stream reported to the SQL store
+        :param end_time: end time of the stream reported to the SQL store
+        """
+        # days as stored by write_file
+        for day, block in groupby(data, key=lambda dp: dp.start_time.strftime("%Y%m%d")):
+            self.days.setdefault(day, []).append(list(block))
+        if self.start_time is None or start_time < self.start_time:
+            self.start_time = start_time
+        if self.end_time is None or end_time > self.end_time:
+            self.end_time = end_time
+
+    def merge_older(self, older: "BufferedStream"):
+        """
+        Add the DataPoints of calls that were buffered before the calls of this stream
+        :param older: stream of the same stream id removed from the buffer earlier
+        """
+        for day, blocks in older.days.items():
+            self.days[day] = blocks + self.days.get(day, [])
+        self.start_time = min(self.start_time, older.start_time)
+        self.end_time = max(self.end_time, older.end_time)
+        self.created = min(self.created, older.created)
+
+    def get_size(self, day: str) -> int:
+        """
+        :param day: format (YYYYMMDD)
+        :return: number of DataPoints buffered for a day
+        :rtype: int
+        """
+        return sum(len(block) for block in self.days.get(day, []))
+
+    def get_blocks(self) -> List[List[DataPoint]]:
+        """
+        :return: buffered lists of DataPoints, newest first
+        :rtype: List[List[DataPoint]]
+        """
+        return [block for blocks in self.days.values() for block in reversed(blocks)]
+
+
+class WriteBuffer():
+    def __init__(self, max_size: int = 0, max_age: float = DEFAULT_MAX_AGE):
+        """
+        Write-behind buffer of save_stream. DataPoints are accumulated per (owner, stream, day) and a stream is written
+        with one write_file and one metadata update once a stream-day holds max_size DataPoints, the oldest buffered
+        call is older than max_age seconds or the buffer is flushed explicitly
+        :param max_size: number of DataPoints of a stream-day that triggers a flush, 0 disables the buffer
+        :param max_age: seconds a save_stream call can wait in the buffer
+        """
+        self.max_size = max_size
+        self.max_age = max_age
+        self.streams = OrderedDict()
+        self.lock = threading.RLock()
+
+    def is_enabled(self) -> bool:
+        return self.max_size > 0
+
+    def add(self, owner_id: uuid, stream_id: uuid, metadata: tuple, data: List[DataPoint], start_time: datetime,
+            end_time: datetime) -> List[BufferedStream]:
+        """
+        Buffer the DataPoints of a save_stream call
+        :param owner_id:
+        :param stream_id:
+        :param metadata: (stream_name, data_descriptor, execution_context, annotations, stream_type)
+        :param data: sorted and unique list of DataPoints (UTC)
+        :param start_time: start time of the stream reported to the SQL store
+        :param end_time: end time of the stream reported to the SQL store
+        :return: streams that were removed from the buffer and have to be written, oldest first
+        :rtype: List[BufferedStream]
+        """
+        key = str(stream_id)
+        ready = []
+        with self.lock:
+            buffered = self.streams.get(key)
+            if buffered is not None and (buffered.owner_id != owner_id or buffered.metadata != metadata):
+                # metadata updates (e.g., new annotations) are applied in the order of the calls
+                ready.append(self.streams.pop(key))
+                buffered = None
+            if buffered is None:
+                buffered = BufferedStream(owner_id, stream_id, metadata)
+                self.streams[key] = buffered
+            buffered.add(data, start_time, end_time)
+            if any(buffered.get_size(day) >= self.max_size for day in buffered.days):
+                ready.append(self.streams.pop(key))
+            ready.extend(self.pop_expired())
+        return ready
+
+    def restore(self, buffered: BufferedStream):
+        """
+        Return a stream whose write failed to the buffer, it is written again with the next calls of the stream or once
+        it is older than max_age seconds. Its DataPoints are older than the calls buffered since it was removed, the
+        metadata of these calls is kept
+        :param buffered: stream removed from the buffer
+        """
+        key = str(buffered.stream_id)
+        with self.lock:
+            current = self.streams.get(key)
+            if current is not None:
+                current.merge_older(buffered)
+                buffered = current
+            self.streams[key] = buffered
+            # streams are ordered by creation time, see pop_expired
+            self.streams.move_to_end(key, last=False)
+
+    def pop_expired(self) -> List[BufferedStream]:
+        """
+        :return: streams buffered for more than max_age seconds, they are removed from the buffer
+        :rtype: List[BufferedStream]
+        """
+        expired = []
+        now = time.monotonic()
+        with self.lock:
+            # streams are ordered by creation time
+            while len(self.streams) > 0:
+                key, buffered = next(iter(self.streams.items()))
+                if now - buffered.created < self.max_age:
+                    break
+                expired.append(self.streams.pop(key))
+        return expired
+
+    def pop(self, stream_id: uuid = None) -> List[BufferedStream]:
+        """
+        :param stream_id: remove this stream only, all streams if None
+        :return: removed streams
+        :rtype: List[BufferedStream]
+        """
+        with self.lock:
+            if stream_id is None:
+                removed = list(self.streams.values())
+                self.streams.clear()
+                return removed
+            buffered = self.streams.pop(str(stream_id), None)
+            return [buffered] if buffered is not None else []
+
+    def __len__(self):
+        return len(self.streams)
@@ -304,6 +304,46 @@ class StreamHandler():
 
         return all_days
 
+    def get_stream_day_manifest(self, stream_id: uuid) -> List[dict]:
+        """
+        Returns the stream-day manifest entries of a stream, see save_stream_day
+        :param stream_id:
+        :return: list of entries (day, file_name, row_count, size, start_time, end_time, codec) sorted on day
+        :rtype: List[dict]
+        """
+        if not stream_id:
+            raise ValueError("Stream ID is a required field.")
+        qry = "SELECT day, file_name, row_count, size, start_time, end_time, codec from " + self.streamDayTable + " where identifier = %(identifier)s order by day"
+        vals = {'identifier': str(stream_id)}
+        return self.execute(qry, vals)
+
+    def save_stream_day(self, owner_id: uuid, stream_id: uuid, day: str, file_name: str, row_count: int, size: int,
+                        start_time: datetime, end_time: datetime, codec: str, replace: bool = False):
+        """
+        Insert or update the stream-day manifest entry of a written day file or segment. The manifest table has the
+        columns identifier, owner, day (YYYYMMDD), file_name, row_count, size, start_time, end_time and codec, its
+        primary key is (identifier, day)
+        :param owner_id:
+        :param stream_id:
+        :param day: format (YYYYMMDD)
+        :param file_name: written day file or segment, None if unknown
+        :param row_count: number of written DataPoints
+        :param size: bytes written, None if unknown
+        :param start_time: start time of the first written DataPoint
+        :param end_time: start time of the last written DataPoint
+        :param codec: compression of the written file, None if unknown
+        :param replace: True replaces the entry (all DataPoints of the day were written), False adds rows and bytes of
+        a segment to the entry
+        """
+        if replace:
+            qry = "REPLACE INTO " + self.streamDayTable + " (identifier, owner, day, file_name, row_count, size, start_time, end_time, codec) VALUES(%s, %s, %s, %s, %s, %s, %s, %s, %s)"
+        else:
+            qry = "INSERT INTO " + self.streamDayTable + " (identifier, owner, day, file_name, row_count, size, start_time, end_time, codec) VALUES(%s, %s, %s, %s, %s, %s, %s, %s, %s) " \
+                  "ON DUPLICATE KEY UPDATE file_name=VALUES(file_name), row_count=row_count+VALUES(row_count), size=size+VALUES(size), " \
+                  "start_time=LEAST(start_time, VALUES(start_time)), end_time=GREATEST(end_time, VALUES(end_time)), codec=VALUES(codec)"
+        vals = str(stream_id), str(owner_id), str(day), file_name, row_count, size, start_time, end_time, codec
+        self.execute(qry, vals, commit=True)
+
     def get_stream_name(self, stream_id: uuid) -> str:
         """
         Get strea name linked to a stream UUID
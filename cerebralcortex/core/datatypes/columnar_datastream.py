@@ -0,0 +1,304 @@
+# Copyright (c) 2018, MD2K Center of Excellence
+# - Nasir Ali <nasir.ali08@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+from datetime import datetime
+from typing import List
+from uuid import UUID
+
+import numpy
+
+from cerebralcortex.core.datatypes.datapoint import DataPoint
+from cerebralcortex.core.datatypes.datastream import DataStream
+from cerebralcortex.core.metadata_manager.metadata import DataDescriptor, ExecutionContext
+from cerebralcortex.core.util.datetime_helper_methods import datetime_to_epoch_us, get_utc_offsets, \
+    to_local_datetimes, TIMEZONE_CONVERSION
+
+# end_time of DataPoints without an end time
+NO_END_TIME = numpy.iinfo(numpy.int64).min
+
+# numeric list per DataPoint (2-D matrix), numeric value per DataPoint (1-D array) or any python object (object array)
+VALUES_LAYOUT = "values"
+SCALAR_LAYOUT = "scalar"
+OBJECT_LAYOUT = "object"
+
+
+def to_object_array(values: List) -> numpy.ndarray:
+    """
+    Convert a list of python objects to a 1-D object array, lists are kept as elements instead of becoming a dimension
+    :param values:
+    :return: 1-D object array
+    :rtype: numpy.ndarray
+    """
+    result = numpy.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        result[i] = value
+    return result
+
+
+class DataColumns():
+    def __init__(self, start_time: numpy.ndarray = None, end_time: numpy.ndarray = None, offset: numpy.ndarray = None,
+                 sample: numpy.ndarray = None, sample_layout: str = OBJECT_LAYOUT, localtime: bool = False,
+                 localtime_conversion: str = TIMEZONE_CONVERSION):
+        """
+        Columnar representation of a list of DataPoints
+        :param start_time: int64 microseconds since epoch (UTC)
+        :param end_time: int64 microseconds since epoch (UTC), NO_END_TIME if a DataPoint has no end time
+        :param offset: int32 milliseconds
+        :param sample: 2-D numeric matrix (values layout), 1-D numeric array (scalar layout) or 1-D object array
+        :param sample_layout: values, scalar or object
+        :param localtime: if True, DataPoints are in participant's local time
+        :param localtime_conversion: timezone or offset, see get_utc_offsets
+        """
+        self.start_time = numpy.asarray(start_time if start_time is not None else [], dtype=numpy.int64)
+        self.end_time = numpy.asarray(end_time if end_time is not None else [], dtype=numpy.int64)
+        self.offset = numpy.asarray(offset if offset is not None else [], dtype=numpy.int32)
+        self.sample = sample if sample is not None else numpy.empty(0, dtype=object)
+        self.sample_layout = sample_layout
+        self.localtime = localtime
+        self.localtime_conversion = localtime_conversion
+
+    def __len__(self):
+        return len(self.start_time)
+
+    @classmethod
+    def from_datapoints(cls, data: List[DataPoint]):
+        """
+        Build columns from a list of DataPoints. Samples are stored in a numeric matrix/array if all of them are
+        lists of the same length or single values, and all values are ints or all values are floats
+        :param data:
+        :return: DataColumns
+        """
+        start_time = [dp.start_timestamp for dp in data]
+        end_time = [NO_END_TIME if dp.end_time is None else dp.end_timestamp for dp in data]
+        offset = [int(dp.offset) for dp in data]
+        samples = [dp.sample for dp in data]
+
+        sample_layout = OBJECT_LAYOUT
+        if len(samples) > 0 and type(samples[0]) is list:
+            width = len(samples[0])
+            if width > 0 and all(type(sample) is list and len(sample) == width for sample in samples) and \
+                    {type(value) for sample in samples for value in sample} in ({int}, {float}):
+                sample_layout = VALUES_LAYOUT
+        elif len(samples) > 0 and {type(sample) for sample in samples} in ({int}, {float}):
+            # ints of samples mixing ints and floats would be converted to floats
+            sample_layout = SCALAR_LAYOUT
+
+        if sample_layout != OBJECT_LAYOUT:
+            sample = numpy.array(samples)
+            if sample.dtype not in (numpy.int64, numpy.float64):
+                # ints beyond int64
+                sample_layout = OBJECT_LAYOUT
+        if sample_layout == OBJECT_LAYOUT:
+            sample = to_object_array(samples)
+        return cls(start_time, end_time, offset, sample, sample_layout)
+
+    @classmethod
+    def merge(cls, blocks: List, dedup: bool = True):
+        """
+        Merge blocks (DataColumns or lists of DataPoints) into sorted and unique columns
+        :param blocks: newest block first. On equal start times the DataPoint of the newest block is kept
+        :param dedup: False keeps all rows of equal start times, in the order of the blocks
+        :return: DataColumns
+        """
+        blocks = [block if isinstance(block, DataColumns) else cls.from_datapoints(block) for block in blocks]
+        blocks = [block for block in blocks if len(block) > 0]
+        if len(blocks) == 0:
+            return cls()
+        elif len(blocks) == 1:
+            return blocks[0].sort_dedup() if dedup else blocks[0].sort()
+
+        # blocks that do not overlap in time are concatenated in time order, then no argsort is required
+        ordered_blocks = sorted(blocks, key=lambda block: block.start_time.min())
+        if all(previous.start_time.max() < block.start_time.min() for previous, block in
+               zip(ordered_blocks, ordered_blocks[1:])):
+            blocks = ordered_blocks
+
+        layouts = {block.sample_layout for block in blocks}
+        if len(layouts) == 1 and (OBJECT_LAYOUT in layouts or len({(block.sample.shape[1:], block.sample.dtype) for
+                                                                    block in blocks}) == 1):
+            sample_layout = blocks[0].sample_layout
+            sample = numpy.concatenate([block.sample for block in blocks])
+        else:
+            sample_layout = OBJECT_LAYOUT
+            sample = to_object_array([value for block in blocks for value in block.samples()])
+        columns = cls(numpy.concatenate([block.start_time for block in blocks]),
+                      numpy.concatenate([block.end_time for block in blocks]),
+                      numpy.concatenate([block.offset for block in blocks]), sample, sample_layout,
+                      blocks[0].localtime, blocks[0].localtime_conversion)
+        return columns.sort_dedup() if dedup else columns.sort()
+
+    def take(self, indices):
+        """
+        Returns the rows selected by a slice, index array or boolean mask
+        :param indices:
+        :return: DataColumns
+        """
+        return DataColumns(self.start_time[indices], self.end_time[indices], self.offset[indices],
+                           self.sample[indices], self.sample_layout, self.localtime, self.localtime_conversion)
+
+    def sort(self):
+        """
+        Sort rows on start time, rows of equal start times keep their order
+        :return: DataColumns
+        """
+        if len(self) < 2 or numpy.all(self.start_time[1:] >= self.start_time[:-1]):
+            return self
+        return self.take(numpy.argsort(self.start_time, kind="stable"))
+
+    def sort_dedup(self):
+        """
+        Sort rows on start time and remove rows with duplicate start times, the first of equal rows is kept
+        :return: DataColumns
+        """
+        if len(self) < 2 or numpy.all(self.start_time[1:] > self.start_time[:-1]):
+            return self
+        order = numpy.argsort(self.start_time, kind="stable")
+        start_time = self.start_time[order]
+        unique = numpy.empty(len(order), dtype=bool)
+        unique[0] = True
+        unique[1:] = start_time[1:] != start_time[:-1]
+        return self.take(order[unique])
+
+    def subset(self, start_time: datetime = None, end_time: datetime = None):
+        """
+        Returns rows whose start time is within start_time and end_time (inclusive). Naive datetimes are UTC, or
+        participant's local time if columns are in local time. Rows must be sorted on start time, UTC boundaries are
+        located with binary search
+        :param start_time:
+        :param end_time:
+        :return: DataColumns
+        """
+        start_index = 0
+        end_index = len(self)
+        local_bounds = []
+        for bound, is_start in ((start_time, True), (end_time, False)):
+            if bound is None:
+                continue
+            elif self.localtime and bound.tzinfo is None:
+                local_bounds.append((datetime_to_epoch_us(bound), is_start))
+            elif is_start:
+                start_index = numpy.searchsorted(self.start_time, datetime_to_epoch_us(bound), side="left")
+            else:
+                end_index = numpy.searchsorted(self.start_time, datetime_to_epoch_us(bound), side="right")
+
+        result = self
+        if start_index > 0 or end_index < len(self):
+            result = self.take(slice(start_index, max(start_index, end_index)))
+        if len(local_bounds) > 0 and len(result) > 0:
+            # local times are not sorted if the offset changes during the day, they are compared one by one
+            utc_offsets = get_utc_offsets(result.start_time.astype("datetime64[us]"), result.offset,
+                                          result.localtime_conversion)[0]
+            local_time = result.start_time + utc_offsets.astype(numpy.int64)
+            mask = numpy.ones(len(result), dtype=bool)
+            for bound, is_start in local_bounds:
+                mask &= (local_time >= bound) if is_start else (local_time <= bound)
+            if not mask.all():
+                result = result.take(mask)
+        return result
+
+    def samples(self) -> List:
+        """
+        Returns samples as python objects, same as DataPoint.sample
+        :return: list of samples
+        """
+        if self.sample_layout == OBJECT_LAYOUT:
+            return list(self.sample)
+        return self.sample.tolist()
+
+    def to_datapoints(self) -> List[DataPoint]:
+        """
+        Convert columns to a list of DataPoints. Times are naive UTC datetimes, or timezone aware local datetimes if
+        columns are in local time
+        :return: list of DataPoints
+        """
+        if len(self) == 0:
+            return []
+        if self.localtime:
+            # NO_END_TIME is NaT in datetime64, which becomes None
+            start_times = to_local_datetimes(self.start_time.astype("datetime64[us]"), self.offset,
+                                             self.localtime_conversion)
+            end_times = to_local_datetimes(self.end_time.astype("datetime64[us]"), self.offset,
+                                           self.localtime_conversion)
+        else:
+            # DataPoints keep UTC times as integers
+            start_times = self.start_time.tolist()
+            end_times = [None if value == NO_END_TIME else value for value in self.end_time.tolist()]
+        return [DataPoint(start_time=st, end_time=et, offset=of, sample=sample) for st, et, of, sample in
+                zip(start_times, end_times, self.offset.tolist(), self.samples())]
+
+
+class ColumnarDataStream(DataStream):
+    def __init__(self,
+                 identifier: UUID = None,
+                 owner: UUID = None,
+                 name: UUID = None,
+                 data_descriptor: List[DataDescriptor] = None,
+                 execution_context: ExecutionContext = None,
+                 annotations: List = None,
+                 stream_type: str = None,
+                 start_time: datetime = None,
+                 end_time: datetime = None,
+                 columns: DataColumns = None,
+                 stream_timezone=None
+                 ):
+        """
+        DataStream whose data is stored in columns (NumPy arrays). The list of DataPoint objects is only created when
+        data is accessed.
+        :param identifier:
+        :param owner:
+        :param name:
+        :param data_descriptor:
+        :param execution_context:
+        :param annotations:
+        :param stream_type:
+        :param start_time:
+        :param end_time:
+        :param columns:
+        :param stream_timezone:
+        """
+        super().__init__(identifier, owner, name, data_descriptor, execution_context, annotations, stream_type,
+                         start_time, end_time, None, stream_timezone)
+        self._columns = columns if columns is not None else DataColumns()
+
+    @property
+    def columns(self):
+        if self._columns is None:
+            self._columns = DataColumns.from_datapoints(self._data)
+        return self._columns
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self._columns.to_datapoints()
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        DataStream.data.fset(self, value)
+        self._columns = None
+
+    def __len__(self):
+        if self._columns is not None:
+            return len(self._columns)
+        return len(self._data)
@@ -23,20 +23,42 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-from datetime import datetime
-from typing import Any
+from datetime import datetime, timedelta
+from typing import Any, Union
+
+# naive UTC datetime of epoch, integer start/end times are microseconds since this time
+EPOCH = datetime(1970, 1, 1)
+
+
+def _to_datetime(value: Union[datetime, int]) -> datetime:
+    if value is None or isinstance(value, datetime):
+        return value
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+def _to_timestamp(value: Union[datetime, int]) -> int:
+    if value is None:
+        return None
+    if not isinstance(value, datetime):
+        return int(value)
+    if value.tzinfo is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+    return (value - EPOCH) // timedelta(microseconds=1)
 
 
 class DataPoint:
+    # no per instance __dict__, DataPoints are kept in memory by the millions
+    __slots__ = ("_start_time", "_end_time", "_offset", "_sample")
+
     def __init__(self,
-                 start_time: datetime = None,
-                 end_time: datetime = None,
+                 start_time: Union[datetime, int] = None,
+                 end_time: Union[datetime, int] = None,
                  offset: str = None,
                  sample: Any = None):
         """
         DataPoint is the lowest data representations entity in CerebralCortex.
-        :param start_time:
-        :param end_time:
+        :param start_time: datetime or UTC microseconds since epoch
+        :param end_time: datetime or UTC microseconds since epoch
         :param offset: in milliseconds
         :param sample:
         """
@@ -55,7 +77,8 @@ class DataPoint:
 
     @property
     def start_time(self):
-        return self._start_time
+        # integer times are stored as is and converted to naive UTC datetimes on access
+        return _to_datetime(self._start_time)
 
     @start_time.setter
     def start_time(self, val):
@@ -63,12 +86,26 @@ class DataPoint:
 
     @property
     def end_time(self):
-        return self._end_time
+        return _to_datetime(self._end_time)
 
     @end_time.setter
     def end_time(self, val):
         self._end_time = val
 
+    @property
+    def start_timestamp(self) -> int:
+        """
+        :return: start time in UTC microseconds since epoch, naive datetimes are treated as UTC
+        """
+        return _to_timestamp(self._start_time)
+
+    @property
+    def end_timestamp(self) -> int:
+        """
+        :return: end time in UTC microseconds since epoch or None, naive datetimes are treated as UTC
+        """
+        return _to_timestamp(self._end_time)
+
     @property
     def offset(self):
         return self._offset
@@ -78,26 +115,43 @@ class DataPoint:
         self._offset = val
 
     def getKey(self):
-        return self._start_time
+        return self.start_time
 
     @classmethod
     def from_tuple(cls, start_time: datetime, sample: Any, end_time: datetime = None, offset: str = None):
         return cls(start_time=start_time, end_time=end_time, offset=offset, sample=sample)
 
+    def __copy__(self):
+        return DataPoint(self._start_time, self._end_time, self._offset, self._sample)
+
+    def __getstate__(self):
+        # same state as DataPoints pickled before __slots__, files stay readable by older versions
+        return {"_start_time": self.start_time, "_end_time": self.end_time, "_offset": self._offset,
+                "_sample": self._sample}
+
+    def __setstate__(self, state):
+        # (None, slots) state is created by the default pickling of classes with __slots__
+        if isinstance(state, tuple):
+            state = state[1]
+        self._start_time = state.get("_start_time")
+        self._end_time = state.get("_end_time")
+        self._offset = state.get("_offset")
+        self._sample = state.get("_sample")
+
     def __str__(self):
         return 'DataPoint(' + ', '.join(
-            map(str, [self._start_time, self._end_time, self._offset, self._sample])) + ')\n'
+            map(str, [self.start_time, self.end_time, self._offset, self._sample])) + ')\n'
 
     def __repr__(self):
         return 'DataPoint(' + ', '.join(
-            map(str, [self._start_time, self._end_time, self._offset, self._sample])) + ')\n'
+            map(str, [self.start_time, self.end_time, self._offset, self._sample])) + ')\n'
 
     def __lt__(self, dp):
         # if hasattr(dp, 'getKey'):
         return self.getKey().__lt__(dp.getKey())
 
     def __eq__(self, dp):
-        return self._start_time == dp.start_time
+        return self.start_time == dp.start_time
 
     def __hash__(self):
         return hash(('start_time', self.start_time))
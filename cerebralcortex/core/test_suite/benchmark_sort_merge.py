@@ -0,0 +1,94 @@
+# Copyright (c) 2018, MD2K Center of Excellence
+# - Nasir Ali <nasir.ali08@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from cerebralcortex.core.data_manager.raw.stream_handler import StreamHandler
+from cerebralcortex.core.datatypes.columnar_datastream import DataColumns
+from cerebralcortex.core.datatypes.datapoint import DataPoint
+
+
+def gen_day(total_points: int, start_time: datetime = datetime(2018, 2, 21)) -> list:
+    """
+    Generate a sorted day of DataPoints, spread evenly over 24 hours
+    :param total_points:
+    :param start_time:
+    :return: list of DataPoints
+    """
+    step = 86400000000 // total_points
+    return [DataPoint(start_time + timedelta(microseconds=i * step), None, -21600000, [random.random()]) for i in
+            range(total_points)]
+
+
+def legacy_filter_sort(data: list) -> list:
+    """
+    sort/dedup of DataPoints before the merge based implementation, used as baseline
+    :param data:
+    :return: list of DataPoints
+    """
+    data = sorted(data)
+    result = [data[0]]
+    for dp in data[1:]:
+        if dp.start_time == result[-1].start_time:
+            continue
+        result.append(dp)
+    return result
+
+
+def timeit(name: str, method, *args):
+    start = time.time()
+    result = method(*args)
+    print("%-60s %8.3f seconds %10d DataPoints" % (name, time.time() - start, len(result)))
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark sort, dedup and merge of a stream-day")
+    parser.add_argument("-n", "--total_points", help="DataPoints in the day", type=int, default=5000000)
+    parser.add_argument("-b", "--batch_size", help="DataPoints in the incoming batch", type=int, default=100000)
+    args = vars(parser.parse_args())
+
+    stream_handler = StreamHandler()
+    day = gen_day(args["total_points"])
+    # incoming batch: shuffled, overlaps the day and contains duplicates
+    batch = random.sample(day, args["batch_size"] // 2) + gen_day(args["batch_size"] // 2,
+                                                                  datetime(2018, 2, 21, 0, 0, 0, 1))
+    random.shuffle(batch)
+
+    timeit("legacy: sorted() + dedup of day + batch", legacy_filter_sort, day + batch)
+    timeit("filter_sort_datapoints of day + batch", stream_handler.filter_sort_datapoints, day + batch)
+    timeit("filter_sort_datapoints of sorted day", stream_handler.filter_sort_datapoints, day)
+    timeit("merge_day_blocks: sort batch, merge with sorted day",
+           lambda: stream_handler.merge_day_blocks([stream_handler.filter_sort_datapoints(batch), day]))
+    later_segment = gen_day(args["batch_size"], datetime(2018, 2, 22))
+    timeit("merge_day_blocks of non overlapping segment", stream_handler.merge_day_blocks, [later_segment, day])
+
+    day_columns = DataColumns.from_datapoints(day)
+    batch_columns = DataColumns.from_datapoints(batch)
+    timeit("DataColumns.merge: argsort/dedup of day + batch", DataColumns.merge, [batch_columns, day_columns])
+    timeit("DataColumns.merge of non overlapping segment", DataColumns.merge,
+           [DataColumns.from_datapoints(later_segment), day_columns])
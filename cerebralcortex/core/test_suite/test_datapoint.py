@@ -24,12 +24,16 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
+import pickle
+
 from dateutil import parser
 import unittest
-from cerebralcortex.core.data_manager.raw.stream_handler import StreamHandler
+from cerebralcortex.core.data_manager.raw.stream_handler import StreamHandler, get_days
 from cerebralcortex.core.data_manager.raw.file_to_db import FileToDB
 
+from cerebralcortex.core.datatypes.columnar_datastream import DataColumns
 from cerebralcortex.core.datatypes.datapoint import DataPoint
+from cerebralcortex.core.util.datetime_helper_methods import get_timezone, get_timezone_info
 
 class TestDataPoints():
 
@@ -52,6 +56,111 @@ class TestDataPoints():
         self.assertEqual(clean_data[2],dps[1])
         self.assertEqual(clean_data[3],dps[5])
 
+    def test_02_merge_day_blocks(self):
+        """
+        Merge of day file segments (newest first), newest DataPoint wins on equal start time
+        :return:
+        """
+        day_file = [DataPoint(parser.parse("2018-02-21 23:28:21"), None, -21600000, [1]),
+                    DataPoint(parser.parse("2018-02-21 23:28:23"), None, -21600000, [1])]
+        segment = [DataPoint(parser.parse("2018-02-21 23:28:22"), None, -21600000, [2]),
+                   DataPoint(parser.parse("2018-02-21 23:28:23"), None, -21600000, [2])]
+
+        merged = StreamHandler().merge_day_blocks([segment, day_file])
+        self.assertEqual(len(merged), 3)
+        self.assertEqual([dp.sample for dp in merged], [[1], [2], [2]])
+
+        # non overlapping segments are concatenated in time order
+        later_segment = [DataPoint(parser.parse("2018-02-21 23:28:24"), None, -21600000, [3])]
+        merged = StreamHandler().merge_day_blocks([later_segment, day_file])
+        self.assertEqual([dp.sample for dp in merged], [[1], [1], [3]])
+
+    def test_03_filter_sort_datapoints(self):
+        dps = [DataPoint(parser.parse("2018-02-21 23:28:2" + str(i)), None, -21600000, [i]) for i in [3, 1, 2, 1]]
+        clean_data = StreamHandler().filter_sort_datapoints(dps)
+        self.assertEqual([dp.sample for dp in clean_data], [[1], [2], [3]])
+
+    def test_04_subset_data(self):
+        dps = [DataPoint(parser.parse("2018-02-21 23:28:2" + str(i)), None, -21600000, [i]) for i in range(10)]
+        subset = StreamHandler().subset_data(dps, parser.parse("2018-02-21 23:28:22"), parser.parse("2018-02-21 23:28:25"))
+        self.assertEqual([dp.sample for dp in subset], [[2], [3], [4], [5]])
+        subset = StreamHandler().subset_data(dps, end_time=parser.parse("2018-02-21 23:28:21.5"))
+        self.assertEqual([dp.sample for dp in subset], [[0], [1]])
+
+    def test_05_get_timezone(self):
+        self.assertEqual(get_timezone(-21600000), "America/Bahia_Banderas")
+        self.assertIs(get_timezone_info(-21600000), get_timezone_info(-21600000))
+        self.assertEqual(get_timezone_info(-21600000).zone, "America/Bahia_Banderas")
+        # no named timezone has an offset of 2 minutes
+        self.assertEqual(get_timezone(120000), "")
+        self.assertEqual(get_timezone_info(120000).utcoffset(None).total_seconds(), 120)
+
+    def test_06_convert_to_localtime(self):
+        # 2018-03-11 is the day of daylight saving time change in the US
+        dps = [DataPoint(parser.parse("2018-03-11 09:59:59"), None, -28800000, [0]),
+               DataPoint(parser.parse("2018-03-11 10:00:00"), parser.parse("2018-03-11 10:00:01"), -25200000, [1])]
+        stream_handler = StreamHandler()
+        local = stream_handler.convert_to_localtime(list(dps), True)
+        self.assertEqual(str(local[0].start_time), "2018-03-11 01:59:59-08:00")
+        self.assertEqual(str(local[1].start_time), "2018-03-11 03:00:00-07:00")
+        self.assertEqual(str(local[1].end_time), "2018-03-11 03:00:01-07:00")
+        self.assertIsNone(local[0].end_time)
+        utc = stream_handler.convert_to_UTCtime(local)
+        self.assertEqual(str(utc[1].start_time), "2018-03-11 10:00:00+00:00")
+
+        stream_handler.localtime_conversion = "offset"
+        dps = [DataPoint(parser.parse("2018-03-11 09:59:59"), None, -28800000, [0]),
+               DataPoint(parser.parse("2018-03-11 10:00:00"), None, -21600000, [1])]
+        local = stream_handler.convert_to_localtime(dps, True)
+        self.assertEqual(str(local[1].start_time), "2018-03-11 04:00:00-06:00")
+
+    def test_07_compact_datapoint(self):
+        dp = DataPoint(1520762400000000, None, -28800000, [1])
+        self.assertEqual(dp.start_time, parser.parse("2018-03-11 10:00:00"))
+        self.assertEqual(dp.start_timestamp, 1520762400000000)
+        self.assertEqual(DataPoint(parser.parse("2018-03-11 02:00:00-08:00")).start_timestamp, 1520762400000000)
+        self.assertFalse(hasattr(dp, "__dict__"))
+
+        # pickled state is the same as of DataPoints with __dict__ stored in existing day files
+        state = dp.__getstate__()
+        self.assertEqual(state, {"_start_time": parser.parse("2018-03-11 10:00:00"), "_end_time": None,
+                                 "_offset": -28800000, "_sample": [1]})
+        legacy_dp = DataPoint.__new__(DataPoint)
+        legacy_dp.__setstate__(state)
+        self.assertEqual(str(legacy_dp), str(dp))
+        self.assertEqual(str(pickle.loads(pickle.dumps(dp))), str(dp))
+
+    def test_08_get_days(self):
+        self.assertEqual(get_days(parser.parse("2018-02-27 23:00:00"), parser.parse("2018-03-01 01:00:00")),
+                         ["20180227", "20180228", "20180301"])
+        self.assertEqual(get_days(parser.parse("2018-02-27 23:00:00"), parser.parse("2018-02-27 23:30:00")),
+                         ["20180227"])
+        self.assertEqual(get_days(parser.parse("2018-02-28"), parser.parse("2018-02-27")), [])
+
+    def test_09_merge_block_iterators(self):
+        newest = [[DataPoint(parser.parse("2018-02-21 23:28:21"), None, 0, "new")],
+                  [DataPoint(parser.parse("2018-02-21 23:28:24"), None, 0, "new")]]
+        oldest = [[DataPoint(parser.parse("2018-02-21 23:28:2" + str(i)), None, 0, "old") for i in range(4)]]
+        blocks = list(StreamHandler().merge_block_iterators([iter(newest), iter(oldest)], block_size=2))
+        self.assertEqual([len(block) for block in blocks], [2, 2, 1])
+        self.assertEqual([dp.sample for block in blocks for dp in block], ["old", "new", "old", "old", "new"])
+
+    def test_10_read_days(self):
+        class Reader(StreamHandler):
+            def read_data(self, owner_id, stream_id, day, start_time=None, end_time=None, localtime=False,
+                          columnar=False):
+                data = [DataPoint(parser.parse(day + " 23:28:2" + str(i)), None, 0, stream_id) for i in range(2)]
+                return DataColumns.merge([data]) if columnar else data
+
+        # DataPoints of different stream ids of a stream name are kept on equal start times
+        reader = Reader()
+        data = reader.read_days("owner", ["phone", "watch"], ["20180221", "20180222"])
+        self.assertEqual([dp.sample for dp in data], ["phone", "watch"] * 4)
+        self.assertEqual(len(reader.read_days("owner", ["phone"], ["20180221", "20180222"])), 4)
+        columns = reader.read_days("owner", ["phone", "watch"], ["20180221", "20180222"], columnar=True)
+        self.assertEqual(list(columns.sample), ["phone", "watch"] * 4)
+        self.assertEqual(reader.read_days("owner", ["phone", "watch"], []), [])
+
     # def test_02_line_to_sample(self):
     #     file_to_db = FileToDB(self.CC)
     #     msg = {"metadata":self.metadata, "day":"20180412", "filename": self.corupt_data+","}
@@ -0,0 +1,65 @@
+# Copyright (c) 2018, MD2K Center of Excellence
+# - Nasir Ali <nasir.ali08@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import tempfile
+
+from cerebralcortex.core.data_manager.raw.day_file_disk_cache import DayFileDiskCache, get_cache_file_name
+
+
+class TestDayFileDiskCache():
+
+    def test_01_day_file_disk_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        cache = DayFileDiskCache(cache_dir, 1000)
+        fetched = []
+
+        def fetch():
+            fetched.append(1)
+            return b"x" * 300
+
+        for version in [(1, 300), (1, 300), (2, 300)]:
+            with cache.open("hdfs://localhost:8020/cc/owner/stream/20180221.gz", version, fetch) as day_file:
+                self.assertEqual(day_file.read(), b"x" * 300)
+        # second read is local, changed file is fetched again and replaces the outdated copy
+        self.assertEqual(len(fetched), 2)
+        self.assertEqual(len(cache.files), 1)
+        self.assertIsNone(cache.open("hdfs://localhost:8020/cc/owner/stream/20180222.gz", (1, 0), lambda: None))
+
+        # least recently used files are removed first, cached files are found by later processes
+        for day in range(4):
+            cache.open("s3://bucket/cc/owner/stream/2018022" + str(day) + ".gz", (1, 300), fetch).close()
+        self.assertEqual(len(cache.files), 3)
+        self.assertEqual(dict(DayFileDiskCache(cache_dir, 1000).files), dict(cache.files))
+
+        # files of other processes count against the budget
+        other_cache = DayFileDiskCache(cache_dir, 1000)
+        other_cache.open("s3://bucket/cc/owner/stream/20180301.gz", (1, 300), fetch).close()
+        cache.open("s3://bucket/cc/owner/stream/20180302.gz", (1, 300), fetch).close()
+        self.assertEqual(len(os.listdir(cache_dir)), 3)
+        self.assertEqual(cache.size, 900)
+        self.assertIn(get_cache_file_name("s3://bucket/cc/owner/stream/20180301.gz", (1, 300)), cache.files)
+        cache.clear()
+        self.assertEqual(os.listdir(cache_dir), [])
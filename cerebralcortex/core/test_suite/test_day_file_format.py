@@ -0,0 +1,342 @@
+# Copyright (c) 2018, MD2K Center of Excellence
+# - Nasir Ali <nasir.ali08@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+
+import numpy
+import pyarrow
+from dateutil import parser
+
+from cerebralcortex.core.data_manager.raw.compression import Codec, get_codec_name, GZIP_CODEC, ZSTD_CODEC, LZ4_CODEC, \
+    DEFAULT_CODEC
+from cerebralcortex.core.data_manager.raw.day_block_cache import DayBlockCache, copy_block, get_block_size
+from cerebralcortex.core.data_manager.raw.storage_blueprint import BlueprintStorage
+from cerebralcortex.core.data_manager.raw.stream_handler import StreamHandler
+from cerebralcortex.core.data_manager.raw.day_file_format import serialize_day_file, deserialize_day_file, \
+    get_days_to_compact, get_block_window, write_day_file, iter_day_file_blocks, read_block_index, FILE_EXTENSIONS, \
+    ARROW_FORMAT, PARQUET_FORMAT, PICKLE_FORMAT
+from cerebralcortex.core.datatypes.columnar_datastream import ColumnarDataStream, DataColumns
+from cerebralcortex.core.datatypes.datapoint import DataPoint
+from cerebralcortex.core.util.data_types import serialize_obj, deserialize_obj
+
+
+class TestDayFileFormat():
+
+    def test_01_parquet_round_trip(self):
+        """
+        DataPoints with typed, mixed and object samples shall be identical after parquet encode/decode
+        :return:
+        """
+        sample_sets = [[[1.2, 3.4, 5], [6.7, 8.9, 10]],
+                       [['com.sec.android.app.camera', None, None, None], ['a', 'b', None, 'c']],
+                       [123.0, 124.0],
+                       [[1, 1.5], [2, 2.5]],
+                       [5, 1.5],
+                       [{"k1": "v1"}, {"k2": "v2"}]]
+        for samples in sample_sets:
+            dps = []
+            for i, sample in enumerate(samples):
+                dps.append(DataPoint(parser.parse("2018-02-21 23:28:2" + str(i) + ".133"),
+                                     parser.parse("2018-02-21 23:28:2" + str(i) + ".533"), -21600000, sample))
+            data = deserialize_day_file(serialize_day_file(dps, PARQUET_FORMAT), "20180221.parquet")
+            self.assertEqual(len(data), len(dps))
+            for dp, decoded_dp in zip(dps, data):
+                self.assertEqual(dp.start_time, decoded_dp.start_time)
+                self.assertEqual(dp.end_time, decoded_dp.end_time)
+                self.assertEqual(dp.offset, decoded_dp.offset)
+                self.assertEqual(dp.sample, decoded_dp.sample)
+                # ints of a column mixing ints and floats are not converted to floats
+                self.assertEqual(repr(dp.sample), repr(decoded_dp.sample))
+
+    def test_02_pickle_round_trip(self):
+        dps = [DataPoint(parser.parse("2018-02-21 23:28:21"), None, -21600000, [1, 2])]
+        data = deserialize_day_file(serialize_day_file(dps, PICKLE_FORMAT), "20180221.gz")
+        self.assertEqual(data[0].start_time, dps[0].start_time)
+        self.assertEqual(data[0].sample, [1, 2])
+
+        # day files written to a file object while they are encoded
+        for file_format in [PICKLE_FORMAT, PARQUET_FORMAT]:
+            day_file = BytesIO()
+            write_day_file(dps, day_file, file_format)
+            data = deserialize_day_file(day_file.getvalue(), "20180221" + FILE_EXTENSIONS[file_format])
+            self.assertEqual(data[0].start_time, dps[0].start_time)
+            self.assertEqual(data[0].sample, [1, 2])
+
+        # codec of a day file is detected on read
+        for codec_name in [GZIP_CODEC, ZSTD_CODEC, LZ4_CODEC]:
+            for file_format in [PICKLE_FORMAT, PARQUET_FORMAT]:
+                day_file = BytesIO()
+                write_day_file(dps, day_file, file_format, codec=Codec(codec_name))
+                for contents in [day_file.getvalue(), serialize_day_file(dps, file_format, codec=Codec(codec_name))]:
+                    if file_format == PICKLE_FORMAT:
+                        self.assertEqual(get_codec_name(contents), codec_name)
+                    data = deserialize_day_file(contents, "20180221" + FILE_EXTENSIONS[file_format])
+                    self.assertEqual(data[0].sample, [1, 2])
+
+    def test_03_days_to_compact(self):
+        names = ["20180220.gz", "20180221.gz", "20180221/1519255701133000-1a2b3c4d.gz", "20180222.pickle",
+                 "20180223.parquet", "20180224.parquet.tmp"]
+        self.assertEqual(get_days_to_compact(names, PICKLE_FORMAT), ["20180221", "20180222", "20180223"])
+        self.assertEqual(get_days_to_compact(names, PARQUET_FORMAT), ["20180220", "20180221", "20180222"])
+
+    def test_04_block_range_read(self):
+        """
+        Only blocks overlapping the window shall be decoded from a parquet day file
+        :return:
+        """
+        start_time = parser.parse("2018-02-21 23:28:21")
+        dps = [DataPoint(start_time + timedelta(seconds=i), None, -21600000, [i]) for i in range(30)]
+        data = serialize_day_file(dps, PARQUET_FORMAT, block_size=10)
+
+        block_start, block_end = get_block_window(start_time + timedelta(seconds=12), start_time + timedelta(seconds=15))
+        window = deserialize_day_file(data, "20180221.parquet", block_start, block_end)
+        self.assertEqual([dp.sample for dp in window], [[i] for i in range(10, 20)])
+
+        block_start, block_end = get_block_window(start_time + timedelta(seconds=25))
+        self.assertEqual(len(deserialize_day_file(data, "20180221.parquet", block_start, block_end)), 10)
+        self.assertEqual(len(deserialize_day_file(data, "20180221.parquet")), 30)
+
+    def test_05_columnar_read(self):
+        """
+        DataColumns decoded from a day file shall convert to the same DataPoints as a DataPoint read
+        :return:
+        """
+        start_time = parser.parse("2018-02-21 23:28:21")
+        dps = [DataPoint(start_time + timedelta(seconds=i), None, -21600000, [float(i), i * 0.5]) for i in range(20)]
+        for file_format, filename in ((PARQUET_FORMAT, "20180221.parquet"), (PICKLE_FORMAT, "20180221.gz")):
+            columns = deserialize_day_file(serialize_day_file(dps, file_format), filename, columnar=True)
+            self.assertEqual(columns.sample.shape, (20, 2))
+            stream = ColumnarDataStream(columns=columns)
+            self.assertEqual(len(stream), 20)
+            for dp, columnar_dp in zip(dps, stream.data):
+                self.assertEqual(dp.start_time, columnar_dp.start_time)
+                self.assertEqual(dp.end_time, columnar_dp.end_time)
+                self.assertEqual(dp.offset, columnar_dp.offset)
+                self.assertEqual(dp.sample, columnar_dp.sample)
+
+            # memory mapped day files are decoded without reading them into bytes first
+            with tempfile.NamedTemporaryFile(suffix=filename) as day_file:
+                day_file.write(serialize_day_file(dps, file_format))
+                day_file.flush()
+                with pyarrow.memory_map(day_file.name) as mapped_file:
+                    mapped_columns = deserialize_day_file(mapped_file, filename, columnar=True)
+                self.assertTrue(numpy.array_equal(mapped_columns.sample, columns.sample))
+
+        # NumPy columns are pickled out-of-band and unpickled without copies
+        buffers = []
+        pickled_columns = serialize_obj(columns, buffers.append)
+        unpickled_columns = deserialize_obj(pickled_columns, [buffer.raw() for buffer in buffers])
+        self.assertTrue(numpy.array_equal(unpickled_columns.sample, columns.sample))
+        self.assertTrue(any(numpy.shares_memory(unpickled_columns.sample, numpy.frombuffer(buffer, dtype=numpy.uint8))
+                            for buffer in buffers))
+
+        # newest block wins on equal start times, result is sorted
+        newest = DataColumns.from_datapoints([DataPoint(start_time + timedelta(seconds=5), None, -21600000, ["new"])])
+        merged = DataColumns.merge([newest, DataColumns.from_datapoints(dps[::-1])])
+        self.assertEqual(len(merged), 20)
+        self.assertEqual(merged.samples()[5], ["new"])
+        self.assertEqual(list(merged.start_time), sorted(merged.start_time))
+
+        # ints are not converted to floats by samples mixing ints and floats or by merging int and float columns
+        for samples in ([[1, 1.5], [2, 2.5]], [5, 1.5]):
+            columns = DataColumns.from_datapoints([DataPoint(start_time + timedelta(seconds=i), None, 0, sample)
+                                                   for i, sample in enumerate(samples)])
+            self.assertEqual(repr(columns.samples()), repr(samples))
+        merged = DataColumns.merge([DataColumns.from_datapoints([DataPoint(start_time, None, 0, 1)]),
+                                    DataColumns.from_datapoints([DataPoint(start_time + timedelta(seconds=1), None, 0,
+                                                                           1.5)])])
+        self.assertEqual(repr(merged.samples()), repr([1, 1.5]))
+
+    def test_06_day_block_cache(self):
+        block = [DataPoint(1519255701133000 + i, None, -21600000, [i]) for i in range(10)]
+        key = ("owner", "stream", "20180221", False)
+        versions = (("20180221.gz", 1, 100),)
+        cache = DayBlockCache(10 * get_block_size(block))
+
+        cache.put(key, versions, 1519255701133000, 1519255701133005, block)
+        self.assertIs(cache.get(key, versions, 1519255701133001, 1519255701133005), block)
+        # window is not covered by the cached block
+        self.assertIsNone(cache.get(key, versions, 1519255701133001, 1519255701133006))
+        # files changed after the block was cached
+        self.assertIsNone(cache.get(key, (("20180221.gz", 2, 100),), 1519255701133001, 1519255701133005))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+        cache.invalidate("owner", "stream", "20180221")
+        self.assertIsNone(cache.get(key, versions))
+        self.assertEqual(cache.size, 0)
+
+        # least recently used blocks are removed first
+        for day in range(20):
+            cache.put(("owner", "stream", str(day), False), versions, None, None, block)
+        self.assertEqual(len(cache.blocks), 10)
+        self.assertIsNotNone(cache.get(("owner", "stream", "19", False), versions))
+        self.assertIsNone(cache.get(("owner", "stream", "9", False), versions))
+
+        copied_block = copy_block(block)
+        copied_block[0].start_time = None
+        self.assertEqual(block[0].start_timestamp, 1519255701133000)
+
+    def test_11_pickle_blocks(self):
+        start_time = parser.parse("2018-02-21 00:00:00")
+        dps = [DataPoint(start_time + timedelta(minutes=i), None, 0, i) for i in range(25)]
+        codec = Codec(ZSTD_CODEC, workers=2)
+
+        # pickle day files of more than one block are compressed block by block
+        day_file = serialize_day_file(dps, PICKLE_FORMAT, 10, codec)
+        blocks = read_block_index(day_file)
+        self.assertEqual(len(blocks), 3)
+        self.assertEqual(blocks[0][2:], (dps[0].start_timestamp, dps[9].start_timestamp))
+        self.assertIsNone(read_block_index(serialize_day_file(dps, PICKLE_FORMAT, 25, codec)))
+        data = deserialize_day_file(day_file, "20180221.gz", codec=codec)
+        self.assertEqual([dp.sample for dp in data], list(range(25)))
+
+        # only blocks overlapping the window are decoded
+        window = get_block_window(start_time + timedelta(minutes=12), start_time + timedelta(minutes=14))
+        data = deserialize_day_file(day_file, "20180221.gz", window[0], window[1], codec=codec)
+        self.assertEqual([dp.sample for dp in data], list(range(10, 20)))
+        blocks = list(iter_day_file_blocks(BytesIO(day_file), "20180221.gz", window[1], None, codec))
+        self.assertEqual([len(block) for block in blocks], [10, 5])
+
+    def test_12_arrow_day_file(self):
+        start_time = parser.parse("2018-02-21 00:00:00")
+        for samples in ([[i, i * 0.5] for i in range(20)], list(range(20)), [{"label": i} for i in range(20)]):
+            dps = [DataPoint(start_time + timedelta(minutes=i), None, 0, sample) for i, sample in enumerate(samples)]
+            data = deserialize_day_file(serialize_day_file(dps, ARROW_FORMAT), "20180221.arrow")
+            self.assertEqual([dp.sample for dp in data], samples)
+            self.assertEqual([dp.start_time for dp in data], [dp.start_time for dp in dps])
+
+        # columns of a memory mapped arrow day file are read-only views of the mapped file
+        dps = [DataPoint(start_time + timedelta(minutes=i), None, 0, [i * 1.0, i * 0.5]) for i in range(20)]
+        with tempfile.NamedTemporaryFile(suffix=".arrow") as day_file:
+            day_file.write(serialize_day_file(dps, ARROW_FORMAT))
+            day_file.flush()
+            with pyarrow.memory_map(day_file.name) as mapped_file:
+                columns = deserialize_day_file(mapped_file, "20180221.arrow", dps[5].start_timestamp,
+                                               dps[9].start_timestamp, columnar=True)
+                self.assertEqual(columns.sample.shape, (5, 2))
+                self.assertEqual(list(columns.sample[:, 0]), [5, 6, 7, 8, 9])
+                self.assertFalse(columns.start_time.flags.owndata)
+                self.assertFalse(columns.sample.flags.writeable)
+
+    def test_14_day_file_removed_while_read(self):
+        class RawData():
+            day_file_format = PICKLE_FORMAT
+            day_file_codec = DEFAULT_CODEC
+            day_cache = DayBlockCache(0)
+
+            def has_stream_day(self, stream_id, day):
+                return True
+
+            def read_cached_day_block(self, owner_id, stream_id, day, versions, start_time, end_time, columnar,
+                                      read_day_block):
+                return read_day_block(start_time, end_time)
+
+            def merge_day_blocks(self, blocks):
+                return sorted([dp for block in blocks for dp in block], key=lambda dp: dp.start_time)
+
+            def merge_block_iterators(self, iterators):
+                yield self.merge_day_blocks([block for iterator in iterators for block in iterator])
+
+        class Storage(BlueprintStorage):
+            def __init__(self, obj, files):
+                super().__init__(obj)
+                self.files = files
+                self.lists = 0
+                self.compactions = 0
+
+            def get_stream_dir(self, owner_id, stream_id):
+                return "/" + owner_id + "/" + stream_id + "/"
+
+            def list_files(self, dirname, filenames, connection):
+                self.lists += 1
+                return {name: (len(contents),) for name, contents in self.files.items() if
+                        name.startswith(dirname) or name in filenames}
+
+            def open_day_file(self, filename, connection, version=None):
+                if self.compactions > 0:
+                    # a compaction merges the listed files into a new segment after the day was listed
+                    self.compactions -= 1
+                    data = [dp for name in list(self.files) for dp in deserialize_day_file(self.files.pop(name), name)]
+                    self.files["/owner/stream/20180221/" + str(self.compactions) + ".gz"] = serialize_day_file(
+                        data, PICKLE_FORMAT)
+                return BytesIO(self.files[filename]) if filename in self.files else None
+
+        start_time = parser.parse("2018-02-21 00:00:00")
+        data = [DataPoint(start_time + timedelta(minutes=i), None, 0, i) for i in range(4)]
+        segments = {"/owner/stream/20180221/" + str(i) + "0.gz": serialize_day_file(data[i:i + 1], PICKLE_FORMAT)
+                    for i in range(4)}
+
+        # the day is listed again once if a listed file was removed by a compaction before it was read
+        storage = Storage(RawData(), dict(segments))
+        storage.compactions = 1
+        self.assertEqual([dp.sample for dp in storage.read_day_file("owner", "stream", "20180221")], [0, 1, 2, 3])
+        self.assertEqual(storage.lists, 2)
+        storage = Storage(RawData(), dict(segments))
+        storage.compactions = 1
+        blocks = list(storage.iter_day_file("owner", "stream", "20180221"))
+        self.assertEqual([dp.sample for block in blocks for dp in block], [0, 1, 2, 3])
+        self.assertEqual(storage.lists, 2)
+
+        # a missing file is an error, not a stream-day without data
+        storage = Storage(RawData(), dict(segments))
+        storage.compactions = 2
+        with self.assertRaises(FileNotFoundError):
+            storage.read_day_file("owner", "stream", "20180221")
+        storage = Storage(RawData(), dict(segments))
+        storage.compactions = 2
+        with self.assertRaises(FileNotFoundError):
+            list(storage.iter_day_file("owner", "stream", "20180221"))
+        with self.assertRaises(FileNotFoundError):
+            storage.read_day_file("owner", "stream", "20180221", ["/owner/stream/20180221/00.gz"])
+
+    def test_15_mixed_format_merge(self):
+        """
+        Timezone aware DataPoints of pickle day files shall merge with naive DataPoints of parquet and arrow day files
+        :return:
+        """
+        start_time = parser.parse("2018-02-21 23:28:20+00:00")
+        day_file = deserialize_day_file(serialize_day_file(
+            [DataPoint(start_time + timedelta(seconds=i), None, 0, "gz") for i in range(4)], PICKLE_FORMAT),
+            "20180221.gz")
+        stream_handler = StreamHandler()
+        for file_format in [PARQUET_FORMAT, ARROW_FORMAT]:
+            segment = deserialize_day_file(serialize_day_file(
+                [DataPoint(start_time + timedelta(seconds=i), None, 0, "new") for i in [1, 3, 5]], file_format),
+                "20180221" + FILE_EXTENSIONS[file_format])
+            self.assertIsNone(segment[0].start_time.tzinfo)
+            self.assertIsNotNone(day_file[0].start_time.tzinfo)
+
+            merged = stream_handler.merge_day_blocks([segment, day_file])
+            self.assertEqual([dp.sample for dp in merged], ["gz", "new", "gz", "new", "new"])
+            blocks = stream_handler.merge_block_iterators([iter([segment]), iter([day_file])])
+            self.assertEqual([dp.sample for block in blocks for dp in block], ["gz", "new", "gz", "new", "new"])
+            self.assertEqual(len(stream_handler.filter_sort_datapoints(day_file + segment)), 5)
+            subset = stream_handler.subset_data(merged, parser.parse("2018-02-21 23:28:21"),
+                                                parser.parse("2018-02-21 23:28:23"))
+            self.assertEqual([dp.sample for dp in subset], ["new", "gz", "new"])
+            local = stream_handler.convert_to_localtime(merged, True)
+            self.assertEqual(len(set(dp.start_time.tzinfo for dp in local)), 1)
@@ -0,0 +1,69 @@
+# Copyright (c) 2018, MD2K Center of Excellence
+# - Nasir Ali <nasir.ali08@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from cerebralcortex.core.data_manager.raw.hdfs_connection_pool import HDFSConnectionPool
+
+
+class TestHDFSConnectionPool():
+
+    def test_01_hdfs_connection_pool(self):
+        class Connection():
+            def __init__(self):
+                self.healthy = True
+                self.closed = False
+
+            def exists(self, path):
+                if not self.healthy:
+                    raise IOError("connection lost")
+                return True
+
+            def close(self):
+                self.closed = True
+
+        pool = HDFSConnectionPool("localhost", 8020, max_size=2, check_interval=0,
+                                  connect=lambda host, port: Connection())
+        with pool.connection() as hdfs:
+            pass
+        with pool.connection() as reused:
+            self.assertIs(reused, hdfs)
+        self.assertEqual(pool.created, 1)
+
+        # broken idle connections are replaced
+        hdfs.healthy = False
+        with pool.connection() as replaced:
+            self.assertIsNot(replaced, hdfs)
+        self.assertTrue(hdfs.closed)
+
+        # connections that raised an error are not returned to the pool
+        with self.assertRaises(IOError):
+            with pool.connection() as failed:
+                raise IOError("read failed")
+        self.assertTrue(failed.closed)
+        self.assertEqual(len(pool.idle), 0)
+
+        pool.warm_up()
+        self.assertEqual(len(pool.idle), 2)
+        pool.close()
+        self.assertEqual(len(pool.idle), 0)
@@ -29,16 +29,26 @@ import yaml
 import warnings
 
 from cerebralcortex.cerebralcortex import CerebralCortex
+from cerebralcortex.core.data_manager.object.data import ObjectData
 from cerebralcortex.core.test_suite.util.gen_test_data import gen_raw_data
 from cerebralcortex.core.test_suite.test_hdfs_and_filesystem import TestFileToDB, TestStreamHandler
 from cerebralcortex.core.test_suite.test_kafka import TestKafkaMessaging
 from cerebralcortex.core.test_suite.test_sample_parsing import TestSampleParsing
 from cerebralcortex.core.test_suite.test_minio import TestMinio
+from cerebralcortex.core.test_suite.test_multipart_upload import TestMultipartUpload
 from cerebralcortex.core.test_suite.test_users import TestUserMySQLMethods
 from cerebralcortex.core.test_suite.test_datapoint import TestDataPoints
+from cerebralcortex.core.test_suite.test_day_file_format import TestDayFileFormat
+from cerebralcortex.core.test_suite.test_day_file_disk_cache import TestDayFileDiskCache
+from cerebralcortex.core.test_suite.test_hdfs_connection_pool import TestHDFSConnectionPool
+from cerebralcortex.core.test_suite.test_stream_day_manifest import TestStreamDayManifest
+from cerebralcortex.core.test_suite.test_tiered_storage import TestTieredStorage
+from cerebralcortex.core.test_suite.test_write_buffer import TestWriteBuffer
 
 
-class TestCerebralCortex(unittest.TestCase, TestDataPoints, TestUserMySQLMethods, TestSampleParsing,  TestStreamHandler):
+class TestCerebralCortex(unittest.TestCase, TestDataPoints, TestUserMySQLMethods, TestSampleParsing,  TestStreamHandler,
+                         TestDayFileFormat, TestDayFileDiskCache, TestHDFSConnectionPool, TestMinio,
+                         TestMultipartUpload, TestStreamDayManifest, TestTieredStorage, TestWriteBuffer):
     def setUp(self):
         warnings.simplefilter("ignore")
         test_config_filepath = "./resources/cc_test_configuration.yml"#args["test_config_filepath"]
@@ -52,6 +62,9 @@ class TestCerebralCortex(unittest.TestCase, TestDataPoints, TestUserMySQLMethods
 
         self.CC = CerebralCortex(config_filepath, auto_offset_reset="smallest")
         self.cc_conf = self.CC.config
+        if "minio" not in self.cc_conf:
+            self.cc_conf["minio"] = test_conf["minio"]
+            self.CC.ObjectData = ObjectData(self.CC)
 
         self.owner_id = self.metadata["owner"]
         self.stream_id = self.metadata["identifier"]
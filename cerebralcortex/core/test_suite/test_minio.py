@@ -23,6 +23,7 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import os
 import unittest
 
 class TestMinio():
@@ -59,6 +60,10 @@ class TestMinio():
         except Exception as e:
             self.fail(e.message)
 
+        with open(self.gz_file.replace(".gz", ".json"), "rb") as obj_file:
+            self.assertEqual(self.CC.get_object_content(self.bucket_name, self.obj_name), obj_file.read())
+        self.assertIsNone(self.CC.get_object_content(self.bucket_name, "missing_" + self.obj_name))
+
         obj_list = self.CC.get_bucket_objects(self.bucket_name)['bucket-objects']
         found = False
         for obj in obj_list:
@@ -67,3 +72,18 @@ class TestMinio():
         if not found:
             self.fail("Faied get_bucket_objects, cannot find object.")
 
+        pages = list(self.CC.iter_bucket_objects(self.bucket_name, prefix=self.obj_name, page_size=1))
+        self.assertEqual(pages[0][0]["object_name"], self.obj_name)
+        self.assertEqual(pages[0][0]["size"], obj_stats["size"])
+        self.assertTrue(all(len(page) == 1 for page in pages))
+
+    def test_04_object_transfer(self):
+        # three parts of 5 MB, uploaded and downloaded in parallel
+        content = os.urandom(12 * 1024 * 1024)
+        self.CC.ObjectData.part_size = 5 * 1024 * 1024
+        with self.CC.ObjectData.open_object_upload(self.bucket_name, "multipart_" + self.obj_name) as upload:
+            upload.write(content)
+        chunks = list(self.CC.ObjectData.get_object_stream(self.bucket_name, "multipart_" + self.obj_name))
+        self.assertEqual([len(chunk) for chunk in chunks], [5 * 1024 * 1024, 5 * 1024 * 1024, 2 * 1024 * 1024])
+        self.assertEqual(b"".join(chunks), content)
+        self.CC.ObjectData.remove_object(self.bucket_name, "multipart_" + self.obj_name)
@@ -0,0 +1,130 @@
+# Copyright (c) 2017, MD2K Center of Excellence
+# - Nasir Ali <nasir.ali08@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import sys
+import types
+
+from cerebralcortex.core.data_manager.object.multipart_upload import MultipartUpload, Minio2PartApi, Minio6PartApi, \
+    MIN_PART_SIZE, get_part_api
+
+
+class FakeMinio():
+    """
+    Records the requests of an upload, _new_multipart_upload/_complete_multipart_upload/_remove_incomplete_upload have
+    the same signature in minio 2.x and 6.x
+    """
+
+    def __init__(self):
+        self.parts = {}
+        self.objects = {}
+        self.aborted = []
+
+    def _new_multipart_upload(self, bucket_name, object_name, metadata=None):
+        return "upload-" + object_name
+
+    def _complete_multipart_upload(self, bucket_name, object_name, upload_id, uploaded_parts):
+        # etags of minio 6.x come with the version id of the part
+        assert all(part.etag == "etag-" + str(part_number) for part_number, part in uploaded_parts.items())
+        self.objects[object_name] = b"".join(self.parts[(upload_id, part_number)] for part_number in
+                                             sorted(uploaded_parts))
+
+    def _remove_incomplete_upload(self, bucket_name, object_name, upload_id):
+        self.aborted.append(upload_id)
+
+    def put_object(self, bucket_name, object_name, data, length, content_type='application/octet-stream'):
+        self.objects[object_name] = data.read(length)
+
+
+class FakeMinio2(FakeMinio):
+    def _do_put_multipart_object(self, bucket_name, object_name, part_metadata, upload_id, part_number):
+        self.parts[(upload_id, part_number)] = part_metadata.data.read()
+        return "etag-" + str(part_number)
+
+
+class FakeMinio6(FakeMinio):
+    def _do_put_object(self, bucket_name, object_name, part_data, part_size, upload_id='', part_number=0):
+        if part_number == 3 and object_name == "failing":
+            raise IOError("part upload failed")
+        self.parts[(upload_id, part_number)] = part_data[:part_size]
+        return "etag-" + str(part_number), None
+
+
+class PartMetadata():
+    # minio.helpers.PartMetadata of minio 2.x
+    def __init__(self, data, md5hex, sha256hex, size):
+        self.data = data
+        self.size = size
+
+
+class TestMultipartUpload():
+
+    def test_01_part_api(self):
+        self.assertIsInstance(get_part_api(FakeMinio2(), "2.2.4"), Minio2PartApi)
+        self.assertIsInstance(get_part_api(FakeMinio6(), "4.0.0"), Minio6PartApi)
+        self.assertIsInstance(get_part_api(FakeMinio6(), "6.0.2"), Minio6PartApi)
+        self.assertIsNone(get_part_api(FakeMinio6(), "7.0.0"))
+
+    def upload(self, client, part_api, object_name, content):
+        upload = MultipartUpload(client, "bucket", object_name, MIN_PART_SIZE, 2)
+        upload.part_api = part_api
+        with upload:
+            for start in range(0, len(content), 1024 * 1024):
+                upload.write(content[start:start + 1024 * 1024])
+        return upload
+
+    def test_02_minio_apis(self):
+        content = os.urandom(3 * MIN_PART_SIZE + 1024)
+        helpers = types.ModuleType("minio.helpers")
+        helpers.PartMetadata = PartMetadata
+        helpers_module = sys.modules.get("minio.helpers")
+        sys.modules["minio.helpers"] = helpers
+        try:
+            client = FakeMinio2()
+            self.upload(client, Minio2PartApi(client), "object", content)
+        finally:
+            sys.modules["minio.helpers"] = helpers_module
+        self.assertEqual(len(client.parts), 4)
+        self.assertEqual(client.objects["object"], content)
+
+        client = FakeMinio6()
+        self.upload(client, Minio6PartApi(client), "object", content)
+        self.assertEqual(len(client.parts), 4)
+        self.assertEqual(client.objects["object"], content)
+
+        # a failed part aborts the upload
+        with self.assertRaises(IOError):
+            self.upload(client, Minio6PartApi(client), "failing", content)
+        self.assertNotIn("failing", client.objects)
+        self.assertEqual(client.aborted, ["upload-failing"])
+
+    def test_03_put_object_fallback(self):
+        # minio releases without a pinned part api upload the object with the public put_object
+        content = os.urandom(2 * MIN_PART_SIZE + 1024)
+        client = FakeMinio6()
+        upload = self.upload(client, None, "object", content)
+        self.assertEqual(client.parts, {})
+        self.assertIsNone(upload.upload_id)
+        self.assertEqual(client.objects["object"], content)
@@ -0,0 +1,82 @@
+# Copyright (c) 2018, MD2K Center of Excellence
+# - Nasir Ali <nasir.ali08@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from datetime import timedelta
+
+from dateutil import parser
+
+from cerebralcortex.core.data_manager.raw.stream_day_manifest import StreamDayManifest
+from cerebralcortex.core.datatypes.datapoint import DataPoint
+
+
+class TestStreamDayManifest():
+
+    def test_01_stream_day_manifest(self):
+        class Store():
+            def __init__(self):
+                self.entries = {}
+                self.queries = 0
+
+            def save_stream_day(self, owner_id, stream_id, day, file_name, row_count, size, start_time, end_time,
+                                codec, replace=False):
+                self.entries[day] = {"day": day, "row_count": row_count, "start_time": start_time}
+
+            def get_stream_day_manifest(self, stream_id):
+                self.queries += 1
+                return [self.entries[day] for day in sorted(self.entries)]
+
+        start_time = parser.parse("2018-02-21 00:00:00")
+        data = [DataPoint(start_time + timedelta(minutes=i), None, 0, i) for i in range(3)]
+
+        # a manifest that is only recorded does not skip any day
+        store = Store()
+        manifest = StreamDayManifest(store, trusted=False)
+        manifest.record("owner", "stream", "20180221", "20180221.gz", data, 100, "gzip")
+        self.assertEqual(store.entries["20180221"]["row_count"], 3)
+        self.assertTrue(manifest.has_day("stream", "20180222"))
+        self.assertEqual(store.queries, 0)
+        self.assertFalse(StreamDayManifest(None, trusted=True).trusted)
+
+        # days of a stream are loaded once per refresh interval, written days are added
+        manifest = StreamDayManifest(store, trusted=True, refresh_interval=3600)
+        self.assertEqual(manifest.get_days("stream"), ["20180221"])
+        self.assertTrue(manifest.has_day("stream", "20180221"))
+        self.assertFalse(manifest.has_day("stream", "20180222"))
+        manifest.record("owner", "stream", "20180222", "20180222.gz", data, 100, "gzip")
+        self.assertTrue(manifest.has_day("stream", "20180222"))
+        self.assertEqual(store.queries, 1)
+        manifest.refresh_interval = 0
+        self.assertFalse(manifest.has_day("stream", "20180223"))
+        self.assertEqual(store.queries, 2)
+
+        # a day whose entry cannot be saved is an error and is probed by the readers of this process
+        save_stream_day = store.save_stream_day
+        store.save_stream_day = None
+        with self.assertRaises(TypeError):
+            manifest.record("owner", "stream", "20180224", "20180224.gz", data, 100, "gzip")
+        self.assertTrue(manifest.has_day("stream", "20180224"))
+        store.save_stream_day = save_stream_day
+        manifest.record("owner", "stream", "20180224", "20180224.gz", data, 100, "gzip")
+        self.assertEqual(manifest.missing_days, set())
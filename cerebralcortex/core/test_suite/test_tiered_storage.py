@@ -0,0 +1,101 @@
+# Copyright (c) 2018, MD2K Center of Excellence
+# - Nasir Ali <nasir.ali08@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from cerebralcortex.core.data_manager.raw.storage_tiered import TieredStorage
+from cerebralcortex.core.data_manager.raw.stream_handler import StreamHandler
+from cerebralcortex.core.datatypes.datapoint import DataPoint
+
+
+class TestTieredStorage():
+
+    def test_01_tiered_storage(self):
+        class Tier():
+            def __init__(self, days):
+                self.days = days
+                self.written = []
+
+            def get_day_files(self, owner_id, stream_id, day, connection=None):
+                return [day + ".gz"] if day in self.days else []
+
+            def write_file(self, owner_id, stream_id, data):
+                self.written.extend(data)
+                return True
+
+            def read_file(self, owner_id, stream_id, day, start_time, end_time, localtime, columnar):
+                return self.read_day_file(owner_id, stream_id, day)
+
+            def read_day_file(self, owner_id, stream_id, day, filenames=None):
+                return [dp for dp in self.written if dp.start_time.strftime("%Y%m%d") == day]
+
+            @contextmanager
+            def connect(self, write=False):
+                yield None
+
+            def rewrite_day_file(self, owner_id, stream_id, day, data, connection, newer=True):
+                blocks = [data, self.read_day_file(owner_id, stream_id, day)]
+                self.written = StreamHandler().merge_day_blocks(blocks if newer else blocks[::-1])
+                return True
+
+            def get_stream_dir(self, owner_id, stream_id):
+                return ""
+
+            def remove_files(self, filenames, dirname, connection):
+                self.days = []
+                self.written = []
+
+        class DayCache():
+            def invalidate(self, owner_id, stream_id, day):
+                pass
+
+        class RawData(StreamHandler):
+            day_cache = DayCache()
+
+        today = datetime.utcnow()
+        old_day = (today - timedelta(days=40)).strftime("%Y%m%d")
+        hot = Tier([old_day])
+        cold = Tier([])
+        tiered = TieredStorage(RawData(), hot, cold, 30)
+
+        # recent days are only read from the hot tier, old days from the cold tier until demoted
+        self.assertEqual(tiered.get_tiers("owner", "stream", today.strftime("%Y%m%d")), [hot])
+        self.assertEqual(tiered.get_tiers("owner", "stream", old_day), [cold, hot])
+        self.assertEqual(tiered.get_tiers("owner", "stream", (today - timedelta(days=41)).strftime("%Y%m%d")), [cold])
+
+        data = [DataPoint(today - timedelta(days=days), None, 0, days) for days in [0, 1, 40]]
+        self.assertTrue(tiered.write_file("owner", "stream", data))
+        self.assertEqual([dp.sample for dp in hot.written], [0, 1])
+        self.assertEqual([dp.sample for dp in cold.written], [40])
+
+        # DataPoints written to the cold tier after the day left the hot tier are newer than the hot DataPoints
+        hot.written = [DataPoint(data[2].start_time, None, 0, "hot"),
+                       DataPoint(data[2].start_time + timedelta(seconds=1), None, 0, "hot")]
+        self.assertEqual([dp.sample for dp in tiered.read_file("owner", "stream", old_day, localtime=False)],
+                         [40, "hot"])
+        self.assertTrue(tiered.demote_day_file("owner", "stream", old_day))
+        self.assertEqual([dp.sample for dp in cold.written], [40, "hot"])
+        self.assertEqual(tiered.get_tiers("owner", "stream", old_day), [cold])
@@ -0,0 +1,68 @@
+# Copyright (c) 2018, MD2K Center of Excellence
+# - Nasir Ali <nasir.ali08@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from datetime import timedelta
+
+from dateutil import parser
+
+from cerebralcortex.core.data_manager.raw.write_buffer import WriteBuffer
+from cerebralcortex.core.datatypes.datapoint import DataPoint
+
+
+class TestWriteBuffer():
+
+    def test_01_write_buffer(self):
+        buffer = WriteBuffer(max_size=30, max_age=3600)
+        start_time = parser.parse("2018-02-21 23:59:58+00:00")
+        data = [DataPoint(start_time + timedelta(seconds=i), None, 0, i) for i in range(4)]
+
+        # calls are accumulated per stream-day until a day holds max_size DataPoints
+        self.assertEqual(buffer.add("owner", "stream", ("name",), data, data[0].start_time, data[-1].start_time), [])
+        self.assertEqual(sorted(buffer.streams["stream"].days), ["20180221", "20180222"])
+        late = [DataPoint(start_time, None, 0, "late")]
+        self.assertEqual(buffer.add("owner", "stream", ("name",), late, late[0].start_time, late[0].start_time), [])
+        buffered = buffer.pop("stream")[0]
+        self.assertEqual([dp.sample for block in buffered.get_blocks() for dp in block], ["late", 0, 1, 2, 3])
+        self.assertEqual((buffered.start_time, buffered.end_time), (data[0].start_time, data[-1].start_time))
+
+        many = [DataPoint(start_time - timedelta(seconds=i), None, 0, i) for i in range(30, 0, -1)]
+        self.assertEqual(len(buffer.add("owner", "stream", ("name",), many, many[0].start_time, many[-1].start_time)), 1)
+
+        # changed metadata flushes the calls buffered with the previous metadata
+        buffer.add("owner", "stream", ("name",), data, data[0].start_time, data[-1].start_time)
+        ready = buffer.add("owner", "stream", ("renamed",), data, data[0].start_time, data[-1].start_time)
+        self.assertEqual([buffered.metadata for buffered in ready], [("name",)])
+        self.assertEqual(len(buffer), 1)
+
+        # a stream whose write failed is returned to the buffer, its DataPoints are older than the calls buffered since
+        failed = buffer.pop("stream")[0]
+        buffer.add("owner", "stream", ("renamed",), late, late[0].start_time, late[0].start_time)
+        buffer.restore(failed)
+        buffered = buffer.streams["stream"]
+        self.assertEqual([dp.sample for block in buffered.get_blocks() for dp in block], ["late", 0, 1, 2, 3])
+        self.assertEqual(buffered.metadata, ("renamed",))
+        self.assertEqual(buffered.created, failed.created)
+        buffer.max_age = 0
+        self.assertEqual(buffer.pop_expired(), [buffered])
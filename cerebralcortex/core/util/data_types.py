@@ -25,6 +25,8 @@
 
 import json
 import pickle
+from typing import Callable, Iterable
+
 from cerebralcortex.core.datatypes.datapoint import DataPoint
 
 
@@ -113,11 +115,31 @@ def convert_sample(sample, stream_name):
         return sample
 
 
-def serialize_obj(datapoints:DataPoint):
+def serialize_obj(datapoints:DataPoint, buffer_callback: Callable = None):
+    """
+    Pickle DataPoints or any other object
+    :param datapoints:
+    :param buffer_callback: receives the memory of NumPy arrays (e.g., columns of DataColumns) as out-of-band
+    pickle.PickleBuffer objects (pickle protocol 5), arrays are not copied into the pickle. Arrays are pickled in-band
+    if the python version does not support protocol 5
+    :return: pickle
+    :rtype: bytes
+    """
+    if buffer_callback is not None and pickle.HIGHEST_PROTOCOL >= 5:
+        return pickle.dumps(datapoints, protocol=5, buffer_callback=buffer_callback)
     res = pickle.dumps(datapoints)
     return res
 
 
-def deserialize_obj(picked_obj):
+def deserialize_obj(picked_obj, buffers: Iterable = None):
+    """
+    Unpickle DataPoints or any other object
+    :param picked_obj: pickle, bytes-like object
+    :param buffers: out-of-band buffers in the order they were passed to buffer_callback of serialize_obj. NumPy arrays
+    are created on these buffers without copying them, e.g., on memoryviews of a memory mapped file
+    :return: unpickled object
+    """
+    if buffers is not None and pickle.HIGHEST_PROTOCOL >= 5:
+        return pickle.loads(picked_obj, buffers=buffers)
     res = pickle.loads(picked_obj)
     return res
\ No newline at end of file
@@ -1,33 +1,172 @@
 import datetime as dt
+from typing import List
+
+import numpy
 import pytz
 
+# local time of a DataPoint: timezone of the first DataPoint's offset (DST aware), or UTC time + offset of each DataPoint
+TIMEZONE_CONVERSION = "timezone"
+OFFSET_CONVERSION = "offset"
+
+
+# standard offset (seconds) -> name of the first timezone with that offset, built once per timezone collection
+TIMEZONE_NAMES = {}
+
+# offset (milliseconds) -> tzinfo object
+TIMEZONE_INFOS = {}
+
+# timezone name -> (UTC transition times in microseconds, UTC offset in microseconds after each transition)
+TIMEZONE_TRANSITIONS = {}
+
+
+def get_timezone_names(common_only: bool = False) -> dict:
+    """
+    Returns a table of standard (non-DST) offsets in seconds and the first timezone name of a collection with that
+    offset. The table is built on first use, scanning all timezones of the collection once
+    :param common_only:
+    :return: dict of offset -> timezone name
+    :rtype: dict
+    """
+    if common_only not in TIMEZONE_NAMES:
+        null_delta = dt.timedelta(0, 0)
+        names = {}
+        for tz_name in (pytz.common_timezones if common_only else pytz.all_timezones):
+            tz = pytz.timezone(tz_name)
+            non_dst_offset = getattr(tz, '_transition_info', [[null_delta]])[-1]
+            names.setdefault(int(non_dst_offset[0].total_seconds()), tz_name)
+        TIMEZONE_NAMES[common_only] = names
+    return TIMEZONE_NAMES[common_only]
+
 
 def get_timezone(tz_offset:float, common_only:bool=False):
     """
     Returns a timezone for a given offset in milliseconds
     :param tz_offset: milliseconds
     :param common_only:
-    :return:
+    :return: timezone name, empty string if no timezone has this offset
     """
     if tz_offset is None or tz_offset=="":
         raise ValueError("Offset cannot be None or empty.")
 
-    # pick one of the timezone collections
-    timezones = pytz.common_timezones if common_only else pytz.all_timezones
-
-    # convert the milliseconds offset to a timedelta
-    offset_days, offset_seconds = 0, int(tz_offset/1000)
-    if offset_seconds < 0:
-        offset_days = -1
-        offset_seconds += 24 * 3600
-    desired_delta = dt.timedelta(offset_days, offset_seconds)
-
-    # Loop through the timezones and find any with matching offsets
-    null_delta = dt.timedelta(0, 0)
-    results = ""
-    for tz_name in timezones:
-        tz = pytz.timezone(tz_name)
-        non_dst_offset = getattr(tz, '_transition_info', [[null_delta]])[-1]
-        if desired_delta == non_dst_offset[0]:
-            return tz_name
-    return results
\ No newline at end of file
+    return get_timezone_names(common_only).get(int(tz_offset/1000), "")
+
+
+def get_timezone_info(tz_offset: float) -> dt.tzinfo:
+    """
+    Returns a (cached) tzinfo object for a given offset in milliseconds. Falls back to a fixed offset timezone if no
+    named timezone has this offset
+    :param tz_offset: milliseconds
+    :return: tzinfo
+    :rtype: datetime.tzinfo
+    """
+    if tz_offset is None or tz_offset == "":
+        raise ValueError("Offset cannot be None or empty.")
+
+    tz_offset = int(tz_offset)
+    if tz_offset not in TIMEZONE_INFOS:
+        tz_name = get_timezone(tz_offset)
+        if tz_name:
+            TIMEZONE_INFOS[tz_offset] = pytz.timezone(tz_name)
+        else:
+            TIMEZONE_INFOS[tz_offset] = pytz.FixedOffset(tz_offset // 60000)
+    return TIMEZONE_INFOS[tz_offset]
+
+EPOCH = dt.datetime(1970, 1, 1)
+EPOCH_UTC = EPOCH.replace(tzinfo=pytz.utc)
+
+
+def datetime_to_epoch_us(value: dt.datetime) -> int:
+    """
+    Returns microseconds since epoch for a datetime. Naive datetimes are treated as UTC
+    :param value:
+    :return: microseconds since epoch
+    :rtype: int
+    """
+    if value.tzinfo is None:
+        delta = value - EPOCH
+    else:
+        delta = value - EPOCH_UTC
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def get_utc_offsets(times: numpy.ndarray, offsets: numpy.ndarray, conversion: str = TIMEZONE_CONVERSION) -> tuple:
+    """
+    Returns the UTC offset of each UTC time and the tzinfo objects of the local times, without creating datetimes.
+    With timezone conversion the offsets follow the DST rules of the timezone of the first offset, with offset
+    conversion they are the offsets stored with the DataPoints
+    :param times: datetime64[us] array of UTC times, NaT allowed
+    :param offsets: array of offsets in milliseconds
+    :param conversion: timezone or offset
+    :return: (timedelta64[us] array of UTC offsets, list of tzinfo, index in tzinfo list of each time)
+    :rtype: tuple
+    """
+    offsets = numpy.asarray(offsets, dtype=numpy.int64)
+    if len(times) == 0:
+        return numpy.zeros(0, dtype="timedelta64[us]"), [], numpy.zeros(0, dtype=numpy.int64)
+    if conversion == OFFSET_CONVERSION:
+        unique_offsets, codes = numpy.unique(offsets, return_inverse=True)
+        tzinfos = [pytz.FixedOffset(int(offset) // 60000) for offset in unique_offsets]
+        return (offsets * 1000).astype("timedelta64[us]"), tzinfos, codes
+
+    tz = get_timezone_info(offsets[0])
+    if not getattr(tz, "_utc_transition_times", None):
+        # timezones without DST rules have one offset
+        return numpy.full(len(times), tz.utcoffset(None) // dt.timedelta(microseconds=1)).astype(
+            "timedelta64[us]"), [tz], numpy.zeros(len(times), dtype=numpy.int64)
+
+    if tz.zone not in TIMEZONE_TRANSITIONS:
+        TIMEZONE_TRANSITIONS[tz.zone] = (
+            numpy.array(tz._utc_transition_times, dtype="datetime64[us]").astype(numpy.int64),
+            numpy.array([info[0] // dt.timedelta(microseconds=1) for info in tz._transition_info], dtype=numpy.int64))
+    transition_times, transition_offsets = TIMEZONE_TRANSITIONS[tz.zone]
+
+    # same lookup as pytz's fromutc: last transition at or before each time
+    transitions = numpy.maximum(numpy.searchsorted(transition_times, times.astype(numpy.int64), side="right") - 1, 0)
+    unique_transitions, codes = numpy.unique(transitions, return_inverse=True)
+    tzinfos = [tz._tzinfos[tz._transition_info[transition]] for transition in unique_transitions]
+    return transition_offsets[transitions].astype("timedelta64[us]"), tzinfos, codes
+
+
+def to_local_datetimes(times: numpy.ndarray, offsets: numpy.ndarray, conversion: str = TIMEZONE_CONVERSION) -> List:
+    """
+    Convert UTC times to timezone aware local datetimes. Local times are computed in one array operation, only the
+    final datetimes are created one by one
+    :param times: datetime64[us] array of UTC times, NaT becomes None
+    :param offsets: array of offsets in milliseconds
+    :param conversion: timezone or offset
+    :return: list of datetimes
+    :rtype: List[datetime]
+    """
+    utc_offsets, tzinfos, codes = get_utc_offsets(times, offsets, conversion)
+    local_times = (times + utc_offsets).astype(object).tolist()
+    if len(tzinfos) == 1:
+        tz = tzinfos[0]
+        return [None if local_time is None else local_time.replace(tzinfo=tz) for local_time in local_times]
+    return [None if local_time is None else local_time.replace(tzinfo=tzinfos[code]) for local_time, code in
+            zip(local_times, codes.tolist())]
+
+
+def to_utc_times(times: List[dt.datetime], offsets: List, conversion: str = TIMEZONE_CONVERSION) -> numpy.ndarray:
+    """
+    Convert local datetimes to UTC times. Timezone aware datetimes use their own UTC offset, naive datetimes the
+    offset stored with the DataPoint (offset conversion) or the system timezone (timezone conversion)
+    :param times: list of datetimes, None allowed
+    :param offsets: list of offsets in milliseconds
+    :param conversion: timezone or offset
+    :return: datetime64[us] array of UTC times, NaT for None
+    :rtype: numpy.ndarray
+    """
+    one_us = dt.timedelta(microseconds=1)
+    utc_offsets = []
+    for time, offset in zip(times, offsets):
+        if time is None:
+            utc_offsets.append(0)
+        elif time.tzinfo is not None:
+            utc_offsets.append(time.utcoffset() // one_us)
+        elif conversion == OFFSET_CONVERSION:
+            utc_offsets.append(int(offset) * 1000)
+        else:
+            utc_offsets.append(round((time - dt.datetime.utcfromtimestamp(time.timestamp())) / one_us))
+    wall_times = numpy.array([None if time is None else time.replace(tzinfo=None) for time in times],
+                             dtype="datetime64[us]")
+    return wall_times - numpy.array(utc_offsets, dtype=numpy.int64).astype("timedelta64[us]")
@@ -59,7 +59,9 @@ setup(
 
     entry_points={
         'console_scripts': [
-            'main=main:main'
+            'main=main:main',
+            'cc_compaction=cerebralcortex.core.data_manager.raw.compaction:main',
+            'cc_demotion=cerebralcortex.core.data_manager.raw.demotion:main'
         ]
     },
 